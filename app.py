@@ -1,12 +1,12 @@
 import os
+from itertools import chain
 import streamlit as st
-from textblob import TextBlob
-from utils.rag_pipeline import RAGIndex, Generator, RAGPipeline, ingest_json_files
-from utils.preprocess import preprocess_text
+from utils.rag_pipeline import RAGIndex, Generator, RAGPipeline, stream_json_files
+from utils.preprocess import preprocess_text, spell_stats
 from utils.memory import init_memory, init_database, save_interaction, get_relevant_context
 from utils.log_utils import log_query
-from utils.greetings import is_greeting, greeting_responses, is_social_trigger, social_response
-from utils.course_query import extract_course_query
+from utils.intent import intent_router
+from utils.course_query import CourseCatalog, answer_from_catalog
 from utils.tone import dynamic_prefix, dynamic_not_found
 from utils.rewrite import rewrite_followup
 
@@ -15,6 +15,7 @@ st.set_page_config(page_title="CrescentBot RAG", layout="wide")
 
 INDEX_DIR = "RAG-MODEL/index"
 DATA_DIR = "RAG-MODEL/data"
+EMBED_CACHE_DIR = "RAG-MODEL/embed_cache"
 
 # Initialize memory and database
 init_memory()
@@ -23,15 +24,15 @@ init_database()
 # Load or build RAG index
 @st.cache_resource(show_spinner=True)
 def load_pipeline():
-    idx = RAGIndex()
+    idx = RAGIndex(cache_dir=EMBED_CACHE_DIR)
     if not os.path.exists(INDEX_DIR):
         st.info("Building FAISS index from JSON knowledge base... this may take a while.")
-        docs = ingest_json_files(DATA_DIR)
-        if not docs:
+        # records are parsed, embedded and indexed in batches, never all held at once
+        count = idx.build(stream_json_files(DATA_DIR))
+        if not count:
             st.error(f"No documents found in {DATA_DIR}. Please ensure course_data.json and crescent_qa.json exist and contain valid data.")
         else:
-            st.write(f"Loaded {len(docs)} documents from {DATA_DIR}")
-        idx.build(docs)
+            st.write(f"Loaded {count} documents from {DATA_DIR}")
         idx.save(INDEX_DIR)
     else:
         idx.load(INDEX_DIR)
@@ -39,12 +40,16 @@ def load_pipeline():
     pipeline = RAGPipeline(idx, gen)
     return pipeline
 
-pipeline = load_pipeline()
+@st.cache_resource
+def load_catalog():
+    path = os.path.join(DATA_DIR, "course_data.json")
+    return CourseCatalog.load(path) if os.path.exists(path) else None
 
 st.title("🌙 CrescentBot (Fully RAG-enabled with Emotion Detection)")
 
 # Function for emotion detection
 def detect_emotion(query):
+    from textblob import TextBlob  # slow to import; load it with the first query, not the page
     blob = TextBlob(query)
     polarity = blob.sentiment.polarity
     if polarity > 0.1:
@@ -53,10 +58,6 @@ def detect_emotion(query):
         return "negative"
     return "neutral"
 
-# Display warning if no documents were indexed
-if not pipeline.index.metadata:
-    st.warning("No documents were indexed. Please ensure course_data.json and crescent_qa.json are in RAG-MODEL/data/ and contain valid data.")
-
 # Display chat history
 for msg in st.session_state["messages"]:
     with st.chat_message(msg["role"]):
@@ -67,65 +68,93 @@ if query := st.chat_input("Ask me anything about Crescent courses..."):
     with st.chat_message("user"):
         st.markdown(query)
 
+    rag_out = {"retrieved": [], "stream": None}
+    query_info = None
     with st.spinner("Thinking..."):
-        # Detect emotion
-        sentiment = detect_emotion(query)
-
-        # Handle greetings and social triggers (rule-based)
-        if is_greeting(query):
-            response = greeting_responses()
-        elif is_social_trigger(query):
-            response = social_response(query)
+        # Greetings and social triggers are answered by rule, in one pass over the message
+        route = intent_router.route(query)
+        if route["intent"] in ("greeting", "social"):
+            response = intent_router.reply(route)
         else:
+            # Detect emotion
+            sentiment = detect_emotion(query)
             # Preprocess query
             processed_query = preprocess_text(query, debug=True)
             # Rewrite query with short-term memory context
             processed_query = rewrite_followup(processed_query, st.session_state["last_query_info"])
             # Extract course-specific query info
-            query_info = extract_course_query(processed_query)
+            query_info = intent_router.course_slots(processed_query)
             # Add keywords and sentiment to query_info
             query_info["keywords"] = processed_query.split()[:5]  # Top 5 keywords
             query_info["sentiment"] = sentiment
             st.session_state["last_query_info"] = query_info
 
-            # Enhance query with short-term and long-term context
-            context = get_relevant_context(limit=3)
-            if context:
-                if context["departments"]:
-                    processed_query += f" related to {', '.join(context['departments'])}"
-                if context["keywords"]:
-                    processed_query += f" including keywords {', '.join(context['keywords'][:3])}"
-
-            # Add course-specific context
-            if query_info["department"]:
-                processed_query += f" in {query_info['department']} department"
-            if query_info["level"]:
-                processed_query += f" for {query_info['level']} level"
-            if query_info["semester"]:
-                processed_query += f" in {query_info['semester']} semester"
-
-            # Use RAG pipeline for retrieval and generation
-            rag_out = pipeline.answer(processed_query)
-            max_score = max([score for _, score in rag_out["retrieved"]], default=0.0)
-            if rag_out["answer"] and rag_out["retrieved"] and max_score >= 0.6:
-                prefix = dynamic_prefix()
-                if sentiment == "negative":
-                    prefix = "I'm sorry you're feeling that way—let's see if this helps: 😊 "
-                elif sentiment == "positive":
-                    prefix = "I'm glad you're feeling good! Here's what I found: 🌟 "
-                response = f"{prefix}{rag_out['answer']}"
-                log_query(query, max_score)
+            # Course listings and unit questions are answered from the catalog index
+            catalog = load_catalog()
+            catalog_answer = answer_from_catalog(catalog, query, query_info) if catalog else None
+            if catalog_answer:
+                response = catalog_answer
+                log_query(query, 1.0)
             else:
-                response = dynamic_not_found()
-                log_query(query, 0.0)
-
-            # Save interaction to long-term memory
-            save_interaction(query, response, query_info, sentiment)
+                # Enhance query with short-term and long-term context
+                context = get_relevant_context(limit=3, user_id=st.session_state["user_id"])
+                if context:
+                    if context["departments"]:
+                        processed_query += f" related to {', '.join(context['departments'])}"
+                    if context["keywords"]:
+                        processed_query += f" including keywords {', '.join(context['keywords'][:3])}"
+
+                # Add course-specific context
+                if query_info["department"]:
+                    processed_query += f" in {query_info['department']} department"
+                if query_info["level"]:
+                    processed_query += f" for {query_info['level']} level"
+                if query_info["semester"]:
+                    processed_query += f" in {query_info['semester']} semester"
+
+                # Retrieve now; the generated answer is streamed into the chat below
+                pipeline = load_pipeline()
+                # search only the passages of the slots named in this message (global when none)
+                rag_out = pipeline.answer_stream(processed_query, filters=query_info)
+                max_score = max([score for _, score in rag_out["retrieved"]], default=0.0)
+                if rag_out["retrieved"] and max_score >= 0.6:
+                    prefix = dynamic_prefix()
+                    if sentiment == "negative":
+                        prefix = "I'm sorry you're feeling that way—let's see if this helps: 😊 "
+                    elif sentiment == "positive":
+                        prefix = "I'm glad you're feeling good! Here's what I found: 🌟 "
+                    log_query(query, max_score)
+                else:
+                    rag_out["stream"] = None
+                    response = dynamic_not_found()
+                    log_query(query, 0.0)
 
-    st.session_state["messages"].append({"role": "assistant", "content": response})
     with st.chat_message("assistant"):
-        st.markdown(response)
+        if rag_out["stream"] is not None:
+            response = st.write_stream(chain([prefix], rag_out["stream"]))
+            if response.strip() == prefix.strip():  # model produced nothing
+                response = dynamic_not_found()
+                st.markdown(response)
+        else:
+            st.markdown(response)
         if rag_out["retrieved"]:
             with st.expander("Show supporting passages"):
                 for md, score in rag_out["retrieved"]:
                     st.markdown(f"**{md['source']}** — {md['id']} (score={score:.3f})\n\n{md['text']}")
+
+    st.session_state["messages"].append({"role": "assistant", "content": response})
+    if query_info is not None:
+        # Save interaction to long-term memory
+        save_interaction(query, response, query_info, sentiment, user_id=st.session_state["user_id"])
+
+# Models and index load once the page and chat history are on screen, so the
+# first paint does not wait for them; cached, so later reruns return immediately
+pipeline = load_pipeline()
+
+with st.sidebar.expander("⚙️ Pipeline metrics"):
+    st.json(pipeline.metrics())
+    st.json({"spell_correction": spell_stats()})
+
+# Display warning if no documents were indexed
+if not pipeline.index.metadata:
+    st.warning("No documents were indexed. Please ensure course_data.json and crescent_qa.json are in RAG-MODEL/data/ and contain valid data.")
@@ -1,10 +1,12 @@
 import os
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from openai import OpenAI
-from .models import ChatRequest, ChatResponse, Source, UpsertDoc
-from .rag import retrieve, build_index, DATA_DIR
+from .models import ChatRequest, ChatResponse, Source, UpsertDoc, DeleteDoc
+from .rag import retrieve, build_index, upsert_document, delete_document, encode_batcher, query_cache, DATA_DIR
 from .utils import detect_sentiment, append_session, convo_summary
 from .prompts import SYSTEM_PROMPT, ANSWER_TEMPLATE
 import orjson
@@ -29,10 +31,102 @@ app.add_middleware(
 def health():
     return {"status": "ok"}
 
+@app.get("/metrics")
+def metrics():
+    return {"encode_batcher": encode_batcher.stats(), "query_cache": query_cache.stats()}
+
 @app.post("/reindex")
 def reindex():
-    build_index()
-    return {"status": "reindexed"}
+    return {"status": "reindexed", **build_index()}
+
+@app.post("/upsert")
+def upsert(doc: UpsertDoc):
+    try:
+        result = upsert_document(doc.text, title=doc.title, meta=doc.meta, doc_id=doc.doc_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "upserted", **result}
+
+@app.post("/delete")
+def delete(doc: DeleteDoc):
+    try:
+        removed = delete_document(doc.doc_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not removed:
+        raise HTTPException(status_code=404, detail=f"No document with doc_id {doc.doc_id!r}")
+    return {"status": "deleted", "doc_id": doc.doc_id, "removed": removed}
+
+def _messages(req: ChatRequest, hits: list) -> list:
+    context = "\n\n".join(f"[{h['id']}] {h['title']}\n{h['text']}" for h in hits)
+    prompt = ANSWER_TEMPLATE.format(context=context or "(no matching sources)", question=req.message)
+    history = convo_summary(req.user_id)
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "system", "content": f"Conversation so far:\n{history}"},
+        {"role": "user", "content": prompt},
+    ]
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat(req: C
+async def chat(req: ChatRequest):
+    sentiment = detect_sentiment(req.message)
+    append_session(req.user_id, "user", req.message)
+
+    # run blocking work off the event loop so concurrent requests can share encode batches
+    hits = await run_in_threadpool(retrieve, req.message, req.top_k)
+    sources = [Source(id=h["id"], title=h["title"], snippet=h["snippet"], meta=h["meta"]) for h in hits]
+
+    completion = await run_in_threadpool(
+        client.chat.completions.create,
+        model=MODEL_NAME,
+        messages=_messages(req, hits),
+        temperature=0.2,
+    )
+    reply = completion.choices[0].message.content.strip()
+    memory_len = append_session(req.user_id, "assistant", reply)
+
+    return ChatResponse(
+        reply=reply,
+        sources=sources,
+        from_rag=bool(hits),
+        sentiment=sentiment,
+        memory_len=memory_len,
+    )
+
+def _sse(event: str, data) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+@app.post("/chat/stream")
+def chat_stream(req: ChatRequest):
+    """Server-Sent Events: one `sources` event, then `token` events, then `done`."""
+    sentiment = detect_sentiment(req.message)
+    append_session(req.user_id, "user", req.message)
+    hits = retrieve(req.message, top_k=req.top_k)
+
+    def events():
+        yield _sse("sources", {
+            "sources": [Source(id=h["id"], title=h["title"], snippet=h["snippet"], meta=h["meta"]).model_dump()
+                        for h in hits],
+            "from_rag": bool(hits),
+            "sentiment": sentiment,
+        })
+        pieces = []
+        try:
+            stream = client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=_messages(req, hits),
+                temperature=0.2,
+                stream=True,
+            )
+            for chunk in stream:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    pieces.append(text)
+                    yield _sse("token", {"text": text})
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+        memory_len = append_session(req.user_id, "assistant", "".join(pieces).strip())
+        yield _sse("done", {"memory_len": memory_len})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -23,3 +23,7 @@ class UpsertDoc(BaseModel):
     text: str
     title: str = "Manual Entry"
     meta: Optional[dict] = None
+    doc_id: Optional[str] = None
+
+class DeleteDoc(BaseModel):
+    doc_id: str
@@ -1,29 +1,52 @@
-import os, json, pathlib, re
-from typing import List, Tuple, Dict
+import base64, hashlib, json, os, pathlib, re, threading, uuid
+from typing import List, Tuple, Dict, Iterator, Optional
 import numpy as np
-import faiss
-from sentence_transformers import SentenceTransformer, util
-from pypdf import PdfReader
+
+from utils.embed_cache import EmbeddingCache
+from utils.embedding import load_embedder, embedder_id
+from utils.index_factory import (IndexWriter, set_search_params, supports_removal,
+                                 read_faiss_index, write_faiss_index)
+from utils.query_cache import QueryEmbeddingCache
+from utils.batching import MicroBatcher
+from utils.passage_store import PassageOverlay, PassageStore, write_passage_store
+from utils.bm25 import LEXICAL_COVERAGE, BM25Index, fuse, retrieval_mode
+from utils.dedup import Deduplicator, format_report
+from utils.records import batched, iter_records
 
 DATA_DIR = pathlib.Path("data")
 INDEX_PATH = DATA_DIR / "index.faiss"
-META_PATH = DATA_DIR / "meta.json"
+STORE_DIR = DATA_DIR / "passages"
+BM25_DIR = DATA_DIR / "bm25"
+UPDATE_LOG = DATA_DIR / "updates.jsonl"  # upserts/deletes since the three above were written
+UPSERTS_DIR = DATA_DIR / "upserts"  # documents sent to /upsert (or /delete), re-read by build_index
 MODEL_CACHE = DATA_DIR / "model_cache"
+EMBED_CACHE_DIR = pathlib.Path(os.getenv("EMBED_CACHE_DIR", str(DATA_DIR / "embed_cache")))
 
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDER_ID = embedder_id(EMBEDDING_MODEL)  # model + EMBEDDING_BACKEND, keys the caches
 SIM_THRESHOLD = float(os.getenv("SIM_THRESHOLD", 0.45))
 TOP_K_DEFAULT = int(os.getenv("TOP_K", 3))
+RETRIEVAL_MODE = retrieval_mode()  # dense | hybrid | auto, see utils.bm25
+# chunks added/removed through UPDATE_LOG before the index, passage store and BM25 are rewritten whole
+UPDATE_LOG_ROWS = int(os.getenv("UPDATE_LOG_ROWS", 1000))
 
 _model = None
 _index = None
-_meta: List[Dict] = []
+_index_mapped = False  # memory-mapped indexes are read-only until reloaded onto the heap
+_meta: Optional[PassageOverlay] = None  # memory-mapped chunks + live updates, looked up by stable FAISS id
+_bm25: Optional[BM25Index] = None  # lexical index over the same chunks and ids
+_log_rows = 0  # chunks added/removed in UPDATE_LOG
+_write_lock = threading.Lock()
+query_cache = QueryEmbeddingCache()
+# single-query encodes from concurrent requests are merged into one model call
+encode_batcher = MicroBatcher(lambda qs: list(query_cache.encode(get_model(), qs, EMBEDDER_ID)), name="encode")
 
 # ---------- Loading & Helpers ----------
 
 def get_model():
     global _model
     if _model is None:
-        _model = SentenceTransformer(EMBEDDING_MODEL, cache_folder=str(MODEL_CACHE))
+        _model = load_embedder(EMBEDDING_MODEL, cache_folder=str(MODEL_CACHE))
     return _model
 
 
@@ -46,7 +69,7 @@ def _chunk_text(text: str, max_tokens: int = 400, overlap: int = 60) -> List[str
     for i, c in enumerate(chunks):
         prev_tail = chunks[i-1].split()[-overlap:] if i>0 else []
         out.append((" ".join(prev_tail) + " " + c).strip())
-    return out
+    return [c for c in out if c]  # blank input (or a blank PDF page) yields no chunks
 
 
 def _read_file(path: pathlib.Path) -> List[Tuple[str, Dict]]:
@@ -55,8 +78,9 @@ def _read_file(path: pathlib.Path) -> List[Tuple[str, Dict]]:
     if path.suffix.lower() in {".txt", ".md"}:
         text = path.read_text(encoding="utf-8", errors="ignore")
         for chunk in _chunk_text(text):
-            items.append((chunk, {"title": path.name, "source": str(path)}))
+            items.append((chunk, {"title": path.name, "source": str(path), "doc_id": str(path)}))
     elif path.suffix.lower() == ".pdf":
+        from pypdf import PdfReader
         reader = PdfReader(str(path))
         pages = []
         for i, p in enumerate(reader.pages):
@@ -66,82 +90,294 @@ def _read_file(path: pathlib.Path) -> List[Tuple[str, Dict]]:
                 pages.append("")
         for i, text in enumerate(pages):
             for chunk in _chunk_text(text):
-                items.append((chunk, {"title": f"{path.name} – p.{i+1}", "source": f"{path}#page={i+1}"}))
+                items.append((chunk, {"title": f"{path.name} – p.{i+1}", "source": f"{path}#page={i+1}",
+                                      "doc_id": str(path)}))
     elif path.name == "knowledge.json":
-        kb = json.loads(path.read_text(encoding="utf-8"))
-        for cat, data in kb.items():
+        for cat, data in iter_records(path):  # one top-level category at a time
             if isinstance(data, dict):
                 for key, val in data.items():
                     txt = f"[{cat} → {key}] {val}"
                     for chunk in _chunk_text(txt, max_tokens=120):
-                        items.append((chunk, {"title": f"KB:{cat}/{key}", "source": str(path)}))
+                        items.append((chunk, {"title": f"KB:{cat}/{key}", "source": str(path),
+                                              "doc_id": f"KB:{cat}/{key}"}))
             else:
                 for chunk in _chunk_text(str(data), max_tokens=120):
-                    items.append((chunk, {"title": f"KB:{cat}", "source": str(path)}))
+                    items.append((chunk, {"title": f"KB:{cat}", "source": str(path), "doc_id": f"KB:{cat}"}))
     return items
 
 
-def build_index() -> None:
-    global _index, _meta
-    model = get_model()
-    texts: List[str] = []
-    metas: List[Dict] = []
+def _manual_path(doc_id: str) -> pathlib.Path:
+    return UPSERTS_DIR / f"{hashlib.blake2b(doc_id.encode('utf-8'), digest_size=16).hexdigest()}.json"
+
+
+def _save_manual(doc: Dict) -> None:
+    """Keep an upserted document (``text`` None: a deleted one) so a rebuild reproduces the live index."""
+    UPSERTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = _manual_path(doc["doc_id"])
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(doc, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _manual_docs() -> Dict[str, Dict]:
+    if not UPSERTS_DIR.exists():
+        return {}
+    docs = (json.loads(p.read_text(encoding="utf-8")) for p in sorted(UPSERTS_DIR.glob("*.json")))
+    return {doc["doc_id"]: doc for doc in docs}
+
+
+def _manual_chunks(doc: Dict) -> List[Dict]:
+    return [{**(doc.get("meta") or {}), "doc_id": doc["doc_id"], "title": doc["title"], "source": "manual",
+             "text": chunk} for chunk in _chunk_text(doc["text"].strip(), max_tokens=120)]
+
+
+def _iter_chunks() -> Iterator[Dict]:
+    """Chunks of knowledge.json, data/docs/ and the upserted documents, read one file at a time."""
+    manual = _manual_docs()
+    for row in _iter_file_chunks():
+        if row["doc_id"] not in manual:  # replaced or deleted through the API since
+            yield row
+    for doc in manual.values():
+        if doc["text"] is not None:
+            yield from _manual_chunks(doc)
+
 
-    # gather inputs
+def _iter_file_chunks() -> Iterator[Dict]:
     if (DATA_DIR / "knowledge.json").exists():
         for chunk, meta in _read_file(DATA_DIR / "knowledge.json"):
-            texts.append(chunk); metas.append(meta)
+            yield {**meta, "text": chunk}
     docs_dir = DATA_DIR / "docs"
     docs_dir.mkdir(parents=True, exist_ok=True)
     for p in docs_dir.rglob("*"):
         if p.is_file() and p.suffix.lower() in {".txt", ".md", ".pdf"}:
             for chunk, meta in _read_file(p):
-                texts.append(chunk); metas.append(meta)
+                yield {**meta, "text": chunk}
 
-    if not texts:
+
+def build_index() -> Dict:
+    """Rebuild the index from data/ and return the embedding cache hit/miss and dedup stats."""
+    global _index, _index_mapped
+    model = get_model()
+    # repeated chunks (the same file under two names, overlapping documents) are embedded once
+    dedup = Deduplicator()
+    cache = EmbeddingCache(EMBED_CACHE_DIR, EMBEDDER_ID)
+    # ID-mapped so single documents can be upserted/deleted without a rebuild
+    writer = IndexWriter(with_ids=True)
+    rows: List[Dict] = []
+
+    def text_batches():
+        for batch in batched(dedup.filter(_iter_chunks())):
+            for row in batch:
+                row["id"] = len(rows)
+                rows.append(row)
+            yield [row["text"] for row in batch]
+
+    for emb in cache.encode_batches(model, text_batches()):
+        writer.add(emb, np.arange(writer.ntotal, writer.ntotal + len(emb), dtype=np.int64))
+    index = writer.finish()
+    if index is None:
         raise RuntimeError("No documents found in data/. Add knowledge.json or files in data/docs/")
+    print(format_report(dedup.report))
 
-    emb = model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
-    dim = emb.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(emb)
+    with _write_lock:
+        _index, _index_mapped = index, False
+        _save_index(rows)
+    return {"embed_cache": cache.stats, "dedup": dedup.report}
 
-    # save
-    DATA_DIR.mkdir(exist_ok=True)
-    faiss.write_index(index, str(INDEX_PATH))
-    META_PATH.write_text(json.dumps(metas, ensure_ascii=False, indent=2))
 
-    _index, _meta = index, metas
+def _save_index(rows: List[Dict]) -> None:
+    """Persist the index and rewrite the passage and BM25 stores; ``rows`` must be sorted by id.
+
+    O(corpus): run by build_index, and by upserts/deletes only once UPDATE_LOG_ROWS have piled up.
+    """
+    global _meta, _bm25, _log_rows
+    DATA_DIR.mkdir(exist_ok=True)
+    write_faiss_index(_index, str(INDEX_PATH))
+    write_passage_store(STORE_DIR, rows, [r["id"] for r in rows])
+    _meta = PassageOverlay(PassageStore(STORE_DIR))
+    _bm25 = BM25Index().build([r["text"] for r in rows], [r["id"] for r in rows])
+    _bm25.save(BM25_DIR)
+    UPDATE_LOG.unlink(missing_ok=True)  # last: until then a restart replays it (skipping stored rows)
+    _log_rows = 0
 
 
 def load_index():
-    global _index, _meta
+    global _index, _index_mapped, _meta, _bm25
     if _index is None:
-        if not INDEX_PATH.exists() or not META_PATH.exists():
+        # indexes from before the passage store (meta.json) are rebuilt once
+        if not INDEX_PATH.exists() or not PassageStore.exists(STORE_DIR):
             build_index()
         else:
-            _index = faiss.read_index(str(INDEX_PATH))
-            _meta = json.loads(META_PATH.read_text(encoding="utf-8"))
+            # memory-mapped (FAISS_MMAP) so all workers on the host share one page-cache copy
+            index, _index_mapped = read_faiss_index(INDEX_PATH)
+            _index = set_search_params(index)
+            _meta = PassageOverlay(PassageStore(STORE_DIR))
+            if BM25Index.exists(BM25_DIR):
+                _bm25 = BM25Index.load(BM25_DIR)
+            else:
+                # store written before BM25 existed
+                _bm25 = BM25Index().build([r["text"] for r in _meta], _meta.store.ids)
+            if UPDATE_LOG.exists():
+                _replay_updates()
     return _index, _meta
 
 
-def retrieve(query: str, top_k: int = None):
-    index, metas = load_index()
-    model = get_model()
-    top_k = top_k or TOP_K_DEFAULT
-    q = model.encode([query], convert_to_numpy=True, normalize_embeddings=True)
+def _writable_index():
+    global _index, _index_mapped
+    if _index_mapped:
+        index, _index_mapped = read_faiss_index(INDEX_PATH, mmap=False)
+        _index = set_search_params(index)
+    return _index
+
+
+def _remove_doc(doc_id: str) -> set:
+    ids = _meta.ids_where("doc_id", doc_id)
+    if len(ids):
+        if not supports_removal(_index):
+            raise ValueError("This index type does not support removing documents; use /reindex instead")
+        _writable_index().remove_ids(ids)
+    return set(ids.tolist())
+
+
+def _apply_update(removed: set, rows: List[Dict]) -> None:
+    _meta.remove(removed)
+    _meta.add(rows)
+    _bm25.remove(removed)
+    if rows:
+        _bm25.add([r["text"] for r in rows], [r["id"] for r in rows])
+
+
+def _log_update(removed: set, rows: List[Dict], emb: Optional[np.ndarray]) -> None:
+    """Record an upsert/delete already applied in memory: appended to UPDATE_LOG (O(chunks changed)),
+    or, past UPDATE_LOG_ROWS, folded into rewritten index files."""
+    global _log_rows
+    _log_rows += len(removed) + len(rows)
+    if _log_rows >= UPDATE_LOG_ROWS:
+        _save_index(list(_meta))
+        return
+    vectors = np.ascontiguousarray(emb, dtype=np.float32).tobytes() if rows else b""
+    entry = {"removed": sorted(removed), "rows": rows, "vectors": base64.b64encode(vectors).decode("ascii")}
+    with open(UPDATE_LOG, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _replay_updates() -> None:
+    """Re-apply UPDATE_LOG over the index files it was written against."""
+    global _log_rows
+    with open(UPDATE_LOG, "rb+") as f:
+        # a crash mid-append leaves a partial last line: cut it so the next entry starts a line of its own
+        f.truncate(f.read().rfind(b"\n") + 1)
+    index = _writable_index()  # on the heap until the log is folded into a rewrite
+    for _, entry in iter_records(UPDATE_LOG):
+        removed = set(entry["removed"])
+        vectors = np.frombuffer(base64.b64decode(entry["vectors"]), dtype=np.float32)
+        vectors = vectors.reshape(len(entry["rows"]), -1) if entry["rows"] else vectors
+        # rows already in the store were folded in by a rewrite that stopped before removing the log
+        fresh = [i for i, r in enumerate(entry["rows"]) if _meta.store.row_for_id(r["id"]) is None]
+        rows = [entry["rows"][i] for i in fresh]
+        if removed:
+            index.remove_ids(np.asarray(sorted(removed), dtype=np.int64))
+        if rows:
+            index.add_with_ids(vectors[fresh], np.asarray([r["id"] for r in rows], dtype=np.int64))
+        _apply_update(removed, rows)
+        _log_rows += len(removed) + len(rows)
+
+
+def upsert_document(text: str, title: str = "Manual Entry", meta: Optional[Dict] = None,
+                    doc_id: Optional[str] = None) -> Dict:
+    """Add a document to the live index, replacing any chunks already stored under ``doc_id``."""
+    doc = {"doc_id": doc_id or uuid.uuid4().hex, "title": title, "meta": meta or {}, "text": text}
+    chunks = _manual_chunks(doc)
+    if not chunks:
+        raise ValueError("Document text is empty")
+    load_index()
+    emb = get_model().encode([c["text"] for c in chunks], convert_to_numpy=True, normalize_embeddings=True)
+
+    with _write_lock:
+        removed = _remove_doc(doc["doc_id"])
+        start = _meta.next_id()
+        ids = np.arange(start, start + len(chunks), dtype=np.int64)
+        _writable_index().add_with_ids(emb, ids)
+        rows = [{**chunk, "id": i} for i, chunk in zip(ids.tolist(), chunks)]
+        _save_manual(doc)
+        _apply_update(removed, rows)
+        _log_update(removed, rows, emb)
+    return {"doc_id": doc["doc_id"], "ids": ids.tolist(), "replaced": len(removed)}
+
+
+def delete_document(doc_id: str) -> int:
+    """Remove every chunk stored under ``doc_id``; returns the number of chunks removed."""
+    load_index()
+    with _write_lock:
+        removed = _remove_doc(doc_id)
+        if removed:
+            _save_manual({"doc_id": doc_id, "text": None})  # keeps a rebuild from bringing it back
+            _apply_update(removed, [])
+            _log_update(removed, [], None)
+    return len(removed)
+
+
+def _dense_search(queries: List[str], top_k: int) -> List[List[Tuple[int, float]]]:
+    index, _ = load_index()
+    if len(queries) == 1:
+        q = encode_batcher(queries[0])[None, :]
+    else:
+        q = query_cache.encode(get_model(), list(queries), EMBEDDER_ID)
     D, I = index.search(q, top_k)
-    results = []
-    for rank, (score, idx) in enumerate(zip(D[0].tolist(), I[0].tolist())):
-        if idx == -1: continue
-        if score < SIM_THRESHOLD: continue
-        m = metas[idx]
-        results.append({
-            "id": rank + 1,
-            "score": float(score),
-            "title": m.get("title", "Document"),
-            "source": m.get("source", ""),
-            "snippet": m.get("snippet", ""),
-            "meta": m,
-        })
-    return results
+    keep = (I != -1) & (D >= SIM_THRESHOLD)
+    return [[(int(i), float(d)) for d, i in zip(scores[mask], ids[mask])] for scores, ids, mask in zip(D, I, keep)]
+
+
+def retrieve_many(queries: List[str], top_k: int = None) -> List[List[Dict]]:
+    """Retrieve for several queries with one batched encode and one FAISS search.
+
+    In ``auto`` mode, queries dominated by course codes are answered from BM25
+    without an encode when a passage covers enough of the query; in ``hybrid``/``auto`` the rest merge
+    dense and BM25 hits by reciprocal rank fusion.
+    """
+    _, metas = load_index()
+    top_k = top_k or TOP_K_DEFAULT
+    if not queries:
+        return []
+    bm25 = _bm25 if RETRIEVAL_MODE != "dense" else None
+    # fast-path hits are scored by query coverage and held to SIM_THRESHOLD like cosines; none -> encode
+    min_coverage = max(LEXICAL_COVERAGE, SIM_THRESHOLD)
+    hits: List[Optional[List[Tuple[int, float]]]] = [
+        (bm25.lexical_search(q, top_k, min_coverage=min_coverage) or None) if RETRIEVAL_MODE == "auto" else None
+        for q in queries]
+    rest = [i for i, h in enumerate(hits) if h is None]
+    if rest:
+        batch = [queries[i] for i in rest]
+        pool = top_k * 2 if bm25 is not None else top_k
+        for i, q, dense in zip(rest, batch, _dense_search(batch, pool)):
+            if bm25 is None:
+                hits[i] = dense
+                continue
+            # with no dense hit over SIM_THRESHOLD, plain word overlap is not a match; exact tokens are
+            sparse = bm25.search(q, pool) if dense or bm25.exact_share(q) > 0 else []
+            hits[i] = fuse(dense, sparse, top_k)
+
+    out = []
+    for query_hits in hits:
+        results = []
+        for rank, (doc_id, score) in enumerate(query_hits):
+            m = metas.get(doc_id)
+            if m is None: continue  # deleted while searching
+            text = m.pop("text")
+            results.append({
+                "id": rank + 1,
+                "score": score,
+                "title": m.get("title", "Document"),
+                "source": m.get("source", ""),
+                "snippet": m.get("snippet", ""),
+                "text": text,
+                "meta": m,
+            })
+        out.append(results)
+    return out
+
+
+def retrieve(query: str, top_k: int = None):
+    return retrieve_many([query], top_k)[0]
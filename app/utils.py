@@ -1,10 +1,10 @@
-from textblob import TextBlob
 from typing import Dict, List
 
 # simple in-memory session store; replace with Redis for production
 SESSIONS: Dict[str, List[dict]] = {}
 
 def detect_sentiment(text: str) -> str:
+    from textblob import TextBlob  # slow to import; only needed once a chat arrives
     pol = TextBlob(text).sentiment.polarity
     if pol > 0.2: return "positive"
     if pol < -0.2: return "negative"
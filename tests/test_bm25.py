@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from utils.bm25 import BM25Index, fuse, reciprocal_rank_fusion, retrieval_mode, tokenize
+from utils.textnorm import COURSE_CODE_RE, slug
+
+TEXTS = [
+    "CSC 201 Computer Programming I is a 200 level course in Computer Science.",
+    "MTH 101 Elementary Mathematics covers sets and functions.",
+    "Two plus two equals four; 2 + 2 = 4.",
+    "ACC305 Cost Accounting is taught in the second semester.",
+    "The library opens at 8am and closes at 10pm.",
+]
+
+
+@pytest.fixture
+def index():
+    return BM25Index().build(TEXTS, ids=[10, 11, 12, 13, 14])
+
+
+def test_tokenize_joins_course_codes():
+    assert tokenize("What is CSC 201?") == ["csc", "201", "csc201"]
+    assert tokenize("acc-305 and MTH101")[-2:] == ["acc305", "mth101"]
+    assert COURSE_CODE_RE.findall("CUAB- ACC 211") == [("ACC", "211")]
+
+
+def test_search_ranks_and_filters(index):
+    hits = index.search("computer programming", top_k=3)
+    assert hits[0][0] == 10 and len(hits) == 1
+    assert index.search("unknown words only") == []
+    assert [d for d, _ in index.search("semester level")] == [13, 10]
+    assert [d for d, _ in index.search("semester level", allowed=np.array([10]))] == [10]
+
+
+def test_save_load_round_trip(index, tmp_path):
+    index.save(tmp_path / "bm25")
+    assert BM25Index.exists(tmp_path / "bm25")
+    loaded = BM25Index.load(tmp_path / "bm25")
+
+    assert loaded.vocab == index.vocab
+    for name in ("offsets", "rows", "weights", "idf", "ids"):
+        assert np.array_equal(getattr(loaded, name), getattr(index, name))
+    for query in ("csc 201", "cost accounting", "library hours"):
+        assert loaded.search(query) == index.search(query)
+
+
+def test_save_swaps_in_without_touching_a_loaded_index(index, tmp_path):
+    path = tmp_path / "bm25"
+    index.save(path)
+    loaded = BM25Index.load(path)
+    before = loaded.search("csc 201")
+
+    BM25Index().build(["something else entirely"] * 50).save(path)
+
+    assert loaded.search("csc 201") == before
+    assert len(BM25Index.load(path)) == 50
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["bm25"]
+
+
+def test_only_course_codes_take_the_lexical_path(index):
+    assert index.is_lexical("what is csc 201")
+    assert not index.is_lexical("what is 2 + 2")
+    assert not index.is_lexical("200 level courses")
+    assert index.lexical_search("what is 2 + 2") == []
+
+
+def test_lexical_hits_are_scored_by_coverage(index):
+    assert index.lexical_search("csc 201") == [(10, pytest.approx(1.0))]
+    # "prerequisites" is in no passage: the hit covers only part of the query
+    partial = index.lexical_search("prerequisites for csc 201", min_coverage=0.0)
+    assert partial[0][0] == 10 and 0.0 < partial[0][1] < 1.0
+    assert index.lexical_search("prerequisites for csc 201", min_coverage=partial[0][1] + 0.01) == []
+
+
+
+def test_live_adds_and_removes_rank_like_a_rebuild(index):
+    live = BM25Index().build(TEXTS[:3], ids=[10, 11, 12])
+    live.add(TEXTS[3:], [13, 14])
+    for query in ("computer programming", "semester level", "library hours", "cost accounting"):
+        assert [d for d, _ in live.search(query)] == [d for d, _ in index.search(query)]
+    # a course code only the added rows contain still takes the lexical path
+    assert live.lexical_search("acc 305") == [(13, pytest.approx(1.0))]
+
+    live.remove([10, 13])
+    assert len(live) == 3
+    assert [d for d, _ in live.search("semester level")] == []
+    assert live.lexical_search("acc 305") == [] and live.search("csc 201") == []
+    assert [d for d, _ in live.search("library", allowed=np.array([14]))] == [14]
+
+def test_fusion_keeps_dense_scores():
+    assert reciprocal_rank_fusion([[1, 2, 3], [3, 1]]) == [1, 3, 2]
+    fused = fuse([(1, 0.9), (2, 0.7)], [(3, 12.0), (1, 5.0)], top_k=3)
+    assert fused == [(1, 0.9), (3, 0.7), (2, 0.7)]
+
+
+def test_retrieval_mode():
+    assert retrieval_mode("HYBRID") == "hybrid"
+    with pytest.raises(ValueError):
+        retrieval_mode("sparse")
+
+
+def test_slug():
+    assert slug("sentence-transformers/all-MiniLM-L6-v2@int8") == "sentence-transformers_all-MiniLM-L6-v2_int8"
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from utils.dedup import Deduplicator, MinHasher, content_hash, deduplicate, format_report, jaccard, shingles
+
+BASE = ("Students of Computer Science must complete CSC 201 Computer Programming I in the first semester "
+        "of their 200 level before registering for CSC 202 Computer Programming II in the second semester, "
+        "and both courses carry three credit units each towards graduation")
+
+
+def _rows(*texts, **fields):
+    return [{"text": t, "source": f"s{i}.json", **fields} for i, t in enumerate(texts)]
+
+
+def test_exact_duplicates_ignore_case_punctuation_and_spacing():
+    assert content_hash("Hello,  World!") == content_hash("hello world")
+    kept, report = deduplicate(_rows("Hello, World!", "hello   world", "Goodbye"), mode="exact")
+
+    assert [r["text"] for r in kept] == ["Hello, World!", "Goodbye"]
+    assert kept[0]["duplicates"] == [{"source": "s1.json"}]
+    assert report["exact"] == 1 and report["near"] == 0 and report["removed_by_source"] == {"s1.json": 1}
+
+
+def test_near_duplicates_are_merged_only_above_the_threshold():
+    near = BASE.replace("towards graduation", "toward graduation")
+    other = BASE.replace("Computer Science", "Mathematics").replace("CSC", "MTH").replace("Programming", "Analysis")
+    kept, report = deduplicate(_rows(BASE, near, other), mode="near", threshold=0.85)
+
+    assert jaccard(shingles(BASE), shingles(near)) >= 0.85
+    assert [r["source"] for r in kept] == ["s0.json", "s2.json"]
+    assert report["near"] == 1
+
+    kept, _ = deduplicate(_rows(BASE, near), mode="exact")
+    assert len(kept) == 2
+
+
+def test_only_rows_with_the_same_fields_are_merged():
+    rows = _rows(BASE, department="computer science") + _rows(BASE, department="mathematics")
+    kept, _ = deduplicate(rows, mode="near", same=("department",))
+    assert len(kept) == 2
+    kept, _ = deduplicate(rows, mode="near")
+    assert len(kept) == 1
+
+
+def test_off_keeps_everything_and_unknown_modes_fail():
+    kept, report = deduplicate(_rows("a", "a"), mode="off")
+    assert len(kept) == 2 and report["kept"] == 2
+    with pytest.raises(ValueError):
+        Deduplicator("fuzzy")
+
+
+def test_streaming_filter_completes_provenance_of_yielded_rows():
+    dedup = Deduplicator("exact")
+    stream = dedup.filter(iter(_rows("same text", "same text", "same text")))
+    first = next(stream)
+    assert "duplicates" not in first
+    assert list(stream) == []
+    assert [d["source"] for d in first["duplicates"]] == ["s1.json", "s2.json"]
+    assert dedup.report["input"] == 3 and dedup.report["kept"] == 1
+
+
+def test_minhash_agreement_estimates_jaccard():
+    a, b = shingles(BASE), shingles(BASE.replace("first semester", "opening term"))
+    hasher = MinHasher(num_perm=512)
+    estimate = float(np.mean(hasher.signature(a) == hasher.signature(b)))
+    assert estimate == pytest.approx(jaccard(a, b), abs=0.1)
+    assert shingles("too short").shape == (1,)
+
+
+def test_format_report():
+    _, report = deduplicate(_rows("x", "x", "y"), mode="exact")
+    text = format_report(report)
+    assert text.splitlines()[0].startswith("Dedup (exact): 3 passages -> 2 (1 removed")
+    assert "s1.json: 1 removed" in text
@@ -0,0 +1,129 @@
+import sqlite3
+import threading
+
+import pytest
+
+from utils.memory import HistoryStore
+
+
+def _row(i, department="Computer Science"):
+    return (f"2024-01-01 00:00:{i:02d}", f"question {i}", f"answer {i}", department, "200", "First", "neutral", "")
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"))
+    yield store
+    store.close()
+
+
+def test_queued_rows_are_committed_by_flush(store):
+    for i in range(50):
+        store.save(_row(i))
+    store.flush()
+
+    assert store.fetch("SELECT COUNT(*) FROM history")[0][0] == 50
+    stats = store.stats()
+    assert stats["rows"] == 50 and stats["queue_depth"] == 0
+    assert 1 <= stats["batches"] <= 50
+
+
+def test_close_writes_pending_rows_and_rejects_new_ones(tmp_path):
+    path = str(tmp_path / "history.db")
+    store = HistoryStore(path)
+    store.save(_row(1))
+    store.close()
+    store.close()  # idempotent
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        store.save(_row(2))
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT user_query FROM history").fetchall() == [("question 1",)]
+
+
+def test_reads_from_many_threads_share_one_connection(store):
+    store.save(_row(1))
+    errors = []
+
+    def read():
+        try:
+            assert store.fetch("SELECT COUNT(*) FROM history")[0][0] == 1
+        except Exception as e:  # surfaced below; pytest does not see thread failures
+            errors.append(e)
+
+    threads = [threading.Thread(target=read) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+
+
+def test_migrates_a_pre_user_history_table(tmp_path):
+    path = str(tmp_path / "history.db")
+    with sqlite3.connect(path) as conn:
+        # the table as versions before per-user history created it
+        conn.execute("""CREATE TABLE history (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, user_query TEXT,
+                        response TEXT, department TEXT, level TEXT, semester TEXT, sentiment TEXT, keywords TEXT)""")
+        conn.execute("INSERT INTO history (timestamp, user_query, response, department, level, semester, sentiment, "
+                     "keywords) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", _row(1))
+    conn.close()
+
+    store = HistoryStore(path)
+    try:
+        assert store.fetch("PRAGMA user_version")[0][0] == 1
+        assert store.fetch("SELECT user_id FROM history") == [("",)]
+        assert store.recent("") == [_row(1)]
+        store.save(_row(2), user_id="alice")
+        assert store.recent("alice") == [_row(2)]
+    finally:
+        store.close()
+
+    # opening an up-to-date database again changes nothing
+    store = HistoryStore(path)
+    try:
+        assert store.fetch("SELECT COUNT(*) FROM history")[0][0] == 2
+    finally:
+        store.close()
+
+
+def test_recent_is_per_user_newest_first_and_cached(store):
+    for i in range(3):
+        store.save(_row(i), user_id="alice")
+    store.save(_row(9), user_id="bob")
+
+    assert store.recent("alice", limit=2) == [_row(2), _row(1)]
+    assert store.recent("bob") == [_row(9)]
+    hits = store.context_hits
+    store.save(_row(3), user_id="alice")  # cached users are updated in place
+    assert store.recent("alice", limit=1) == [_row(3)]
+    assert store.context_hits == hits + 1
+
+
+def test_rows_saved_while_loading_are_not_lost(store):
+    store.save(_row(0), user_id="alice")
+    fetch = store.fetch
+
+    def slow_fetch(sql, params=()):
+        rows = fetch(sql, params)
+        store.save(_row(1), user_id="alice")  # lands after the query ran, before the cache is filled
+        return rows
+
+    store.fetch = slow_fetch
+    assert store.recent("alice") == [_row(1), _row(0)]
+    store.fetch = fetch
+    assert store.recent("alice") == [_row(1), _row(0)]
+
+
+@pytest.mark.parametrize("bad_value", [2 ** 70, object()])  # OverflowError / sqlite3.ProgrammingError
+def test_an_unbindable_row_is_dropped_alone_and_the_writer_survives(store, bad_value):
+    store.save(_row(1))
+    store.save(_row(2)[:-1] + (bad_value,))
+    store.save(_row(3))
+    store.flush()
+    store.save(_row(4))
+    store.flush()
+
+    assert store.fetch("SELECT user_query FROM history ORDER BY id") == [
+        ("question 1",), ("question 3",), ("question 4",)]
+    assert store._thread.is_alive()
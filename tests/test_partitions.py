@@ -0,0 +1,113 @@
+import numpy as np
+
+from utils.partitions import PartitionIndex, SliceCache, query_slots, record_slots, search_slice
+
+ROWS = [
+    {"department": ["computer science"], "faculty": "CONAS", "level": ["200"]},
+    {"department": ["computer science"], "faculty": "CONAS", "level": ["100", "200"]},
+    {"department": ["mathematics"], "faculty": "CONAS", "level": ["100"]},
+    {},  # general information: in every slice
+    {"department": ["law"], "faculty": "BACOLAW"},  # no level: in every level slice
+]
+
+
+def test_record_and_query_slots():
+    assert record_slots({"department": "Comp Sci", "faculty": "conas", "level": "200 level - 400level"}) == {
+        "department": ["computer science"], "faculty": "CONAS", "level": ["200", "300", "400"]}
+    assert record_slots({"department": "Underwater Basket Weaving"}) == {"department": ["underwater basket weaving"]}
+    assert query_slots({"department": "Computer Science", "level": 200, "semester": "First"}) == {
+        "department": "computer science", "level": "200"}
+    assert query_slots({"department": None, "faculty": "cohes"}) == {"faculty": "COHES"}
+    assert query_slots(None) == {}
+
+
+def test_records_listing_several_departments_are_in_each_slice():
+    slots = record_slots({"department": "Department of Anatomy, Nursing, anatomy", "faculty": "COHES"})
+    assert slots["department"] == ["anatomy", "nursing"]
+
+    index = PartitionIndex().build([slots, record_slots({"department": "Accounting, Architecture, Biochemistry"})])
+    assert index.select({"department": "nursing"}).tolist() == [0]
+    assert index.select({"department": "anatomy"}).tolist() == [0]
+    assert index.select({"department": "architecture"}).tolist() == [1]
+
+
+def test_map_inferred_faculty_does_not_hide_passages_filed_elsewhere():
+    # the data files some Computer Science passages under CICOT / CST, not the map's CONAS
+    rows = [record_slots({"department": "Computer Science", "faculty": f, "level": "200"}) for f in ("CONAS", "CICOT", "CST")]
+    index = PartitionIndex().build(rows)
+    # what the router returns for "computer science 200 level courses": faculty from DEPARTMENT_TO_FACULTY_MAP
+    slots = query_slots({"department": "Computer Science", "faculty": "CONAS", "level": "200"})
+    assert index.select(slots).tolist() == [0, 1, 2]
+    # a faculty on its own still narrows the slice
+    assert index.select(query_slots({"faculty": "CICOT"})).tolist() == [1]
+
+
+def test_select_intersects_slots_and_keeps_unscoped_rows():
+    index = PartitionIndex().build(ROWS, ids=[10, 11, 12, 13, 14])
+
+    assert index.select({}) is None
+    assert index.select({"department": "computer science"}).tolist() == [10, 11, 13]
+    assert index.select({"department": "computer science", "level": "100"}).tolist() == [11, 13]
+    assert index.select({"level": "200"}).tolist() == [10, 11, 13, 14]
+    assert index.select({"department": "physics"}).tolist() == [13]
+
+
+def test_save_load_round_trip(tmp_path):
+    index = PartitionIndex().build(ROWS)
+    index.save(tmp_path / "partitions")
+    assert PartitionIndex.exists(tmp_path / "partitions")
+    loaded = PartitionIndex.load(tmp_path / "partitions")
+
+    assert loaded.offsets == index.offsets
+    assert np.array_equal(loaded.ids, index.ids)
+    for slots in ({"faculty": "CONAS"}, {"department": "law", "level": "300"}):
+        assert np.array_equal(loaded.select(slots), index.select(slots))
+
+
+def test_save_swaps_in_without_touching_a_loaded_index(tmp_path):
+    path = tmp_path / "partitions"
+    PartitionIndex().build(ROWS).save(path)
+    loaded = PartitionIndex.load(path)
+    before = loaded.select({"faculty": "CONAS"}).tolist()
+
+    PartitionIndex().build([{"faculty": "COES"}] * 100).save(path)
+
+    assert loaded.select({"faculty": "CONAS"}).tolist() == before
+    assert len(PartitionIndex.load(path).select({"faculty": "COES"})) == 100
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["partitions"]
+
+
+def test_slice_cache_reuses_slices_and_falls_back():
+    cache = SliceCache(PartitionIndex().build(ROWS), maxsize=1)
+    calls = []
+
+    def reconstruct(ids):
+        calls.append(ids.tolist())
+        return np.eye(5, dtype=np.float32)[ids]
+
+    ids, vectors = cache.get({"faculty": "CONAS"}, reconstruct)
+    assert ids.tolist() == [0, 1, 2, 3] and vectors.shape == (4, 5)
+    cache.get({"faculty": "CONAS"}, reconstruct)
+    assert len(calls) == 1 and cache.stats["cache_hits"] == 1
+    cache.get({"faculty": "BACOLAW"}, reconstruct)
+    cache.get({"faculty": "CONAS"}, reconstruct)  # evicted by the one before (maxsize=1)
+    assert len(calls) == 3
+
+    assert cache.get({}, reconstruct) is None and cache.stats["global"] == 1
+
+
+def test_search_slice_matches_a_full_scan():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((20, 8)).astype(np.float32)
+    ids = np.arange(100, 120)
+    q = rng.standard_normal((2, 8)).astype(np.float32)
+
+    D, I = search_slice(ids, vectors, q, k=5)
+    scores = q @ vectors.T
+    for row in range(2):
+        expected = np.argsort(-scores[row])[:5]
+        assert I[row].tolist() == (ids[expected]).tolist()
+        assert np.allclose(D[row], scores[row, expected])
+
+    D, I = search_slice(ids[:2], vectors[:2], q, k=4)
+    assert I[:, 2:].tolist() == [[-1, -1], [-1, -1]] and np.isneginf(D[:, 2:]).all()
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from utils.passage_store import PassageOverlay, PassageStore, PassageStoreWriter, make_snippet, write_passage_store
+
+ROWS = [
+    {"text": "CSC 201 covers programming in Python.", "source": "course_data.json", "title": "CSC 201", "level": "200"},
+    {"text": "Admission requires five credits.", "source": "crescent_qa.json"},
+    {"text": "MTH 101 is Elementary Mathematics.", "source": "course_data.json", "doc_id": "d1"},
+]
+
+
+def test_round_trip(tmp_path):
+    write_passage_store(tmp_path / "store", ROWS, ids=[3, 10, 42])
+    store = PassageStore(tmp_path / "store")
+
+    assert len(store) == 3
+    assert store[0] == {"id": 3, "level": "200", "source": "course_data.json", "title": "CSC 201",
+                        "text": ROWS[0]["text"], "snippet": ROWS[0]["text"]}
+    assert store[-1]["doc_id"] == "d1"
+    assert "title" not in store[1]
+    assert [r["text"] for r in store] == [r["text"] for r in ROWS]
+    with pytest.raises(IndexError):
+        store[3]
+
+
+def test_lookup_by_id(tmp_path):
+    write_passage_store(tmp_path / "store", ROWS, ids=[3, 10, 42])
+    store = PassageStore(tmp_path / "store")
+
+    assert store.get(10)["text"] == ROWS[1]["text"]
+    assert store.get(11) is None
+    assert store.row_for_id(42) == 2
+    assert store.ids_where("source", "course_data.json").tolist() == [3, 42]
+    assert store.ids_where("source", "missing.json").tolist() == []
+
+
+def test_ids_must_ascend(tmp_path):
+    writer = PassageStoreWriter(tmp_path / "store")
+    writer.add(ROWS[0], 5)
+    with pytest.raises(ValueError):
+        writer.add(ROWS[1], 5)
+
+
+def test_rewrite_swaps_in_without_touching_the_mapped_store(tmp_path):
+    path = tmp_path / "store"
+    write_passage_store(path, ROWS)
+    old = PassageStore(path)
+    old_ids = np.array(old.ids)
+
+    write_passage_store(path, [{"text": f"passage {i}", "source": "new.json"} for i in range(100)])
+
+    # the open store still reads its own (now unlinked) files in full
+    assert np.array_equal(old.ids, old_ids)
+    assert old[2]["text"] == ROWS[2]["text"]
+    new = PassageStore(path)
+    assert len(new) == 100 and new[99]["text"] == "passage 99"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["store"]
+
+
+def test_snippet_cuts_at_a_word():
+    assert make_snippet("short  text\n") == "short text"
+    assert make_snippet("word " * 100, limit=12) == "word word…"
+
+
+def test_overlay_adds_and_removes_without_rewriting(tmp_path):
+    write_passage_store(tmp_path / "store", ROWS, ids=[3, 10, 42])
+    overlay = PassageOverlay(PassageStore(tmp_path / "store"))
+    assert overlay.next_id() == 43
+
+    overlay.remove([10])
+    overlay.add([{"id": 43, "doc_id": "d1", "text": "New passage."}, {"id": 44, "doc_id": "d2", "text": "Other."}])
+    assert len(overlay) == 4 and overlay.next_id() == 45
+    assert overlay.get(10) is None and overlay.get(3)["title"] == "CSC 201"
+    assert overlay.get(43)["snippet"] == "New passage."
+    overlay.get(43).pop("text")
+    assert overlay.get(43)["text"] == "New passage."  # lookups hand out copies
+    assert overlay.ids_where("doc_id", "d1").tolist() == [42, 43]
+
+    overlay.remove([43, 42])
+    assert overlay.get(43) is None and overlay.next_id() == 45
+    assert [r["id"] for r in overlay] == [3, 44]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["store"]  # nothing written
+
+    rows = list(overlay)
+    write_passage_store(tmp_path / "store", rows, [r["id"] for r in rows])
+    assert [r["text"] for r in PassageStore(tmp_path / "store")] == [ROWS[0]["text"], "Other."]
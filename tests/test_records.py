@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from utils.records import batched, iter_records, render_record
+
+BLOCKS = (1, 2, 3, 7, 64, 1 << 16)
+
+
+def _write(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content, encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("block", BLOCKS)
+@pytest.mark.parametrize("value", [
+    [],
+    [1, -7.5, 1e-3, 12345678901234567890, True, None, "x"],
+    [{"question": "What is CSC 201?", "nested": {"a": [1, 2, {"b": "]}"}]}}, "tricky \"quoted\" ,] text", "é ✓"],
+    {"a": 1, "b": {"c": [1, 2]}, "": "empty key"},
+])
+def test_json_matches_json_load_at_any_block_size(tmp_path, block, value):
+    for indent in (None, 2):
+        path = _write(tmp_path, "data.json", json.dumps(value, indent=indent, ensure_ascii=False))
+        expected = list(value.items()) if isinstance(value, dict) else list(enumerate(value))
+        assert list(iter_records(path, block=block)) == expected
+
+
+@pytest.mark.parametrize("block", BLOCKS)
+def test_numbers_cut_at_a_block_boundary(tmp_path, block):
+    path = _write(tmp_path, "data.json", "[12, -7.25, 3e10, 0.5]")
+    assert [v for _, v in iter_records(path, block=block)] == [12, -7.25, 3e10, 0.5]
+
+
+@pytest.mark.parametrize("content", ["[1] trailing garbage", "[1] [2]", '{"a": 1} x', "[1]]"])
+def test_trailing_data_is_rejected(tmp_path, content):
+    path = _write(tmp_path, "data.json", content)
+    with pytest.raises(ValueError):
+        list(iter_records(path, block=2))
+
+
+@pytest.mark.parametrize("content, valid", [("[1, 2", [1, 2]), ("[1 2]", [1]), ('{"a" 1}', []), ("[1,]", [1]), ("", [])])
+def test_malformed_json_raises_after_the_valid_records(tmp_path, content, valid):
+    seen = []
+    with pytest.raises(ValueError):
+        for _, value in iter_records(_write(tmp_path, "data.json", content), block=2):
+            seen.append(value)
+    assert seen == valid
+
+
+def test_top_level_must_be_an_array_or_object(tmp_path):
+    with pytest.raises(ValueError, match="expected a JSON array or object"):
+        list(iter_records(_write(tmp_path, "data.json", '"just a string"')))
+
+
+def test_trailing_whitespace_is_fine(tmp_path):
+    assert list(iter_records(_write(tmp_path, "data.json", " [1] \n\n"), block=1)) == [(0, 1)]
+
+
+def test_jsonl_skips_blank_and_invalid_lines(tmp_path, capsys):
+    path = _write(tmp_path, "data.jsonl", '{"a": 1}\n\n{broken\n[2]\n')
+    assert list(iter_records(path)) == [(0, {"a": 1}), (3, [2])]
+    assert "line 3" in capsys.readouterr().out
+    assert list(iter_records(_write(tmp_path, "data.ndjson", "1\n"))) == [(0, 1)]
+
+
+def test_render_record():
+    record = {"question": "What is CSC 201?", "answer": "Computer Programming I.", "department": "Computer Science",
+              "level": ["200", ""], "semester": "", "course_units": 3, "topic": None}
+    assert render_record(record) == ("Question: What is CSC 201?\nAnswer: Computer Programming I.\n"
+                                     "Department: Computer Science | Level: 200\nCourse units: 3")
+    assert render_record("  plain text ") == "plain text"
+
+
+def test_batched():
+    assert list(batched(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(batched([], 3)) == []
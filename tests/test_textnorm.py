@@ -0,0 +1,57 @@
+import random
+import re
+
+from utils.course_query import DEPARTMENT_FINDER, normalize_department, normalize_text
+from utils.textnorm import PhraseRewriter
+
+
+def test_whole_words_only():
+    rewriter = PhraseRewriter({"arch": "architecture"})
+    assert rewriter.rewrite("Arch and research") == "architecture and research"
+    assert rewriter.rewrite("archway") == "archway"
+
+
+def test_leftmost_then_longest():
+    rewriter = PhraseRewriter({"credit unit": "CU", "unit": "U", "credit": "C"})
+    assert rewriter.rewrite("credit unit, unit, credit") == "CU, U, C"
+    assert PhraseRewriter({"a b": "1", "b c": "2"}).rewrite("a b c") == "1 c"
+
+
+def test_replacements_are_not_rescanned():
+    swap = PhraseRewriter({"course": "subject", "subject": "course"})
+    assert swap.rewrite("course or subject") == "subject or course"
+
+
+def test_failure_links_find_overlapping_suffixes():
+    rewriter = PhraseRewriter({"he": "1", "she": "2", "hers": "3"}, is_word_char=lambda ch: False)
+    assert [phrase for _, _, phrase in rewriter.finditer("ushers")] == ["she", "he", "hers"]
+    assert rewriter.rewrite("ushers") == "u2rs"
+
+
+def test_whitespace_words():
+    hyphenated = PhraseRewriter({"a": "A"}, whitespace_words=True)
+    assert hyphenated.rewrite("a a-level") == "A a-level"
+    assert PhraseRewriter({"a": "A"}).rewrite("a a-level") == "A A-level"
+
+
+def test_find_returns_replacements_in_text_order():
+    rewriter = PhraseRewriter({"comp sci": "computer science", "biochem": "biochemistry"})
+    assert rewriter.find("Biochem or COMP SCI?") == ["biochemistry", "computer science"]
+    assert PhraseRewriter({}).rewrite("Nothing To Do") == "nothing to do"
+
+
+def test_matches_a_longest_first_regex():
+    rng = random.Random(0)
+    words = ["a", "ab", "abc", "b", "bc", "c", "ca", "cab"]
+    for _ in range(200):
+        phrases = {" ".join(rng.choices(words, k=rng.randint(1, 3))) for _ in range(6)}
+        mapping = {p: f"<{i}>" for i, p in enumerate(sorted(phrases))}
+        text = " ".join(rng.choices(words + [",", "x"], k=30))
+        pattern = re.compile(r"\b(?:%s)\b" % "|".join(map(re.escape, sorted(mapping, key=len, reverse=True))))
+        assert PhraseRewriter(mapping).rewrite(text) == pattern.sub(lambda m: mapping[m.group(0)], text)
+
+
+def test_course_query_normalizers():
+    assert DEPARTMENT_FINDER.find("comp sci then biochemistry") == ["computer science", "biochemistry"]
+    assert normalize_department("biochemistry courses in the Department of Physiology") == "biochemistry"
+    assert normalize_text("COMP SCI") == "computer science"
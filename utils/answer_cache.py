@@ -0,0 +1,85 @@
+"""
+Semantic answer cache for RAGPipeline.answer.
+
+A cached answer is reused when a new query's embedding lies within
+``max_distance`` cosine distance of a cached query. Limits come from the
+environment unless passed explicitly:
+
+    ANSWER_CACHE_SIZE           max cached answers                 (default: 256)
+    ANSWER_CACHE_TTL            seconds an answer stays valid      (default: 600)
+    ANSWER_CACHE_MAX_DISTANCE   cosine distance counted as a match (default: 0.05)
+
+Entries are tagged with the index version they were produced from; looking
+up with a newer version (e.g. after a rebuild) empties the cache.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    def __init__(self, max_entries: Optional[int] = None, max_age: Optional[float] = None,
+                 max_distance: Optional[float] = None):
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("ANSWER_CACHE_SIZE", 256))
+        self.max_age = max_age if max_age is not None else float(os.getenv("ANSWER_CACHE_TTL", 600))
+        self.max_distance = (max_distance if max_distance is not None
+                             else float(os.getenv("ANSWER_CACHE_MAX_DISTANCE", 0.05)))
+        self.version: Hashable = None
+        self.hits = 0
+        self.misses = 0
+        self._next_key = 0
+        # key -> (stored_at, embedding, params, value)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "max_distance": self.max_distance,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def _sync_version(self, version: Hashable):
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+
+    def get(self, embedding: np.ndarray, version: Hashable, params: Hashable = None) -> Optional[Dict]:
+        """Return the cached value closest to ``embedding`` (normalized) if it is close enough."""
+        now = time.monotonic()
+        with self._lock:
+            self._sync_version(version)
+            for key in [k for k, e in self._entries.items() if now - e[0] > self.max_age]:
+                del self._entries[key]
+            keys = [k for k, e in self._entries.items() if e[2] == params]
+            if keys:
+                sims = np.stack([self._entries[k][1] for k in keys]) @ embedding
+                best = int(np.argmax(sims))
+                if 1.0 - float(sims[best]) <= self.max_distance:
+                    self._entries.move_to_end(keys[best])
+                    self.hits += 1
+                    return self._entries[keys[best]][3]
+            self.misses += 1
+            return None
+
+    def put(self, embedding: np.ndarray, value: Dict, version: Hashable, params: Hashable = None):
+        with self._lock:
+            self._sync_version(version)
+            self._entries[self._next_key] = (time.monotonic(), np.asarray(embedding, dtype=np.float32), params, value)
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,105 @@
+"""
+Cross-request micro-batching.
+
+A MicroBatcher collects items submitted from many threads, waits at most
+``max_wait_ms`` after the first one for more to arrive (up to
+``max_batch_size``), runs ``fn`` once on the whole batch and hands every
+caller its own result. Defaults come from the environment:
+
+    BATCH_MAX_SIZE     items per batch                              (default: 16)
+    BATCH_MAX_WAIT_MS  how long the first item waits for company    (default: 5)
+    MICRO_BATCHING     set to 0 to call ``fn`` inline, one item at a time
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+
+def batching_enabled() -> bool:
+    return os.getenv("MICRO_BATCHING", "1") != "0"
+
+
+class MicroBatcher:
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], max_batch_size: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None, name: str = "batch"):
+        self.fn = fn
+        self.name = name
+        self.max_batch_size = max_batch_size or int(os.getenv("BATCH_MAX_SIZE", 16))
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else float(os.getenv("BATCH_MAX_WAIT_MS", 5))) / 1000
+        self.enabled = batching_enabled()
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.last_batch_size = 0
+        self.largest_batch_size = 0
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                "name": self.name,
+                "enabled": self.enabled,
+                "queue_depth": self._queue.qsize(),
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+                "last_batch_size": self.last_batch_size,
+                "largest_batch_size": self.largest_batch_size,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+    def submit(self, item: Any) -> Future:
+        fut: Future = Future()
+        if not self.enabled:
+            self._run_batch([(item, fut)])
+            return fut
+        self._ensure_worker()
+        self._queue.put((item, fut))
+        return fut
+
+    def __call__(self, item: Any) -> Any:
+        return self.submit(item).result()
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name=f"microbatch-{self.name}", daemon=True)
+                self._thread.start()
+
+    def _worker(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: List[tuple]):
+        with self._stats_lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.last_batch_size = len(batch)
+            self.largest_batch_size = max(self.largest_batch_size, len(batch))
+        try:
+            results = self.fn([item for item, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        for (_, fut), result in zip(batch, results):
+            fut.set_result(result)
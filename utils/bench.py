@@ -0,0 +1,844 @@
+"""
+Benchmarks and reports for CrescentBot, run against our own data.
+
+Usage:
+    python -m utils.bench index --data_dir data --k 5
+    python -m utils.bench embedder --backends torch int8 onnx
+    python -m utils.bench generator --questions 30
+    python -m utils.bench load --index data/index.faiss --workers 4
+    python -m utils.bench startup --budget_ms 1500
+    python -m utils.bench memory --turns 2000
+    python -m utils.bench preprocess --queries 500
+    python -m utils.bench intent --logs logs/query_log query_log.txt
+    python -m utils.bench normalize --grow 0 1000 10000
+    python -m utils.bench faq --queries 300
+    python -m utils.bench bm25 --k 5
+    python -m utils.bench partitions --scale 1 4
+    python -m utils.bench dedup --threshold 0.8 0.9 0.95
+    python -m utils.bench ingest --scale 1 4 16
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+
+# --------------------------- Helpers
+def _percentile(samples_ms: List[float], q: float) -> float:
+    return float(np.percentile(np.asarray(samples_ms), q)) if samples_ms else 0.0
+
+
+def _load_passages(data_dir: str) -> List[str]:
+    from utils.rag_pipeline import ingest_json_files
+    with contextlib.redirect_stdout(io.StringIO()):  # ingestion logs one line per record
+        docs = ingest_json_files(data_dir)
+    return [d["text"] for d in docs]
+
+
+def _load_questions(data_dir: str, limit: int) -> List[str]:
+    with open(Path(data_dir) / "crescent_qa.json", "r", encoding="utf-8") as f:
+        rows = json.load(f)
+    questions = [r["question"] for r in rows if r.get("question")]
+    step = max(1, len(questions) // limit)
+    return questions[::step][:limit]
+
+
+# --------------------------- Index types: recall@k vs latency
+def report_index(args):
+    import faiss
+    from sentence_transformers import SentenceTransformer
+    from utils.embed_cache import EmbeddingCache
+    from utils.index_factory import build_faiss_index, set_search_params
+
+    model = SentenceTransformer(args.model)
+    passages = _load_passages(args.data_dir)
+    corpus = EmbeddingCache(args.cache_dir, args.model).encode(model, passages, prune=False)
+    queries = model.encode(_load_questions(args.data_dir, args.queries),
+                           convert_to_numpy=True, normalize_embeddings=True).astype(np.float32)
+    print(f"Corpus: {len(passages)} passages, dim {corpus.shape[1]}; {len(queries)} queries, k={args.k}\n")
+
+    exact = faiss.IndexFlatIP(corpus.shape[1])
+    exact.add(corpus)
+    _, truth = exact.search(queries, args.k)
+
+    # one row per (type, query-time parameter) setting
+    runs: List[Dict] = []
+    for kind in args.types:
+        if kind in ("ivf_flat", "ivf_pq"):
+            runs += [{"type": kind, "nprobe": p} for p in args.nprobe]
+        elif kind == "hnsw":
+            runs += [{"type": kind, "ef_search": ef} for ef in args.ef_search]
+        else:
+            runs.append({"type": kind})
+
+    print(f"{'type':<10}{'param':<14}{'build s':>9}{'size MB':>9}{'recall@k':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    built: Dict[str, faiss.Index] = {}
+    for cfg in runs:
+        kind = cfg["type"]
+        t0 = time.perf_counter()
+        if kind not in built:
+            built[kind] = build_faiss_index(corpus, cfg)
+        build_s = time.perf_counter() - t0
+        index = set_search_params(built[kind], cfg)
+
+        latencies, hits = [], 0
+        for i in range(len(queries)):
+            t = time.perf_counter()
+            _, found = index.search(queries[i:i + 1], args.k)
+            latencies.append((time.perf_counter() - t) * 1000)
+            hits += len(set(found[0].tolist()) & set(truth[i].tolist()))
+
+        param = ", ".join(f"{k}={v}" for k, v in cfg.items() if k != "type") or "-"
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+        print(f"{kind:<10}{param:<14}{build_s:>9.2f}{size_mb:>9.2f}{hits / (len(queries) * args.k):>10.3f}"
+              f"{_percentile(latencies, 50):>9.3f}{_percentile(latencies, 99):>9.3f}")
+
+
+# --------------------------- Embedding backends: parity and throughput
+def report_embedder(args):
+    from utils.embedding import load_embedder
+
+    sentences = _load_passages(args.data_dir)[:args.sentences]
+    print(f"{len(sentences)} passages, batch size {args.batch_size}\n")
+    print(f"{'backend':<8}{'load s':>8}{'sent/s':>10}{'mean cos':>10}{'min cos':>10}")
+    reference = None
+    for backend in ["torch"] + [b for b in args.backends if b != "torch"]:
+        t0 = time.perf_counter()
+        model = load_embedder(args.model, backend, cache_folder=args.model_cache)
+        load_s = time.perf_counter() - t0
+        model.encode(sentences[:args.batch_size], batch_size=args.batch_size)  # warm-up
+        t0 = time.perf_counter()
+        embs = model.encode(sentences, batch_size=args.batch_size, convert_to_numpy=True, normalize_embeddings=True)
+        rate = len(sentences) / (time.perf_counter() - t0)
+        if reference is None:
+            reference = embs  # fp32 torch is the baseline for drift
+        cos = np.sum(reference * embs, axis=1)
+        print(f"{backend:<8}{load_s:>8.2f}{rate:>10.1f}{cos.mean():>10.5f}{cos.min():>10.5f}")
+
+
+# --------------------------- Generator: current settings vs fast mode
+def _tokens(text: str) -> List[str]:
+    return text.lower().split()
+
+
+def _token_f1(a: str, b: str) -> float:
+    ta, tb = _tokens(a), _tokens(b)
+    if not ta or not tb:
+        return float(ta == tb)
+    common = sum(min(ta.count(t), tb.count(t)) for t in set(ta))
+    if not common:
+        return 0.0
+    p, r = common / len(ta), common / len(tb)
+    return 2 * p * r / (p + r)
+
+
+def report_generator(args):
+    from utils.rag_pipeline import Generator, PROMPT_TMPL
+
+    with open(Path(args.data_dir) / "crescent_qa.json", "r", encoding="utf-8") as f:
+        rows = [r for r in json.load(f) if r.get("question") and r.get("answer")]
+    step = max(1, len(rows) // args.questions)
+    rows = rows[::step][:args.questions]
+    # the gold answer is the context, so only the generator differs between runs
+    prompts = [PROMPT_TMPL.format(context=f"[1] crescent_qa.json\n{r['answer']}", question=r["question"])
+               for r in rows]
+
+    answers: Dict[str, List[str]] = {}
+    print(f"{len(prompts)} questions from crescent_qa.json, max_new_tokens={args.max_new_tokens}\n")
+    print(f"{'mode':<10}{'load s':>8}{'p50 ms':>10}{'p95 ms':>10}{'exact':>8}{'token F1':>10}")
+    for mode in ("baseline", "fast"):
+        t0 = time.perf_counter()
+        gen = Generator(args.model, fast=mode == "fast", num_threads=args.threads or None,
+                        max_new_tokens=args.max_new_tokens)
+        load_s = time.perf_counter() - t0
+        latencies = []
+        answers[mode] = []
+        for prompt in prompts:
+            t = time.perf_counter()
+            answers[mode].append(gen.generate(prompt))
+            latencies.append((time.perf_counter() - t) * 1000)
+        pairs = list(zip(answers["baseline"], answers[mode]))
+        exact = sum(_tokens(a) == _tokens(b) for a, b in pairs) / len(pairs)
+        f1 = sum(_token_f1(a, b) for a, b in pairs) / len(pairs)
+        print(f"{mode:<10}{load_s:>8.2f}{_percentile(latencies, 50):>10.1f}{_percentile(latencies, 95):>10.1f}"
+              f"{exact:>8.2f}{f1:>10.3f}")
+
+
+# --------------------------- Index loading: heap vs memory-mapped
+_LOAD_PROBE = """
+import json, sys, time
+def rss():
+    out = {}
+    for line in open("/proc/self/status"):
+        if line.startswith(("RssAnon", "RssFile")):
+            key, value = line.split(":")
+            out[key] = int(value.split()[0]) / 1024
+    return out
+import faiss
+from utils.index_factory import read_faiss_index
+before = rss()
+t0 = time.perf_counter()
+index, mapped = read_faiss_index(sys.argv[1], mmap=sys.argv[2] == "mmap")
+load_ms = (time.perf_counter() - t0) * 1000
+after = rss()
+print(json.dumps({"load_ms": load_ms, "mapped": mapped,
+                  "anon_mb": after["RssAnon"] - before["RssAnon"], "file_mb": after["RssFile"] - before["RssFile"]}))
+sys.stdin.read()  # stay alive until every worker has loaded, like real co-located workers
+"""
+
+
+def report_load(args):
+    size_mb = Path(args.index).stat().st_size / 1e6
+    print(f"{args.index}: {size_mb:.1f} MB on disk, {args.workers} concurrent worker processes\n")
+    print(f"{'mode':<6}{'mapped':>8}{'load ms p50':>13}{'private MB/worker':>19}{'private MB total':>18}")
+    for mode in ("heap", "mmap"):
+        procs = [subprocess.Popen([sys.executable, "-c", _LOAD_PROBE, args.index, mode],
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                 for _ in range(args.workers)]
+        results = [json.loads(p.stdout.readline()) for p in procs]
+        for p in procs:
+            p.communicate("")
+        anon = [r["anon_mb"] for r in results]
+        print(f"{mode:<6}{str(results[0]['mapped']):>8}{_percentile([r['load_ms'] for r in results], 50):>13.1f}"
+              f"{np.mean(anon):>19.1f}{sum(anon):>18.1f}")
+    print("\nprivate = RssAnon growth; mapped pages are file-backed and shared through the page cache")
+
+
+# --------------------------- Cold start: import and initialization time per component
+_HEAVY = ("torch", "transformers", "sentence_transformers", "faiss", "textblob", "pandas", "symspellpy", "openai")
+
+_STARTUP_PROBE = """
+import json, sys, time
+setup, stmt = sys.argv[1], sys.argv[2]
+exec(setup)
+t0 = time.perf_counter()
+exec(stmt)
+ms = (time.perf_counter() - t0) * 1000
+print(json.dumps({"ms": ms, "heavy": [m for m in %r if m in sys.modules]}))
+""" % (_HEAVY,)
+
+# (component, kind, untimed setup, timed statement); each runs in a fresh interpreter
+_STARTUP_STEPS = [
+    *[(m, "import", "", f"import {m}") for m in
+      ("numpy", "streamlit", "faiss", "pandas", "textblob", "torch", "transformers", "sentence_transformers")],
+    *[(m, "app import", "", f"import {m}") for m in
+      ("utils.preprocess", "utils.memory", "utils.course_query", "utils.greetings", "utils.search",
+       "utils.embedding", "utils.rag_pipeline")],
+    ("symspell (snapshot)", "init", "from utils.preprocess import load_sym_spell", "load_sym_spell()"),
+    ("symspell (text dict)", "init", "from utils.preprocess import load_sym_spell", "load_sym_spell(snapshot=None)"),
+]
+
+
+def report_startup(args):
+    steps = list(_STARTUP_STEPS)
+    if args.models:
+        steps += [
+            ("embedder", "init", "from utils.embedding import load_embedder", f"load_embedder({args.embedder!r})"),
+            ("generator", "init", "from utils.rag_pipeline import Generator", f"Generator({args.generator!r})"),
+        ]
+    print(f"{'component':<24}{'kind':<12}{'ms':>9}  heavy modules loaded")
+    over = []
+    for name, kind, setup, stmt in steps:
+        proc = subprocess.run([sys.executable, "-c", _STARTUP_PROBE, setup, stmt],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"{name:<24}{kind:<12}{'failed':>9}  {proc.stderr.strip().splitlines()[-1]}")
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"{name:<24}{kind:<12}{result['ms']:>9.0f}  {', '.join(result['heavy']) or '-'}")
+        # app modules must stay cheap to import: heavy work belongs to first use
+        if kind == "app import" and args.budget_ms and (result["ms"] > args.budget_ms or result["heavy"]):
+            over.append(name)
+    if over:
+        print(f"\nOver budget ({args.budget_ms:.0f} ms, no heavy modules at import): {', '.join(over)}")
+        sys.exit(1)
+
+
+# --------------------------- Long-term memory: per-call connections vs write-behind store
+_LEGACY_SCHEMA = """CREATE TABLE history (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, user_query TEXT,
+    response TEXT, department TEXT, level TEXT, semester TEXT, sentiment TEXT, keywords TEXT)"""
+
+
+def _legacy_turn(db_path: str, row: tuple):
+    """One chat turn as utils.memory did it before: a fresh connection and commit per call."""
+    import sqlite3
+    conn = sqlite3.connect(db_path)
+    conn.execute("SELECT timestamp, department, level, semester, sentiment, keywords FROM history "
+                 "ORDER BY timestamp DESC LIMIT 3").fetchall()
+    conn.close()
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO history (timestamp, user_query, response, department, level, semester, sentiment, "
+                 "keywords) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+    conn.commit()
+    conn.close()
+
+
+def report_memory(args):
+    import sqlite3
+    import tempfile
+    from datetime import datetime, timedelta
+    from utils.memory import HistoryStore, get_relevant_context, save_interaction, _stores
+
+    query_info = {"department": "Computer Science", "level": "200", "semester": "first",
+                  "keywords": ["courses", "computer", "science"]}
+    row = (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "what courses", "CSC 201 ...",
+           "Computer Science", "200", "first", "neutral", "courses computer science")
+    start = datetime.now() - timedelta(days=30)
+    prefill = [((start + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S"), "q", "a", "Law", "100", "first",
+                "neutral", "law", f"user-{i % args.users}") for i in range(args.prefill)]
+    print(f"{args.turns} chat turns (context lookup + save) per mode; "
+          f"table prefilled with {args.prefill} rows from {args.users} users\n")
+    print(f"{'mode':<14}{'turns/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'drain ms':>10}{'rows':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("per-call", "write-behind"):
+            db_path = str(Path(tmp) / f"{mode}.db")
+            conn = sqlite3.connect(db_path)
+            if mode == "per-call":  # schema before per-user history: no user column, no index
+                conn.execute(_LEGACY_SCHEMA)
+                conn.executemany("INSERT INTO history (timestamp, user_query, response, department, level, semester, "
+                                 "sentiment, keywords) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [r[:-1] for r in prefill])
+            else:
+                conn.close()
+                HistoryStore(db_path).close()  # current schema
+                conn = sqlite3.connect(db_path)
+                conn.executemany("INSERT INTO history (timestamp, user_query, response, department, level, semester, "
+                                 "sentiment, keywords, user_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", prefill)
+            conn.commit()
+            conn.close()
+            if mode == "write-behind":
+                _stores[db_path] = store = HistoryStore(db_path)
+
+            latencies = []
+            t0 = time.perf_counter()
+            for _ in range(args.turns):
+                t = time.perf_counter()
+                if mode == "per-call":
+                    _legacy_turn(db_path, row)
+                else:
+                    get_relevant_context(db_path=db_path, user_id="bench-user")
+                    save_interaction("what courses", "CSC 201 ...", query_info, "neutral", db_path=db_path,
+                                     user_id="bench-user")
+                latencies.append((time.perf_counter() - t) * 1000)
+            t = time.perf_counter()
+            if mode == "write-behind":
+                store.close()  # everything queued is committed before the clock stops
+            drain_ms = (time.perf_counter() - t) * 1000
+            total = time.perf_counter() - t0
+            conn = sqlite3.connect(db_path)
+            rows = conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+            conn.close()
+            print(f"{mode:<14}{args.turns / total:>10.0f}{_percentile(latencies, 50):>9.3f}"
+                  f"{_percentile(latencies, 99):>9.3f}{drain_ms:>10.1f}{rows:>9}")
+
+
+# --------------------------- Query preprocessing: per-word SymSpell lookups vs memoized correction
+def report_preprocess(args):
+    import utils.preprocess as pre
+    from symspellpy import Verbosity
+
+    queries = _load_questions(args.data_dir, args.queries)
+    sym_spell = pre.load_sym_spell()
+    pre.get_sym_spell = lambda: sym_spell  # outside Streamlit; same instance for both paths
+
+    def legacy(text):
+        words = pre.apply_abbreviations(pre.normalize_text(text).split())
+        corrected = []
+        for word in words:
+            suggestions = sym_spell.lookup(word, Verbosity.CLOSEST, max_edit_distance=2)
+            corrected.append(suggestions[0].term if suggestions else word)
+        return " ".join(pre.apply_synonyms(corrected))
+
+    print(f"{len(queries)} questions from crescent_qa.json\n")
+    print(f"{'mode':<12}{'p50 ms':>9}{'p99 ms':>9}{'total ms':>10}{'changed':>9}")
+    baseline = [legacy(q) for q in queries]
+    for mode in ("per-word", "cold", "warm"):
+        fn = legacy if mode == "per-word" else pre.preprocess_text
+        latencies, outputs = [], []
+        for q in queries:
+            t = time.perf_counter()
+            outputs.append(fn(q))
+            latencies.append((time.perf_counter() - t) * 1000)
+        changed = sum(a != b for a, b in zip(baseline, outputs))  # domain terms no longer "corrected"
+        print(f"{mode:<12}{_percentile(latencies, 50):>9.3f}{_percentile(latencies, 99):>9.3f}"
+              f"{sum(latencies):>10.1f}{changed:>9}")
+    print(f"\n{json.dumps(pre.spell_stats(), indent=2)}")
+    if args.show:
+        for q, a, b in zip(queries, baseline, (pre.preprocess_text(q) for q in queries)):
+            if a != b:
+                print(f"\n{q}\n  per-word: {a}\n  now:      {b}")
+
+
+# --------------------------- Intent routing: step-by-step checks vs one combined pass
+_LOG_QUERY_RE = re.compile(r"\| (?:Question|Query): (.*?) \| (?:Similarity|Score):")
+
+
+def _load_logged_queries(paths: List[str]) -> List[str]:
+    queries = []
+    for path in paths:
+        if Path(path).exists():
+            with open(path, "r", encoding="utf-8") as f:
+                queries += [m.group(1) for m in map(_LOG_QUERY_RE.search, f) if m]
+    return queries
+
+
+def report_intent(args):
+    import random
+    from utils.course_query import extract_course_query
+    from utils.greetings import (GREETING_KEYWORDS, SOCIAL_PATTERNS, greeting_responses, is_greeting,
+                                 is_social_trigger, social_response)
+    from utils.intent import intent_router
+
+    queries = _load_logged_queries(args.logs)
+    logged = len(queries)
+    if logged < args.queries:
+        # thin logs: pad with knowledge-base questions plus greetings and small talk
+        rng = random.Random(0)
+        questions = _load_questions(args.data_dir, args.queries)
+        chatter = [f"{kw} there" for kw in GREETING_KEYWORDS] + [
+            "how are you", "thank you so much", "who are you", "i'm confused", "good job", "what is your name"]
+        while len(queries) < args.queries:
+            queries.append(rng.choice(chatter) if rng.random() < 0.2 else rng.choice(questions))
+    print(f"{len(queries)} messages ({logged} from query logs)\n")
+
+    def legacy(text):
+        if is_greeting(text):
+            greeting_responses()
+            return "greeting", {}
+        if is_social_trigger(text):
+            social_response(text)
+            return "social", {}
+        return "course", extract_course_query(text)
+
+    def routed(text):
+        route = intent_router.route(text)
+        if route["intent"] in ("greeting", "social"):
+            intent_router.reply(route)
+            return route["intent"], {}
+        return "course", {k: route[k] for k in ("level", "semester", "department", "faculty")}
+
+    print(f"{'mode':<10}{'us/msg':>9}{'p99 us':>9}")
+    results = {}
+    for mode, fn in (("legacy", legacy), ("router", routed)):
+        latencies, results[mode] = [], []
+        for _ in range(args.repeat):
+            latencies.clear()
+            results[mode].clear()
+            for q in queries:
+                t = time.perf_counter()
+                results[mode].append(fn(q))
+                latencies.append((time.perf_counter() - t) * 1e6)
+        print(f"{mode:<10}{np.mean(latencies):>9.1f}{_percentile(latencies, 99):>9.1f}")
+
+    diffs = [(q, a, b) for q, a, b in zip(queries, results["legacy"], results["router"]) if a != b]
+    print(f"\n{len(diffs)} of {len(queries)} messages routed or slotted differently")
+    for q, a, b in diffs[:args.show]:
+        print(f"  {q!r}\n    legacy: {a}\n    router: {b}")
+
+
+# --------------------------- Text normalization: chained str.replace vs one automaton pass
+def report_normalize(args):
+    import random
+    from utils.course_query import DEPARTMENTS, NORMALIZATION_MAP
+    from utils.textnorm import PhraseRewriter
+
+    queries = _load_questions(args.data_dir, args.queries)
+    print(f"{len(queries)} questions from crescent_qa.json\n")
+    print(f"{'aliases':>8}{'mode':>10}{'us/query':>10}{'build ms':>10}{'changed':>9}")
+    rng = random.Random(0)
+    for extra in args.grow:
+        # synthetic pidgin/slang variants standing in for future map entries
+        aliases = dict(NORMALIZATION_MAP)
+        while len(aliases) < len(NORMALIZATION_MAP) + extra:
+            alias = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 9)))
+            aliases.setdefault(alias, rng.choice(DEPARTMENTS))
+
+        def legacy(text):
+            text = text.lower()
+            for slang, std in aliases.items():
+                text = text.replace(slang, std)
+            for slang, std in aliases.items():
+                if slang in text and std in DEPARTMENTS:
+                    return text, std
+            return text, next((d for d in DEPARTMENTS if d in text), None)
+
+        t = time.perf_counter()
+        rewriter = PhraseRewriter(aliases)
+        finder = PhraseRewriter({**{k: v for k, v in aliases.items() if v in DEPARTMENTS}, **{d: d for d in DEPARTMENTS}})
+        build_ms = (time.perf_counter() - t) * 1000
+
+        def automaton(text):
+            found = finder.find(text)
+            return rewriter.rewrite(text), found[0] if found else None
+
+        baseline = [legacy(q) for q in queries]
+        for mode, fn in (("replace", legacy), ("automaton", automaton)):
+            t = time.perf_counter()
+            for _ in range(args.repeat):
+                outputs = [fn(q) for q in queries]
+            per_query = (time.perf_counter() - t) * 1e6 / (args.repeat * len(queries))
+            changed = sum(a != b for a, b in zip(baseline, outputs))  # substring hits inside words
+            print(f"{len(aliases):>8}{mode:>10}{per_query:>10.1f}"
+                  f"{build_ms if mode == 'automaton' else 0:>10.1f}{changed:>9}")
+        if args.show:
+            for q, a, b in zip(queries, baseline, (automaton(q) for q in queries)):
+                if a != b:
+                    print(f"  {q!r}\n    replace:   {a}\n    automaton: {b}")
+            args.show = False  # only for the real maps
+
+
+# --------------------------- FAQ matching (web.py): row filter + cos_sim/iloc vs FAQMatcher
+def report_faq(args):
+    import torch
+    from sentence_transformers.util import cos_sim
+    from utils.embedding import compute_question_embeddings, load_dataset, load_model
+    from utils.search import FAQMatcher, query_cache
+
+    model = load_model(args.model)
+    dataset = load_dataset(str(Path(args.data_dir) / "crescent_qa.json"))
+    with contextlib.redirect_stderr(io.StringIO()):  # progress bar
+        embeddings = compute_question_embeddings(dataset["question"].tolist(), model)
+    t = time.perf_counter()
+    matcher = FAQMatcher(dataset.to_dict("records"), embeddings, model, args.model)
+    build_ms = (time.perf_counter() - t) * 1000
+    queries = _load_questions(args.data_dir, args.queries)
+    queries = [q if i % 2 else q.rstrip("?") + " please?" for i, q in enumerate(queries)]  # half exact repeats
+    query_cache.encode(model, queries, args.model)  # both paths share warm query vectors: compare matching only
+
+    def legacy(q):
+        matched = dataset[dataset["question"].str.lower() == q.lower()]
+        if not matched.empty:
+            return matched.iloc[0]["answer"], 1.0, []
+        vec = torch.from_numpy(query_cache.encode(model, [q], args.model)[0])
+        scores = cos_sim(vec, embeddings)[0]
+        best_score, best_idx = torch.max(scores).item(), torch.argmax(scores).item()
+        if best_score < 0.6:
+            return None, best_score, []
+        related = []
+        for idx in torch.topk(scores, k=4).indices.tolist():
+            if idx != best_idx and dataset.iloc[idx]["question"] not in related:
+                related.append(dataset.iloc[idx]["question"])
+        return dataset.iloc[best_idx]["answer"], best_score, related
+
+    def matched(q):
+        idx = matcher.exact(q)
+        if idx is not None:
+            return matcher.answers[idx], 1.0, []
+        response, _, score, related = matcher.match(q)
+        return (response if score >= 0.6 else None), score, related
+
+    print(f"{len(matcher)} questions, matcher built in {build_ms:.1f} ms; {len(queries)} queries\n")
+    print(f"{'mode':<10}{'us/query':>10}{'p99 us':>9}{'agree':>7}")
+    outputs = {}
+    for mode, fn in (("legacy", legacy), ("matcher", matched)):
+        latencies, outputs[mode] = [], []
+        for q in queries:
+            t = time.perf_counter()
+            outputs[mode].append(fn(q))
+            latencies.append((time.perf_counter() - t) * 1e6)
+        agree = sum(a[0] == b[0] and a[2] == b[2] for a, b in zip(outputs["legacy"], outputs[mode]))
+        print(f"{mode:<10}{np.mean(latencies):>10.1f}{_percentile(latencies, 99):>9.1f}{agree:>7}")
+
+
+# --------------------------- Lexical vs dense vs hybrid retrieval over crescent_qa.json
+def report_bm25(args):
+    from utils.bm25 import BM25Index
+    from utils.textnorm import COURSE_CODE_RE
+    from utils.rag_pipeline import RAGIndex, ingest_json_files
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        docs = ingest_json_files(args.data_dir)
+    with open(Path(args.data_dir) / "crescent_qa.json", "r", encoding="utf-8") as f:
+        rows = json.load(f)
+    step = max(1, len(rows) // args.queries)
+    # a hit is any passage cut from the question's own Q&A record
+    cases = [(r["question"], f"crescent_qa.json_{i}_") for i, r in enumerate(rows) if r.get("question")][::step]
+    cases = cases[:args.queries]
+    code_cases = [c for c in cases if COURSE_CODE_RE.search(c[0].lower())]
+
+    t = time.perf_counter()
+    bm25 = BM25Index().build([d["text"] for d in docs])
+    print(f"{len(docs)} passages, BM25 built in {(time.perf_counter() - t) * 1000:.0f} ms, {len(bm25.vocab)} terms; "
+          f"{len(cases)} questions ({len(code_cases)} with course codes)\n")
+
+    searchers = {"bm25": lambda q: [docs[i] for i, _ in bm25.search(q, args.k)]}
+    try:
+        index = RAGIndex(args.model, mode="dense")
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            index.build(docs)
+    except OSError as e:  # model not downloadable here: lexical numbers only
+        print(f"dense modes skipped, embedder unavailable: {str(e).splitlines()[0]}\n")
+    else:
+        def run(mode):
+            def search(q):
+                index.mode = mode
+                return [md for md, _ in index.retrieve(q, args.k)]
+            return search
+        searchers.update({mode: run(mode) for mode in ("dense", "hybrid", "auto")})
+
+    print(f"{'mode':<8}{'subset':<8}{'hit@k':>7}{'p50 ms':>9}{'p99 ms':>9}{'lexical':>9}")
+    for mode, search in searchers.items():
+        for subset, subset_cases in (("all", cases), ("codes", code_cases)):
+            if not subset_cases:
+                continue
+            lexical = sum(bool(bm25.lexical_search(q, args.k)) for q, _ in subset_cases) if mode in ("bm25", "auto") else 0
+            latencies, hits = [], 0
+            for q, prefix in subset_cases:
+                t = time.perf_counter()
+                found = search(q)
+                latencies.append((time.perf_counter() - t) * 1000)
+                hits += any(x["id"].startswith(prefix) for d in found for x in [d, *d.get("duplicates", [])])
+            print(f"{mode:<8}{subset:<8}{hits / len(subset_cases):>7.1%}{_percentile(latencies, 50):>9.3f}"
+                  f"{_percentile(latencies, 99):>9.3f}{lexical / len(subset_cases):>9.0%}")
+
+
+# --------------------------- Partitioned vs global search for questions with course slots
+def report_partitions(args):
+    from utils.intent import intent_router
+    from utils.partitions import query_slots
+    from utils.rag_pipeline import RAGIndex, ingest_json_files
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        base = ingest_json_files(args.data_dir)
+    with open(Path(args.data_dir) / "crescent_qa.json", "r", encoding="utf-8") as f:
+        rows = json.load(f)
+    cases = []
+    for i, r in enumerate(rows):
+        slots = intent_router.course_slots(r.get("question", ""))
+        if query_slots(slots):
+            cases.append((r["question"], slots, f"crescent_qa.json_{i}_"))
+    cases = cases[::max(1, len(cases) // args.queries)][:args.queries]
+    print(f"{len(cases)} crescent_qa questions with course slots\n")
+    print(f"{'passages':>9}{'mode':>8}{'slice':>7}{'hit@k':>7}{'off-dept':>9}{'p50 ms':>9}{'p99 ms':>9}")
+
+    for scale in args.scale:
+        # the corpus repeated stands in for a larger catalog with the same department mix
+        docs = [dict(d, id=f"{d['id']}#{copy}" if copy else d["id"]) for copy in range(scale) for d in base]
+        index = RAGIndex(args.model, mode="dense")
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            index.build(docs)
+        vectors = index.embed_queries([q for q, _, _ in cases])
+        for mode in ("global", "sliced"):
+            latencies, hits, off, returned, slice_sizes = [], 0, 0, 0, []
+            for vec, (q, slots, prefix) in zip(vectors, cases):
+                filters = slots if mode == "sliced" else None
+                t = time.perf_counter()
+                found = index.search_embeddings(vec[None, :], args.k, filters=filters)[0]
+                latencies.append((time.perf_counter() - t) * 1000)
+                if filters:
+                    selected = index.select_partition(filters)
+                    slice_sizes.append(len(selected[0]) if selected is not None else len(docs))
+                # a passage merged at ingest is found through the one that kept it
+                hits += any(d["id"].split("#")[0].startswith(prefix)
+                            for md, _ in found for d in [md, *md.get("duplicates", [])])
+                want = query_slots(slots).get("department")
+                for md, _ in found:
+                    depts = md.get("department") or []
+                    off += bool(want and depts and want not in (depts if isinstance(depts, list) else [depts]))
+                returned += len(found)
+            share = np.mean(slice_sizes) / len(docs) if slice_sizes else 1.0
+            print(f"{len(docs):>9}{mode:>8}{share:>7.0%}{hits / len(cases):>7.1%}{off / max(returned, 1):>9.1%}"
+                  f"{_percentile(latencies, 50):>9.3f}{_percentile(latencies, 99):>9.3f}")
+
+
+# --------------------------- Duplicate passages removed at ingest
+def report_dedup(args):
+    from utils.dedup import deduplicate
+    from utils.partitions import PARTITION_FIELDS
+    from utils.rag_pipeline import ingest_json_files
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        docs = ingest_json_files(args.data_dir, dedup="off")
+    chars = sum(len(d["text"]) for d in docs)
+    print(f"{len(docs)} passages ({chars / 1e6:.2f}M chars) from {args.data_dir}\n")
+    print(f"{'mode':>6}{'thresh':>8}{'kept':>7}{'exact':>7}{'near':>6}{'chars kept':>12}{'ms':>9}")
+    runs = [("exact", None)] + [("near", t) for t in args.threshold]
+    for mode, threshold in runs:
+        t = time.perf_counter()
+        kept, report = deduplicate(docs, mode, threshold or 1.0, same=PARTITION_FIELDS)
+        ms = (time.perf_counter() - t) * 1000
+        kept_chars = sum(len(d["text"]) for d in kept) / chars
+        print(f"{mode:>6}{threshold or '-':>8}{report['kept']:>7}{report['exact']:>7}{report['near']:>6}"
+              f"{kept_chars:>12.1%}{ms:>9.1f}")
+
+
+# --------------------------- Whole-file vs streaming ingestion
+def _legacy_build(index, data_dir: Path):
+    """Ingestion as it was: json.load each file, embed dict reprs, one encode and one matrix."""
+    import faiss
+    from utils.bm25 import BM25Index
+    from utils.index_factory import build_faiss_index
+    from utils.rag_pipeline import split_text_into_passages
+    docs = []
+    for path in sorted(data_dir.iterdir()):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f) if path.suffix == ".json" else [json.loads(line) for line in f]
+        for key, val in enumerate(data):
+            for i, p in enumerate(split_text_into_passages(str(val))):
+                docs.append({"id": f"{path.name}_{key}_{i}", "source": path.name, "text": p})
+    texts = [d["text"] for d in docs]
+    index.bm25 = BM25Index().build(texts)
+    embs = index.embedder.encode(texts, convert_to_numpy=True)
+    faiss.normalize_L2(embs)
+    index.metadata, index.index = docs, build_faiss_index(embs)
+    return len(docs)
+
+
+def report_ingest(args):
+    import shutil
+    import tempfile
+    import tracemalloc
+    from utils.rag_pipeline import RAGIndex, stream_json_files
+
+    index = RAGIndex(args.model, mode="dense")
+    with open(Path(args.data_dir) / "crescent_qa.json", "r", encoding="utf-8") as f:
+        rows = json.load(f)
+    print(f"crescent_qa.json x scale, as JSON and JSONL; batch {args.batch}; "
+          f"peak = Python/numpy heap during the build (tracemalloc)\n")
+    print(f"{'passages':>9}{'mode':>11}{'seconds':>9}{'peak MB':>9}{'held MB':>9}")
+    for scale in args.scale:
+        tmp = Path(tempfile.mkdtemp())
+        try:
+            # each copy gets its own wording so the copies are not deduplicated away
+            copies = [dict(r, question=f"{r.get('question', '')} [{c}]") for c in range(scale) for r in rows]
+            (tmp / "course_data.json").write_text(json.dumps(copies[:len(copies) // 2]), encoding="utf-8")
+            with open(tmp / "crescent_qa.jsonl", "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(r) + "\n" for r in copies[len(copies) // 2:])
+            del copies
+            for mode in ("whole-file", "streaming"):
+                tracemalloc.start()
+                t = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                    if mode == "streaming":
+                        n = index.build(stream_json_files(str(tmp), dedup="off"), batch_size=args.batch)
+                    else:
+                        n = _legacy_build(index, tmp)
+                seconds = time.perf_counter() - t
+                held, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(f"{n:>9}{mode:>11}{seconds:>9.1f}{peak / 2**20:>9.1f}{held / 2**20:>9.1f}")
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+# --------------------------- CLI
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CrescentBot benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("index", help="recall@k and latency of each FAISS index type vs flat")
+    p.add_argument("--data_dir", type=str, default="data")
+    p.add_argument("--model", type=str, default="sentence-transformers/all-MiniLM-L6-v2")
+    p.add_argument("--cache_dir", type=str, default="data/embed_cache")
+    p.add_argument("--types", nargs="+", default=["flat", "hnsw", "ivf_flat", "ivf_pq", "sq8", "fp16"])
+    p.add_argument("--nprobe", nargs="+", type=int, default=[1, 4, 16])
+    p.add_argument("--ef_search", nargs="+", type=int, default=[16, 64, 128])
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--k", type=int, default=5)
+    p.set_defaults(func=report_index)
+
+    p = sub.add_parser("embedder", help="cosine drift vs fp32 and sentences/sec per embedding backend")
+    p.add_argument("--data_dir", type=str, default="data")
+    p.add_argument("--model", type=str, default="all-MiniLM-L6-v2")
+    p.add_argument("--model_cache", type=str, default="data/model_cache")
+    p.add_argument("--backends", nargs="+", default=["torch", "int8", "onnx"])
+    p.add_argument("--sentences", type=int, default=1000)
+    p.add_argument("--batch_size", type=int, default=32)
+    p.set_defaults(func=report_embedder)
+
+    p = sub.add_parser("generator", help="latency and answer agreement of fast generation vs current settings")
+    p.add_argument("--data_dir", type=str, default="data")
+    p.add_argument("--model", type=str, default="google/flan-t5-base")
+    p.add_argument("--questions", type=int, default=30)
+    p.add_argument("--max_new_tokens", type=int, default=128)
+    p.add_argument("--threads", type=int, default=0)
+    p.set_defaults(func=report_generator)
+
+    p = sub.add_parser("load", help="startup time and private RSS of heap vs memory-mapped index loading")
+    p.add_argument("--index", type=str, default="data/index.faiss")
+    p.add_argument("--workers", type=int, default=4)
+    p.set_defaults(func=report_load)
+
+    p = sub.add_parser("startup", help="import and initialization time per component, each in a fresh process")
+    p.add_argument("--models", action="store_true", help="also time loading the embedder and generator")
+    p.add_argument("--embedder", type=str, default="all-MiniLM-L6-v2")
+    p.add_argument("--generator", type=str, default="google/flan-t5-base")
+    p.add_argument("--budget_ms", type=float, default=0,
+                   help="fail if an app module takes longer than this to import or pulls in a heavy module")
+    p.set_defaults(func=report_startup)
+
+    p = sub.add_parser("memory", help="chat turns/sec of the long-term memory layer, per-call vs write-behind")
+    p.add_argument("--turns", type=int, default=2000)
+    p.add_argument("--prefill", type=int, default=20000, help="history rows already in the table")
+    p.add_argument("--users", type=int, default=1000, help="distinct users the prefilled rows belong to")
+    p.set_defaults(func=report_memory)
+
+    p = sub.add_parser("preprocess", help="query preprocessing latency, per-word lookups vs memoized correction")
+    p.add_argument("--data_dir", type=str, default="data")
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--show", action="store_true", help="print queries whose preprocessing changed")
+    p.set_defaults(func=report_preprocess)
+
+    p = sub.add_parser("intent", help="per-message cost of intent routing, step-by-step checks vs combined matcher")
+    p.add_argument("--logs", nargs="+", default=["logs/query_log", "query_log.txt"])
+    p.add_argument("--data_dir", type=str, default="data")
+    p.add_argument("--queries", type=int, default=1000, help="pad the logged messages up to this many")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--show", type=int, default=10, help="print this many differing messages")
+    p.set_defaults(func=report_intent)
+
+    p = sub.add_parser("normalize", help="slang/department normalization cost as the alias maps grow")
+    p.add_argument("--data_dir", type=str, default="data")
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--grow", nargs="+", type=int, default=[0, 1000, 10000], help="synthetic aliases to add")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--show", action="store_true", help="print queries normalized differently (real maps only)")
+    p.set_defaults(func=report_normalize)
+
+    p = sub.add_parser("faq", help="per-message cost of web.py FAQ matching, pandas/torch vs FAQMatcher")
+    p.add_argument("--data_dir", type=str, default="data")
+    p.add_argument("--model", type=str, default="all-MiniLM-L6-v2")
+    p.add_argument("--queries", type=int, default=300)
+    p.set_defaults(func=report_faq)
+
+    p = sub.add_parser("bm25", help="hit rate and latency of BM25, dense, hybrid (RRF) and auto retrieval")
+    p.add_argument("--data_dir", type=str, default="data")
+    p.add_argument("--model", type=str, default="sentence-transformers/all-MiniLM-L6-v2")
+    p.add_argument("--queries", type=int, default=2000)
+    p.add_argument("--k", type=int, default=5)
+    p.set_defaults(func=report_bm25)
+
+    p = sub.add_parser("partitions", help="hit rate, off-department hits and latency of sliced vs global search")
+    p.add_argument("--data_dir", type=str, default="data")
+    p.add_argument("--model", type=str, default="sentence-transformers/all-MiniLM-L6-v2")
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--k", type=int, default=5)
+    p.add_argument("--scale", nargs="+", type=int, default=[1, 4], help="corpus copies, to mimic a larger catalog")
+    p.set_defaults(func=report_partitions)
+
+    p = sub.add_parser("dedup", help="passages removed by exact and near-duplicate detection, and its cost")
+    p.add_argument("--data_dir", type=str, default="data")
+    p.add_argument("--threshold", nargs="+", type=float, default=[0.8, 0.9, 0.95])
+    p.set_defaults(func=report_dedup)
+
+    p = sub.add_parser("ingest", help="time and peak memory of whole-file vs streaming JSON/JSONL ingestion")
+    p.add_argument("--data_dir", type=str, default="data")
+    p.add_argument("--model", type=str, default="sentence-transformers/all-MiniLM-L6-v2")
+    p.add_argument("--batch", type=int, default=256)
+    p.add_argument("--scale", nargs="+", type=int, default=[1, 4, 16], help="copies of crescent_qa.json")
+    p.set_defaults(func=report_ingest)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
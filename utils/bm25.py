@@ -0,0 +1,303 @@
+"""
+BM25 lexical retrieval, fused with the dense FAISS results.
+
+Course codes ("CSC 201", "ACC305") and exact figures embed poorly, but a
+lexical index matches them exactly and needs no transformer encode. The index
+is an inverted file in CSR form: for every term, the rows containing it and
+their precomputed BM25 weight, so a query is one slice-and-add per term.
+It is saved next to the FAISS index as memory-mapped .npy columns.
+
+Retrieval mode comes from the environment:
+
+    RETRIEVAL_MODE   dense   FAISS only (previous behaviour)
+                     hybrid  dense and BM25 results merged by reciprocal rank fusion
+                     auto    hybrid, but queries dominated by course codes go
+                             lexical-only and skip the encoder      (default: auto)
+    LEXICAL_SHARE    share of the query's IDF weight that must come from course
+                     codes for the fast path                        (default: 0.5)
+    LEXICAL_COVERAGE share of the query's IDF weight a passage must contain to be
+                     a fast-path hit; it is also the hit's score, so
+                     similarity thresholds apply to it as to a cosine (default: 0.6)
+    RRF_K            rank constant of reciprocal rank fusion        (default: 60)
+
+Run ``python -m utils.bench bm25`` for latency and hit rate over crescent_qa.json.
+"""
+
+import json
+import os
+import re
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.passage_store import publish_dir, staging_dir
+from utils.textnorm import COURSE_CODE_RE
+
+RETRIEVAL_MODES = ("dense", "hybrid", "auto")
+RRF_K = int(os.getenv("RRF_K", 60))
+LEXICAL_SHARE = float(os.getenv("LEXICAL_SHARE", 0.5))
+LEXICAL_COVERAGE = float(os.getenv("LEXICAL_COVERAGE", 0.6))
+
+TOKEN_RE = re.compile(r"[a-z]+|\d+(?:[.,]\d+)*")
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i in is it me my of on or the to was what when where which
+who why will with you your there their this that these those about into any all has have had if so than then
+""".split())
+
+
+def retrieval_mode(mode: Optional[str] = None) -> str:
+    mode = (mode or os.getenv("RETRIEVAL_MODE", "auto")).lower()
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {', '.join(RETRIEVAL_MODES)}")
+    return mode
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word and number tokens without stopwords, plus one joined token per course code."""
+    text = text.lower()
+    tokens = [t for t in TOKEN_RE.findall(text) if t not in STOPWORDS]
+    tokens += [f"{prefix}{number}" for prefix, number in COURSE_CODE_RE.findall(text)]  # "csc 201" and "csc201" agree
+    return tokens
+
+
+def exact_terms(text: str) -> set:
+    """Course-code tokens of ``text`` with their parts ("csc201", "csc", "201"): what an embedding blurs
+    but a lookup gets right. Bare numbers ("2 + 2", "100 level") are not exact on their own."""
+    terms = set()
+    for prefix, number in COURSE_CODE_RE.findall(text.lower()):
+        terms.update((f"{prefix}{number}", prefix, number))
+    return terms
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype=np.int64)  # postings of term t: [offsets[t], offsets[t + 1])
+        self.rows = np.zeros(0, dtype=np.int32)     # row positions
+        self.weights = np.zeros(0, dtype=np.float32)
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.ids = np.zeros(0, dtype=np.int64)      # row position -> caller's id (FAISS id)
+        self.avgdl: Optional[float] = None
+        # live updates (``add`` / ``remove``) since the postings were built; ``save`` does not write them
+        self.dropped = np.zeros(0, dtype=np.int64)  # row positions removed
+        self.tail: Optional["BM25Index"] = None     # rows added, scored with this index's statistics
+        self._tail_texts: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids) - len(self.dropped) + len(self._tail_texts)
+
+    def build(self, texts: Iterable[str], ids: Optional[Iterable[int]] = None,
+              reference: Optional["BM25Index"] = None) -> "BM25Index":
+        """Index ``texts`` (any iterable, consumed once); postings are kept in flat arrays while counting.
+
+        With a ``reference`` index, document frequencies and the average length are those
+        of the reference plus ``texts``, so scores compare with the reference's (see ``add``).
+        """
+        vocab: Dict[str, int] = {}
+        terms, rows, tfs = array("i"), array("i"), array("f")  # one entry per (row, term) posting
+        lengths = array("f")
+        for row, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                terms.append(vocab.setdefault(term, len(vocab)))
+                rows.append(row)
+                tfs.append(tf)
+        n = len(lengths)
+        self.ids = np.arange(n, dtype=np.int64) if ids is None else np.asarray(list(ids), dtype=np.int64)
+        lengths = np.frombuffer(lengths, dtype=np.float32)
+
+        # renumber terms alphabetically, then group postings by term (rows stay ascending within a term)
+        names = sorted(vocab)
+        self.vocab = {t: i for i, t in enumerate(names)}
+        rank = np.empty(len(vocab), dtype=np.int32)
+        rank[np.fromiter((vocab[t] for t in names), dtype=np.int64, count=len(names))] = np.arange(len(names))
+        term_ids = rank[np.frombuffer(terms, dtype=np.int32)]
+        order = np.argsort(term_ids, kind="stable")
+        sizes = np.bincount(term_ids, minlength=len(names)).astype(np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        self.rows = np.frombuffer(rows, dtype=np.int32)[order]
+        tf = np.frombuffer(tfs, dtype=np.float32)[order]
+
+        avgdl = float(lengths.mean()) if n and lengths.any() else 1.0
+        docs, df = n, sizes
+        if reference is not None:
+            known = np.fromiter((reference.vocab.get(t, -1) for t in names), dtype=np.int64, count=len(names))
+            ref_df = np.diff(np.asarray(reference.offsets))
+            df = sizes + np.where(known >= 0, ref_df[np.maximum(known, 0)] if len(ref_df) else 0, 0)
+            docs = n + len(reference.ids)
+            avgdl = reference.avgdl or avgdl  # indexes saved before avgdl was stored: this batch's
+        self.avgdl = avgdl
+        self.idf = np.log1p((docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = self.k1 * (1 - self.b + self.b * lengths[self.rows] / avgdl)
+        self.weights = (np.repeat(self.idf, sizes) * tf * (self.k1 + 1) / (tf + norm)).astype(np.float32)
+        return self
+
+    # ---------- live updates
+    def add(self, texts: Sequence[str], ids: Sequence[int]):
+        """Add rows without touching the postings: they go to a small tail index, rebuilt on each
+        call (O(rows added since ``build``)) with this index's document frequencies and length."""
+        self._set_tail({**self._tail_texts, **{int(i): t for i, t in zip(ids, texts)}})
+
+    def remove(self, ids: Iterable[int]):
+        """Drop rows by id: masked out of the postings, or dropped from the tail."""
+        ids = {int(i) for i in ids}
+        built = np.fromiter(ids.difference(self._tail_texts), dtype=np.int64)
+        if len(built):
+            self.dropped = np.union1d(self.dropped, np.flatnonzero(np.isin(self.ids, built)))
+        if ids.intersection(self._tail_texts):
+            self._set_tail({i: t for i, t in self._tail_texts.items() if i not in ids})
+
+    def _set_tail(self, texts: Dict[int, str]):
+        # swapped in whole: a concurrent search sees the old tail or the new one
+        self.tail = BM25Index(self.k1, self.b).build(texts.values(), texts, reference=self) if texts else None
+        self._tail_texts = texts
+
+    # ---------- persistence
+    def save(self, path: str):
+        # written aside and swapped in: a loaded index may be memory-mapping the current files
+        path = Path(path)
+        tmp = staging_dir(path)
+        for name in ("offsets", "rows", "weights", "idf", "ids"):
+            np.save(tmp / f"{name}.npy", getattr(self, name))
+        terms = sorted(self.vocab, key=self.vocab.get)
+        (tmp / "vocab.json").write_text(json.dumps({"k1": self.k1, "b": self.b, "avgdl": self.avgdl, "terms": terms}),
+                                        encoding="utf-8")
+        publish_dir(tmp, path)
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return (Path(path) / "vocab.json").exists()
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        path = Path(path)
+        meta = json.loads((path / "vocab.json").read_text(encoding="utf-8"))
+        index = cls(meta["k1"], meta["b"])
+        index.vocab = {t: i for i, t in enumerate(meta["terms"])}
+        index.avgdl = meta.get("avgdl")
+        for name in ("offsets", "rows", "weights", "idf", "ids"):
+            setattr(index, name, np.load(path / f"{name}.npy", mmap_mode="r"))
+        return index
+
+    # ---------- querying
+    def exact_share(self, query: str) -> float:
+        """Share of the query's IDF weight carried by course-code tokens the index knows."""
+        exact_set = exact_terms(query)
+        total = exact = 0.0
+        for term in set(tokenize(query)):
+            idf = self._idf(term)
+            if idf is None:
+                continue
+            total += idf
+            if term in exact_set:
+                exact += idf
+        return exact / total if total else 0.0
+
+    def is_lexical(self, query: str, share: float = LEXICAL_SHARE) -> bool:
+        return self.exact_share(query) >= share
+
+    def _idf(self, term: str) -> Optional[float]:
+        t = self.vocab.get(term)
+        if t is not None:
+            return float(self.idf[t])
+        return self.tail._idf(term) if self.tail is not None else None
+
+    def _term_weights(self, query: str) -> Dict[str, float]:
+        # a term no passage contains weighs as much as the rarest one: nothing can cover it
+        unknown = float(np.log1p((len(self) + 0.5) / 0.5))
+        weights = {term: self._idf(term) for term in set(tokenize(query))}
+        return {term: unknown if w is None else w for term, w in weights.items()}
+
+    def coverage(self, query: str, rows: np.ndarray, weights: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """Share of the query's IDF weight present in each of ``rows`` (row positions), in [0, 1]."""
+        weights = weights or self._term_weights(query)
+        total = sum(weights.values())
+        covered = np.zeros(len(rows), dtype=np.float32)
+        for term, weight in weights.items():
+            t = self.vocab.get(term)
+            if t is not None:
+                covered += weight * np.isin(rows, self.rows[self.offsets[t]:self.offsets[t + 1]])
+        return np.minimum(covered / total, 1.0) if total else covered
+
+    def _search_rows(self, query: str, top_k: int, allowed: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.vocab.get(term)
+            if t is not None:
+                start, end = self.offsets[t], self.offsets[t + 1]
+                scores[self.rows[start:end]] += self.weights[start:end]  # rows are unique within a term
+        if allowed is not None:
+            scores[~np.isin(self.ids, allowed)] = 0.0
+        scores[self.dropped] = 0.0
+        hits = np.flatnonzero(scores)
+        if len(hits) > top_k:
+            hits = hits[np.argpartition(-scores[hits], top_k - 1)[:top_k]]
+        hits = hits[np.lexsort((hits, -scores[hits]))]
+        return hits, scores[hits]
+
+    def search(self, query: str, top_k: int = 5, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """``(id, score)`` of the best ``top_k`` rows, best first; rows sharing no term are never returned.
+
+        ``allowed`` limits the results to those ids (a partition slice).
+        """
+        hits, scores = self._search_rows(query, top_k, allowed)
+        found = [(int(self.ids[row]), float(score)) for row, score in zip(hits, scores)]
+        if self.tail is not None:
+            found = sorted(found + self.tail.search(query, top_k, allowed), key=lambda h: -h[1])[:top_k]
+        return found
+
+    def lexical_search(self, query: str, top_k: int = 5, allowed: Optional[np.ndarray] = None,
+                       min_coverage: float = LEXICAL_COVERAGE) -> List[Tuple[int, float]]:
+        """Fast-path hits ``(id, coverage)``: [] unless the query is lexical and a passage covers enough of it.
+
+        BM25 picks the ``top_k`` candidates; each is scored by ``coverage`` (an absolute
+        share, unlike a BM25 score), those under ``min_coverage`` are dropped and the
+        rest ordered by coverage, then BM25 rank. An empty result means "encode instead".
+        """
+        if not self.is_lexical(query):
+            return []
+        return self._covered(query, self._term_weights(query), top_k, allowed, min_coverage)
+
+    def _covered(self, query: str, weights: Dict[str, float], top_k: int, allowed: Optional[np.ndarray],
+                 min_coverage: float) -> List[Tuple[int, float]]:
+        hits, _ = self._search_rows(query, top_k, allowed)
+        covered = self.coverage(query, hits, weights)
+        keep = np.flatnonzero(covered >= min_coverage)
+        keep = keep[np.argsort(-covered[keep], kind="stable")]
+        found = [(int(self.ids[hits[i]]), float(covered[i])) for i in keep]
+        if self.tail is not None:
+            tail = self.tail._covered(query, weights, top_k, allowed, min_coverage)
+            found = sorted(found + tail, key=lambda h: -h[1])[:top_k]
+        return found
+
+    def search_batch(self, queries: Sequence[str], top_k: int = 5) -> List[List[Tuple[int, float]]]:
+        return [self.search(q, top_k) for q in queries]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[int]:
+    """Ids ordered by the sum of 1 / (k + rank) over the rankings they appear in."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused, key=lambda d: -fused[d])
+
+
+def fuse(dense: Sequence[Tuple[int, float]], sparse: Sequence[Tuple[int, float]], top_k: int,
+         k: int = RRF_K) -> List[Tuple[int, float]]:
+    """RRF merge of dense ``(id, cosine)`` and BM25 ``(id, score)`` hits.
+
+    Each hit keeps its cosine score, so similarity thresholds mean what they did.
+    Hits found only lexically get the lowest cosine of the dense list (0.0 without one),
+    so they never raise a query's best score.
+    """
+    cosine = dict(dense)
+    floor = min(cosine.values(), default=0.0)
+    order = reciprocal_rank_fusion([[d for d, _ in dense], [d for d, _ in sparse]], k)
+    return [(d, cosine.get(d, floor)) for d in order[:top_k]]
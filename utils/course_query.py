@@ -2,6 +2,8 @@ import json
 import re
 from rapidfuzz import process
 
+from utils.textnorm import COURSE_CODE_RE, PhraseRewriter
+
 # 🔁 Informal input normalization map
 NORMALIZATION_MAP = {
     "comp sci": "computer science", "mass comm": "mass communication",
@@ -34,12 +36,14 @@ DEPARTMENT_TO_FACULTY_MAP = {
     "physiology": "COHES", "architecture": "COES"
 }
 
+# ⚙️ Built once; one pass over the text however many variants the maps hold
+SLANG_REWRITER = PhraseRewriter(NORMALIZATION_MAP)
+DEPARTMENT_FINDER = PhraseRewriter({**{slang: std for slang, std in NORMALIZATION_MAP.items() if std in DEPARTMENTS},
+                                    **{dept: dept for dept in DEPARTMENTS}})
+
 # 🔤 Normalize slang/pidgin variants
 def normalize_text(text):
-    text = text.lower()
-    for slang, std in NORMALIZATION_MAP.items():
-        text = text.replace(slang, std)
-    return text
+    return SLANG_REWRITER.rewrite(text)
 
 # 🔡 Fuzzy fallback for department match
 def fuzzy_match_department(text):
@@ -48,14 +52,8 @@ def fuzzy_match_department(text):
 
 # 🎯 Extract normalized department
 def normalize_department(text):
-    norm_text = text.lower()
-    for slang, standard in NORMALIZATION_MAP.items():
-        if slang in norm_text and standard in DEPARTMENTS:
-            return standard
-    for dept in DEPARTMENTS:
-        if dept in norm_text:
-            return dept
-    return fuzzy_match_department(text)
+    found = DEPARTMENT_FINDER.find(text)
+    return found[0] if found else fuzzy_match_department(text)
 
 # 📤 Extract structured course query
 def extract_course_query(text):
@@ -76,32 +74,147 @@ def load_course_data(path="data/course_data.json"):
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
+# 🗂️ Structured course catalog, indexed once at load
+# course listings come as "Title (CODE) Unit:N" or "CODE Title (N units)"
+COURSE_LINE_RES = (
+    re.compile(r"^\s*(?P<title>.+?)\s*\((?P<code>[^()]*?\d{3})\)\s*unit\s*:?\s*(?P<units>\d+)", re.IGNORECASE),
+    re.compile(r"^\s*(?P<code>(?:[a-z]+-\s*)?[a-z]{2,4}\s*\d{3})\s*[–-]?\s*(?P<title>.+?)\s*\((?P<units>\d+)\s*units?\)",
+               re.IGNORECASE),
+)
+LEVELS = ("100", "200", "300", "400", "500")
+
+def course_code_key(code):
+    """'CUAB- ACC 211' -> 'ACC211': prefix and digits, no separators."""
+    m = COURSE_CODE_RE.search(code)
+    return f"{m.group(1).upper()}{m.group(2)}" if m else re.sub(r"[\s-]", "", code.upper())
+
+def _entry_levels(level):
+    # "200", "100 level", "200 level - 400level" (a range)
+    found = re.findall(r"[1-5]00", level or "")
+    if len(found) == 2 and "-" in level:
+        return [l for l in LEVELS if found[0] <= l <= found[1]]
+    return found or [None]
+
+def _entry_semester(entry):
+    sem = (entry.get("semester") or "").lower()
+    if not sem:
+        m = re.search(r"\b(first|second)\s+semester\b", entry.get("question", "").lower())
+        sem = m.group(1) if m else ""
+    return sem or None
+
+class CourseCatalog:
+    """Course data indexed by (department, level, semester) and by course code.
+
+    Every entry is filed under all eight combinations of its (department,
+    level, semester) with any part wildcarded (None), so a lookup with any
+    subset of the three is a single dictionary hit.
+    """
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self._by_key = {}
+        self._by_code = {}
+        for i, entry in enumerate(self.entries):
+            dept = normalize_department(entry["department"]) if entry.get("department") else None
+            semester = _entry_semester(entry)
+            for level in _entry_levels(entry.get("level")):
+                for key in {(d, l, s) for d in (dept, None) for l in (level, None) for s in (semester, None)}:
+                    self._by_key.setdefault(key, []).append(i)
+            for line in entry.get("answer", "").split("|"):
+                m = next(filter(None, (rx.search(line) for rx in COURSE_LINE_RES)), None)
+                if m:
+                    self._by_code.setdefault(course_code_key(m.group("code")), []).append({
+                        "code": m.group("code").strip(), "title": m.group("title").strip(),
+                        "units": int(m.group("units")), "department": dept,
+                        "level": entry.get("level") or None, "semester": semester,
+                    })
+        for key, rows in self._by_key.items():  # an entry can land on a key twice via level ranges
+            self._by_key[key] = sorted(set(rows))
+
+    @classmethod
+    def load(cls, path="data/course_data.json"):
+        return cls(load_course_data(path))
+
+    def lookup(self, department=None, level=None, semester=None):
+        """All entries matching the given slots (None = any), in file order."""
+        dept = department.lower() if department else None
+        key = (dept, str(level) if level else None, semester.lower() if semester else None)
+        if key == (None, None, None):
+            return []
+        return [self.entries[i] for i in self._by_key.get(key, ())]
+
+    def course(self, code):
+        """Offerings of one course code ('csc 201', 'CUAB-ACC 103'); empty if unknown."""
+        return self._by_code.get(course_code_key(code), [])
+
+    def courses_in(self, text):
+        """Offerings of every known course code mentioned in ``text``."""
+        seen, out = set(), []
+        for prefix, number in COURSE_CODE_RE.findall(text):
+            key = f"{prefix.upper()}{number}"
+            if key not in seen:
+                seen.add(key)
+                out += self._by_code.get(key, [])
+        return out
+
+def paginate(items, page=1, page_size=10):
+    pages = max(1, -(-len(items) // page_size))
+    page = min(max(1, page), pages)
+    return {
+        "results": items[(page - 1) * page_size:page * page_size],
+        "total": len(items),
+        "page": page,
+        "page_size": page_size,
+        "pages": pages,
+    }
+
 # 🧾 Return specific course results for query
-def get_courses_for_query(query_info, course_data):
+def get_courses_for_query(query_info, course_data, page=1, page_size=10):
+    """Answers of every entry matching the query's department/level/semester, one page at a time.
+
+    Pass a CourseCatalog; a plain list from load_course_data is indexed on every call.
+    Returns None when nothing matches.
+    """
     if not query_info:
         return None
+    catalog = course_data if isinstance(course_data, CourseCatalog) else CourseCatalog(course_data)
+    matches = catalog.lookup(query_info.get("department"), query_info.get("level"), query_info.get("semester"))
+    if not matches:
+        return None
+    return paginate([entry["answer"] for entry in matches], page, page_size)
 
-    dept = query_info.get("department", "").lower()
-    level = query_info.get("level", "").lower() if query_info.get("level") else None
-    semester = query_info.get("semester", "").lower() if query_info.get("semester") else None
-
-    matches = []
-    for entry in course_data:
-        try:
-            if entry["department"].lower() != dept:
-                continue
-            if level and entry.get("level", "").lower() != level:
-                continue
-            if semester and semester not in entry.get("question", "").lower():
-                continue
-            matches.append(entry)
-        except KeyError:
-            continue
+# ⚡ Answer structured questions straight from the catalog (no embedding search)
+COURSE_WORDS_RE = re.compile(r"\b(courses?|subjects?|units?|credits?)\b", re.IGNORECASE)
+UNITS_QUESTION_RE = re.compile(r"\b(units?|credits?|title|called|name)\b", re.IGNORECASE)
 
-    if not matches:
+def answer_from_catalog(catalog, text, query_info, page=1, page_size=10):
+    """Markdown answer for course-listing and course-unit questions, or None to fall back to retrieval.
+
+    Listings need department, level and semester plus a course word in ``text``;
+    course codes are answered only when ``text`` asks for units or the title.
+    """
+    courses = catalog.courses_in(text) if UNITS_QUESTION_RE.search(text) else []
+    if courses:
+        lines = []
+        for c in courses:
+            where = ", ".join(filter(None, [c["department"] and c["department"].title(),
+                                            c["level"] and f"{c['level']} level",
+                                            c["semester"] and f"{c['semester']} semester"]))
+            lines.append(f"- **{c['code']}** {c['title']}: {c['units']} unit{'s' if c['units'] != 1 else ''}"
+                         + (f" ({where})" if where else ""))
+        return "\n".join(lines)
+
+    if not (query_info and query_info.get("department") and query_info.get("level")
+            and query_info.get("semester") and COURSE_WORDS_RE.search(text)):
+        return None
+    listing = get_courses_for_query(query_info, catalog, page, page_size)
+    if listing is None:
         return None
-    if len(matches) == 1:
-        return matches[0]["answer"]
-    else:
-        # 🛑 Only return one relevant answer (avoid dumping all results)
-        return matches[0]["answer"]
+    header = f"**{query_info['department']}, {query_info['level']} level, {query_info['semester']} semester**"
+    parts = [header]
+    for answer in listing["results"]:
+        parts.append("\n".join(f"- {item.strip()}" for item in answer.split("|") if item.strip()))
+    if listing["pages"] > 1:
+        first = (listing["page"] - 1) * page_size + 1
+        parts.append(f"_Showing {first}–{first + len(listing['results']) - 1} of {listing['total']}_")
+    return "\n\n".join(parts)
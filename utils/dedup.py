@@ -0,0 +1,171 @@
+"""
+Duplicate and near-duplicate passage removal at ingest time.
+
+Each passage is checked as it streams in, before anything is embedded:
+
+    exact   passages whose text is equal after lowercasing and dropping
+            punctuation / spacing (one hash per passage)
+    near    passages whose word 5-shingles overlap by at least DEDUP_THRESHOLD
+            (Jaccard) with an earlier passage. MinHash signatures banded into an
+            LSH table propose the candidates; each is confirmed on the real
+            shingle sets.
+
+The first passage of each group is kept and lists the later ones under
+``duplicates`` (their metadata without the text), so every merged source is
+still known. Passages are only merged with passages of the same ``same``
+fields (e.g. department / level), so partitioned retrieval keeps its slices.
+
+    DEDUP_MODE        off | exact | near                       (default: near)
+    DEDUP_THRESHOLD   shingle Jaccard that counts as a duplicate (default: 0.9)
+
+Run ``python -m utils.bench dedup`` for counts and timing over data/.
+"""
+
+import hashlib
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEDUP_MODES = ("off", "exact", "near")
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.9))
+SHINGLE = 5
+NUM_PERM = 64
+BANDS = 8  # 8 bands x 8 rows: pairs at Jaccard 0.9 become candidates 99% of the time
+PRIME = (1 << 31) - 1
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def dedup_mode(mode: Optional[str] = None) -> str:
+    mode = (mode or os.getenv("DEDUP_MODE", "near")).lower()
+    if mode not in DEDUP_MODES:
+        raise ValueError(f"Unknown dedup mode {mode!r}; expected one of {', '.join(DEDUP_MODES)}")
+    return mode
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(WORD_RE.findall(text.lower()))
+
+
+def content_hash(text: str) -> str:
+    return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def shingles(text: str, n: int = SHINGLE) -> np.ndarray:
+    """Sorted unique CRC32 hashes of the word ``n``-grams of ``text`` (the whole text when shorter)."""
+    words = normalize_text(text).split()
+    grams = [" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))]
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint32, count=len(grams)))
+
+
+class MinHasher:
+    """``num_perm`` universal hashes (a * x + b) mod 2^31 - 1; a signature is their minimum over the shingles."""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self.b = rng.integers(0, PRIME, size=(num_perm, 1), dtype=np.uint64)
+
+    def signature(self, shingle_hashes: np.ndarray) -> np.ndarray:
+        # a < 2^31 and x < 2^32, so the product fits in uint64
+        return ((self.a * shingle_hashes.astype(np.uint64)[None, :] + self.b) % PRIME).min(axis=1)
+
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    inter = len(np.intersect1d(a, b, assume_unique=True))
+    return inter / (len(a) + len(b) - inter) if inter else 0.0
+
+
+class Deduplicator:
+    """Streaming duplicate filter: ``filter(rows)`` yields each row unless it repeats an earlier kept one.
+
+    A duplicate is appended (metadata without text) to the ``duplicates`` list of
+    the kept row it repeats, which may already have been yielded: consumers that
+    keep the yielded dicts see the provenance complete once the stream ends.
+    Holds a hash and, for ``near``, one shingle set and LSH entry per kept row;
+    never the texts themselves.
+    """
+
+    def __init__(self, mode: Optional[str] = None, threshold: float = DEDUP_THRESHOLD,
+                 same: Sequence[str] = (), text_key: str = "text"):
+        self.mode = dedup_mode(mode)
+        self.threshold = threshold
+        self.same = tuple(same)
+        self.text_key = text_key
+        self.hasher = MinHasher()
+        self._exact: Dict[Tuple, Dict] = {}           # (group, content hash) -> kept row
+        self._buckets: Dict[Tuple, List[int]] = {}    # (group, band, signature rows) -> kept positions
+        self._kept: List[Tuple[Dict, np.ndarray]] = []  # kept rows eligible for near matching, with shingles
+        self._removed = Counter()
+        self.report = {"mode": self.mode, "input": 0, "exact": 0, "near": 0, "kept": 0, "removed_by_source": {}}
+
+    def _lsh_keys(self, group: Tuple, sets: np.ndarray) -> List[Tuple]:
+        sig = self.hasher.signature(sets)
+        rows = NUM_PERM // BANDS
+        return [(group, band, sig[band * rows:(band + 1) * rows].tobytes()) for band in range(BANDS)]
+
+    def _near_match(self, keys: List[Tuple], sets: np.ndarray) -> Optional[Dict]:
+        """Earliest kept row sharing an LSH band whose shingle Jaccard reaches ``threshold``."""
+        for i in sorted({i for key in keys for i in self._buckets.get(key, ())}):
+            row, other = self._kept[i]
+            if jaccard(sets, other) >= self.threshold:
+                return row
+        return None
+
+    def filter(self, rows: Iterable[Dict]) -> Iterator[Dict]:
+        for row in rows:
+            self.report["input"] += 1
+            if self.mode == "off":
+                self.report["kept"] += 1
+                yield row
+                continue
+            group = tuple(str(row.get(f)) for f in self.same)
+            text = row.get(self.text_key, "")
+            key = (group, content_hash(text))
+            kept = self._exact.get(key)
+            if kept is not None:
+                self.report["exact"] += 1
+            elif self.mode == "near":
+                sets = shingles(text)
+                keys = self._lsh_keys(group, sets)
+                kept = self._near_match(keys, sets)
+                if kept is not None:
+                    self.report["near"] += 1
+
+            if kept is None:
+                kept = self._exact[key] = dict(row)
+                if self.mode == "near":
+                    for lsh_key in keys:
+                        self._buckets.setdefault(lsh_key, []).append(len(self._kept))
+                    self._kept.append((kept, sets))
+                self.report["kept"] += 1
+                yield kept
+                continue
+            kept.setdefault("duplicates", []).append({k: v for k, v in row.items() if k != self.text_key})
+            self._removed[row.get("source", "")] += 1
+            self.report["removed_by_source"] = dict(self._removed)
+
+
+def deduplicate(rows: Iterable[Dict], mode: Optional[str] = None, threshold: float = DEDUP_THRESHOLD,
+                same: Sequence[str] = (), text_key: str = "text") -> Tuple[List[Dict], Dict]:
+    """Drop duplicate rows, keeping the first of each group with the rest under ``duplicates``.
+
+    Returns the kept rows (in input order) and a report: counts per pass and removed rows per source.
+    """
+    dedup = Deduplicator(mode, threshold, same, text_key)
+    kept = list(dedup.filter(rows))
+    return kept, dedup.report
+
+
+def format_report(report: Dict) -> str:
+    removed = report["input"] - report["kept"]
+    share = removed / report["input"] if report["input"] else 0.0
+    lines = [f"Dedup ({report['mode']}): {report['input']} passages -> {report['kept']} "
+             f"({removed} removed, {share:.1%}: {report['exact']} exact, {report['near']} near-duplicate)"]
+    for source, n in sorted(report["removed_by_source"].items(), key=lambda kv: -kv[1]):
+        lines.append(f"  {source or '(no source)'}: {n} removed")
+    return "\n".join(lines)
@@ -0,0 +1,119 @@
+"""
+Content-addressed embedding cache for index builds.
+
+Vectors are kept per embedding model under ``<cache_dir>/<model>/`` as a
+``vectors.npy`` matrix plus a ``keys.json`` list of SHA-1 digests of the chunk
+text. A rebuild looks every chunk up by its digest and only sends the misses
+to the encoder, in a single batch.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Set
+
+import numpy as np
+
+from utils.textnorm import slug
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str, model_name: str):
+        self.model_name = model_name
+        self.path = Path(cache_dir) / slug(model_name)
+        self._vectors: Dict[str, np.ndarray] = {}
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0}
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def _load(self):
+        keys_path, vecs_path = self.path / "keys.json", self.path / "vectors.npy"
+        if not keys_path.exists() or not vecs_path.exists():
+            return
+        try:
+            keys = json.loads(keys_path.read_text(encoding="utf-8"))
+            vecs = np.load(vecs_path)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable embedding cache {self.path}: {e}")
+            return
+        if len(keys) != len(vecs):
+            print(f"Ignoring inconsistent embedding cache {self.path}")
+            return
+        self._vectors = dict(zip(keys, vecs))
+
+    def save(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        keys = list(self._vectors)
+        vecs = np.stack([self._vectors[k] for k in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+        # write to temp files first so a crash never leaves keys and vectors out of step
+        np.save(self.path / "vectors.tmp.npy", vecs)
+        (self.path / "keys.tmp.json").write_text(json.dumps(keys), encoding="utf-8")
+        os.replace(self.path / "vectors.tmp.npy", self.path / "vectors.npy")
+        os.replace(self.path / "keys.tmp.json", self.path / "keys.json")
+
+    def _encode_missing(self, model, texts: List[str], keys: List[str], batch_size: int,
+                        show_progress_bar: bool) -> int:
+        missing: Dict[str, int] = {}
+        for i, k in enumerate(keys):
+            if k not in self._vectors and k not in missing:
+                missing[k] = i
+        if missing:
+            embs = model.encode([texts[i] for i in missing.values()], batch_size=batch_size,
+                                convert_to_numpy=True, normalize_embeddings=True,
+                                show_progress_bar=show_progress_bar)
+            for k, vec in zip(missing, embs.astype(np.float32)):
+                self._vectors[k] = vec
+        return len(missing)
+
+    def _prune(self, live: Set[str]) -> int:
+        stale = [k for k in self._vectors if k not in live]
+        for k in stale:
+            del self._vectors[k]
+        return len(stale)
+
+    def _finish(self, hits: int, misses: int, evicted: int):
+        if misses or evicted:
+            self.save()
+        self.stats = {"hits": hits, "misses": misses, "evicted": evicted}
+        print(f"Embedding cache ({self.model_name}): {self.stats['hits']} hits, "
+              f"{self.stats['misses']} misses, {self.stats['evicted']} evicted")
+
+    def encode(self, model, texts: List[str], batch_size: int = 64,
+               show_progress_bar: bool = False, prune: bool = True) -> np.ndarray:
+        """Return L2-normalized float32 embeddings for ``texts``, encoding only cache misses.
+
+        With ``prune`` the cache is trimmed to exactly the chunks in ``texts``,
+        so entries for removed or edited chunks do not accumulate.
+        """
+        keys = [text_key(t) for t in texts]
+        misses = self._encode_missing(model, texts, keys, batch_size, show_progress_bar)
+        evicted = self._prune(set(keys)) if prune else 0
+        self._finish(len(texts) - misses, misses, evicted)
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([self._vectors[k] for k in keys])
+
+    def encode_batches(self, model, batches: Iterable[List[str]], batch_size: int = 64,
+                       prune: bool = True) -> Iterator[np.ndarray]:
+        """``encode`` over a stream of text batches, yielding each batch's embeddings as it is ready.
+
+        The cache is pruned (to every chunk seen) and saved once, after the last batch.
+        """
+        live: Set[str] = set()
+        hits = misses = 0
+        for texts in batches:
+            keys = [text_key(t) for t in texts]
+            live.update(keys)
+            missed = self._encode_missing(model, texts, keys, batch_size, False)
+            hits, misses = hits + len(texts) - missed, misses + missed
+            if keys:
+                yield np.stack([self._vectors[k] for k in keys])
+        # an empty stream says nothing about which chunks are stale
+        self._finish(hits, misses, self._prune(live) if prune and live else 0)
@@ -1,18 +1,178 @@
+import hashlib
 import json
-import pandas as pd
-from sentence_transformers import SentenceTransformer
-import torch
+import os
+from pathlib import Path
+
+import numpy as np
+
+from utils.textnorm import slug
+
+# torch, sentence_transformers and pandas take seconds to import, so they are
+# imported inside the functions that need them rather than at module load
+
+EMBEDDING_BACKENDS = ("torch", "int8", "onnx")
+
+
+def embedder_id(model_name, backend=None):
+    """Name used to key caches, so vectors from different backends never mix"""
+    backend = (backend or os.getenv("EMBEDDING_BACKEND", "torch")).lower()
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+class OnnxEmbedder:
+    """ONNX Runtime drop-in for the parts of SentenceTransformer.encode we use.
+
+    The transformer is exported once to ``<onnx_dir>/model.onnx``; tokenization,
+    mean pooling and normalization stay in Python.
+    """
+
+    def __init__(self, st_model, onnx_dir):
+        import onnxruntime as ort
+
+        self.tokenizer = st_model.tokenizer
+        self.max_seq_length = st_model.max_seq_length
+        self.dim = st_model.get_sentence_embedding_dimension()
+        # the MiniLM family ends in a Normalize module; reproduce it so vectors match fp32
+        self.normalize = any(type(m).__name__ == "Normalize" for m in st_model)
+        path = Path(onnx_dir) / "model.onnx"
+        if not path.exists():
+            self._export(st_model[0].auto_model, path)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(path), opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _export(self, auto_model, path):
+        import inspect
+        import torch
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        sample = self.tokenizer(["export sample"], return_tensors="pt")
+        names = list(sample.keys())
+        kwargs = {}
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            kwargs["dynamo"] = False
+        auto_model.eval()
+
+        class _Wrapper(torch.nn.Module):
+            # pass inputs by name; positional order of forward() differs across transformers versions
+            def __init__(self, inner):
+                super().__init__()
+                self.inner = inner
+
+            def forward(self, *tensors):
+                return self.inner(**dict(zip(names, tensors)))[0]
+
+        torch.onnx.export(
+            _Wrapper(auto_model), tuple(sample[n] for n in names), str(path),
+            input_names=names, output_names=["last_hidden_state"],
+            dynamic_axes={**{n: {0: "batch", 1: "seq"} for n in names}, "last_hidden_state": {0: "batch", 1: "seq"}},
+            opset_version=14, **kwargs,
+        )
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, convert_to_tensor=False,
+               normalize_embeddings=False, show_progress_bar=False, **_):
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        out = []
+        for i in range(0, len(sentences), batch_size):
+            enc = self.tokenizer(sentences[i:i + batch_size], padding=True, truncation=True,
+                                 max_length=self.max_seq_length, return_tensors="np")
+            feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            out.append((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None))
+        embs = np.concatenate(out) if out else np.zeros((0, self.dim), dtype=np.float32)
+        if self.normalize or normalize_embeddings:
+            embs = embs / np.clip(np.linalg.norm(embs, axis=1, keepdims=True), 1e-12, None)
+        embs = embs.astype(np.float32)
+        if single:
+            embs = embs[0]
+        if convert_to_tensor:
+            import torch
+            return torch.from_numpy(embs)
+        return embs
+
+
+def load_embedder(model_name="all-MiniLM-L6-v2", backend=None, cache_folder=None):
+    """Load the sentence embedder on the backend chosen by ``backend`` or EMBEDDING_BACKEND.
+
+    torch  - fp32 PyTorch (default)
+    int8   - PyTorch with dynamic int8 quantization of the Linear layers
+    onnx   - exported ONNX graph run by ONNX Runtime
+    """
+    backend = (backend or os.getenv("EMBEDDING_BACKEND", "torch")).lower()
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(EMBEDDING_BACKENDS)}")
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name, cache_folder=cache_folder, device="cpu")
+    if backend == "int8":
+        import torch
+        model[0].auto_model = torch.quantization.quantize_dynamic(
+            model[0].auto_model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif backend == "onnx":
+        onnx_root = Path(os.getenv("ONNX_CACHE_DIR", Path(cache_folder or "data/model_cache") / "onnx"))
+        return OnnxEmbedder(model, onnx_root / slug(model_name))
+    return model
+
 
 def load_model(model_name="all-MiniLM-L6-v2"):
     """Load SentenceTransformer model"""
-    return SentenceTransformer(model_name)
+    return load_embedder(model_name)
 
 def load_dataset(path="data/crescent_qa.json"):
     """Load Q&A dataset from JSON into pandas DataFrame"""
+    import pandas as pd
     with open(path, "r", encoding="utf-8") as f:
         data = json.load(f)
     return pd.DataFrame(data)
 
+def load_records(path="data/crescent_qa.json"):
+    """Load Q&A dataset from JSON as a list of dicts (no DataFrame)"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [r for r in json.load(f) if isinstance(r, dict)]
+
 def compute_question_embeddings(questions, model):
     """Compute sentence embeddings for a list of questions"""
     return model.encode(questions, convert_to_tensor=True, show_progress_bar=True)
+
+def questions_digest(questions):
+    """SHA-1 over the question texts in order; answers can change without re-encoding"""
+    h = hashlib.sha1()
+    for q in questions:
+        h.update(q.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def load_question_embeddings(questions, model_name="all-MiniLM-L6-v2", cache_dir="data/embed_cache", get_model=None):
+    """L2-normalized float32 question embeddings, memory-mapped from ``<cache_dir>/<model>/questions.npy``.
+
+    ``questions.json`` next to the matrix records the questions digest and
+    embedder; the questions are re-encoded (loading the model through
+    ``get_model``) only when either changed, so a restart just maps the file.
+    """
+    model_id = embedder_id(model_name)
+    path = Path(cache_dir) / slug(model_id)
+    vecs_path, meta_path = path / "questions.npy", path / "questions.json"
+    meta = {"digest": questions_digest(questions), "model": model_id, "count": len(questions)}
+    try:
+        if json.loads(meta_path.read_text(encoding="utf-8")) == meta:
+            vecs = np.load(vecs_path, mmap_mode="r")
+            if vecs.shape[0] == len(questions):
+                return vecs
+    except (OSError, ValueError):
+        pass  # missing or unreadable: rebuild below
+
+    model = get_model() if get_model else load_model(model_name)
+    vecs = model.encode(questions, batch_size=64, convert_to_numpy=True, normalize_embeddings=True,
+                        show_progress_bar=True).astype(np.float32)
+    path.mkdir(parents=True, exist_ok=True)
+    # matrix first, digest last: a crash in between leaves a stale digest and forces a rebuild
+    np.save(path / "questions.tmp.npy", vecs)
+    os.replace(path / "questions.tmp.npy", vecs_path)
+    (path / "questions.tmp.json").write_text(json.dumps(meta), encoding="utf-8")
+    os.replace(path / "questions.tmp.json", meta_path)
+    return np.load(vecs_path, mmap_mode="r")
@@ -0,0 +1,235 @@
+"""
+FAISS index factory shared by app.rag and utils.rag_pipeline.
+
+Index type and parameters come from the environment unless a config dict is
+passed explicitly:
+
+    INDEX_TYPE             flat | hnsw | ivf_flat | ivf_pq | sq8 | fp16   (default: flat)
+    INDEX_NLIST            IVF cells, 0 = 4 * sqrt(n)                      (default: 0)
+    INDEX_NPROBE           IVF cells visited per query                     (default: 8)
+    INDEX_HNSW_M           HNSW neighbours per node                        (default: 32)
+    INDEX_EF_CONSTRUCTION  HNSW build-time beam width                      (default: 80)
+    INDEX_EF_SEARCH        HNSW query-time beam width                      (default: 64)
+    INDEX_PQ_M             PQ sub-quantizers, must divide the dimension    (default: 48)
+    INDEX_TRAIN_SAMPLE     vectors buffered to train IVF types when the
+                           index is built from a stream of batches         (default: 50000)
+    FAISS_MMAP             1 = open saved indexes memory-mapped, read-only (default: 1)
+
+All types use inner product on L2-normalized vectors, i.e. cosine similarity.
+Run ``python -m utils.bench index`` to compare recall and latency on our corpus.
+
+Memory-mapped indexes are served from the OS page cache, so every worker
+process on a host shares one copy of the vectors (``python -m utils.bench
+load`` compares this with a heap load). They are read-only: callers that
+mutate an index must reload it with ``mmap=False`` first.
+"""
+
+import math
+import os
+import tempfile
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import faiss  # imported on first use; it is not needed until an index is built or read
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq", "sq8", "fp16")
+INDEX_TRAIN_SAMPLE = int(os.getenv("INDEX_TRAIN_SAMPLE", 50000))
+
+
+def index_config_from_env() -> Dict:
+    return {
+        "type": os.getenv("INDEX_TYPE", "flat").lower(),
+        "nlist": int(os.getenv("INDEX_NLIST", 0)),
+        "nprobe": int(os.getenv("INDEX_NPROBE", 8)),
+        "hnsw_m": int(os.getenv("INDEX_HNSW_M", 32)),
+        "ef_construction": int(os.getenv("INDEX_EF_CONSTRUCTION", 80)),
+        "ef_search": int(os.getenv("INDEX_EF_SEARCH", 64)),
+        "pq_m": int(os.getenv("INDEX_PQ_M", 48)),
+    }
+
+
+def _resolve(config: Optional[Dict]) -> Dict:
+    cfg = {**index_config_from_env(), **(config or {})}
+    if cfg["type"] not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {cfg['type']!r}; expected one of {', '.join(INDEX_TYPES)}")
+    return cfg
+
+
+def _new_index(dim: int, n: int, cfg: Dict) -> "faiss.Index":
+    import faiss
+    kind, metric = cfg["type"], faiss.METRIC_INNER_PRODUCT
+    if kind == "flat":
+        return faiss.IndexFlatIP(dim)
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, cfg["hnsw_m"], metric)
+        index.hnsw.efConstruction = cfg["ef_construction"]
+        return index
+    if kind == "sq8":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, metric)
+    if kind == "fp16":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, metric)
+
+    # IVF variants: never ask for more cells than there are vectors to train on
+    nlist = min(cfg["nlist"] or max(1, int(4 * math.sqrt(n))), max(1, n))
+    quantizer = faiss.IndexFlatIP(dim)
+    if kind == "ivf_flat":
+        return faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+    pq_m = max(m for m in range(1, min(cfg["pq_m"], dim) + 1) if dim % m == 0)
+    nbits = min(8, max(1, int(math.log2(max(n, 2)))))  # PQ training needs >= 2**nbits points
+    return faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, nbits, metric)
+
+
+def _inner(index: "faiss.Index") -> "faiss.Index":
+    import faiss
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def set_search_params(index: "faiss.Index", config: Optional[Dict] = None) -> "faiss.Index":
+    """Apply query-time parameters (nprobe / efSearch); no-op for types without them."""
+    cfg = _resolve(config)
+    inner = _inner(index)
+    if hasattr(inner, "nprobe"):
+        inner.nprobe = min(cfg["nprobe"], inner.nlist)
+    if hasattr(inner, "hnsw"):
+        inner.hnsw.efSearch = cfg["ef_search"]
+    return index
+
+
+def reconstruct_ids(index: "faiss.Index", ids: np.ndarray) -> Optional[np.ndarray]:
+    """Stored vectors of ``ids`` (decoded for SQ/PQ), or None when the index type cannot return them."""
+    try:
+        return index.reconstruct_batch(np.ascontiguousarray(ids, dtype=np.int64))
+    except RuntimeError:
+        return None  # e.g. IVF without a direct map
+
+
+def search_params(index: "faiss.Index", ids: np.ndarray):
+    """SearchParameters restricting a search to ``ids`` (external ids for IDMap indexes).
+
+    Carries the index's own nprobe / efSearch, since per-call parameters
+    replace them for that search.
+    """
+    import faiss
+    sel = faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype=np.int64))
+    inner = _inner(index)
+    if hasattr(inner, "nprobe"):
+        params = faiss.SearchParametersIVF(sel=sel, nprobe=inner.nprobe)
+    elif hasattr(inner, "hnsw"):
+        params = faiss.SearchParametersHNSW(sel=sel, efSearch=inner.hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters(sel=sel)
+    params._sel = sel  # the SWIG params object does not keep the selector alive
+    return params
+
+
+class IndexWriter:
+    """Builds an index of the configured type from embedding batches.
+
+    Only the current batch is held, except for IVF types, which buffer the
+    first ``train_size`` vectors to train on before anything is added; a
+    stream shorter than that trains on all of it, as ``build_faiss_index`` does.
+    """
+
+    def __init__(self, config: Optional[Dict] = None, with_ids: bool = False,
+                 train_size: int = INDEX_TRAIN_SAMPLE):
+        self.cfg = _resolve(config)
+        self.with_ids = with_ids
+        self.train_size = train_size
+        self.index: Optional["faiss.Index"] = None
+        self._pending: List[Tuple[np.ndarray, Optional[np.ndarray]]] = []
+        self._pending_rows = 0
+
+    @property
+    def ntotal(self) -> int:
+        return (self.index.ntotal if self.index is not None else 0) + self._pending_rows
+
+    def add(self, embs: np.ndarray, ids: Optional[np.ndarray] = None):
+        embs = np.ascontiguousarray(embs, dtype=np.float32)
+        if not len(embs):
+            return
+        if self.with_ids and ids is None:
+            raise ValueError("This writer stores ids; pass ids with every batch")
+        if self.index is not None:
+            self._add(embs, ids)
+            return
+        self._pending.append((embs, ids))
+        self._pending_rows += len(embs)
+        if not self.cfg["type"].startswith("ivf") or self._pending_rows >= self.train_size:
+            self._start()
+
+    def _start(self):
+        import faiss
+        embs = np.concatenate([e for e, _ in self._pending])
+        ids = np.concatenate([i for _, i in self._pending]) if self.with_ids else None
+        self._pending, self._pending_rows = [], 0
+        index = _new_index(embs.shape[1], len(embs), self.cfg)
+        if not index.is_trained:
+            index.train(embs)
+        self.index = faiss.IndexIDMap2(index) if self.with_ids else index
+        self._add(embs, ids)
+
+    def _add(self, embs: np.ndarray, ids: Optional[np.ndarray]):
+        if self.with_ids:
+            self.index.add_with_ids(embs, np.asarray(ids, dtype=np.int64))
+        else:
+            self.index.add(embs)
+
+    def finish(self) -> Optional["faiss.Index"]:
+        """The filled index with its search parameters set, or None if no vectors were added."""
+        if self.index is None and self._pending:
+            self._start()
+        return set_search_params(self.index, self.cfg) if self.index is not None else None
+
+
+def build_faiss_index(embs: np.ndarray, config: Optional[Dict] = None,
+                      ids: Optional[np.ndarray] = None) -> "faiss.Index":
+    """Train (if needed) and fill an index of the configured type.
+
+    With ``ids`` the index is wrapped in an IndexIDMap2 so vectors keep
+    stable ids; otherwise ids are the row positions in ``embs``.
+    """
+    writer = IndexWriter(config, with_ids=ids is not None, train_size=len(embs))
+    writer.add(embs, ids)
+    return writer.finish()
+
+
+def supports_removal(index: "faiss.Index") -> bool:
+    return not hasattr(_inner(index), "hnsw")
+
+
+def mmap_enabled() -> bool:
+    return os.getenv("FAISS_MMAP", "1") != "0"
+
+
+def read_faiss_index(path: str, mmap: Optional[bool] = None) -> Tuple["faiss.Index", bool]:
+    """Read an index, memory-mapped and read-only when possible; returns (index, is_mapped)."""
+    import faiss
+    use_mmap = mmap_enabled() if mmap is None else mmap
+    if use_mmap:
+        # IO_FLAG_MMAP_IFC (newer faiss) also maps flat codes and HNSW storage;
+        # plain IO_FLAG_MMAP only maps IVF inverted lists
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        try:
+            return faiss.read_index(str(path), flags), True
+        except RuntimeError as e:
+            print(f"Could not memory-map {path}, loading into memory instead: {e}")
+    return faiss.read_index(str(path)), False
+
+
+def write_faiss_index(index: "faiss.Index", path: str):
+    """Write via a temp file and rename, so processes mapping the old file never see a partial one."""
+    import faiss
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".faiss.tmp")
+    os.close(fd)
+    try:
+        faiss.write_index(index, tmp)
+        os.replace(tmp, path)
+    except Exception:
+        os.unlink(tmp)
+        raise
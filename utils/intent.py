@@ -0,0 +1,119 @@
+"""
+Single-pass intent routing for chat messages.
+
+All greeting keywords and small-talk patterns from utils.greetings and the
+level / semester / faculty patterns from utils.course_query are compiled
+once into one alternation of named groups. ``IntentRouter.route`` lowercases
+a message once and scans it once, returning the intent and course slots;
+departments come from the shared course_query.DEPARTMENT_FINDER automaton, so
+the router and normalize_department agree (the first department named wins):
+
+    greeting  a greeting keyword appears          (same precedence as before:
+    social    a small-talk pattern matches         greeting > social > course)
+    course    a department, level or semester was found
+    query     anything else
+
+Run ``python -m utils.bench intent`` to compare it with the old step-by-step checks.
+"""
+
+import random
+import re
+from typing import Dict, Optional
+
+from utils.course_query import DEPARTMENT_FINDER, DEPARTMENT_TO_FACULTY_MAP, fuzzy_match_department
+from utils.greetings import GREETING_KEYWORDS, GREETING_RESPONSES, SOCIAL_PATTERNS
+
+
+def _alternation(words) -> str:
+    # longest first so "computer science" wins over a shorter alias at the same position
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+class IntentRouter:
+    def __init__(self, greeting_keywords=GREETING_KEYWORDS, social_patterns=SOCIAL_PATTERNS,
+                 department_finder=DEPARTMENT_FINDER):
+        self.social_patterns = list(social_patterns)
+        # department names and aliases ("comp sci", "biochem") -> canonical name
+        self.department_finder = department_finder
+        # faculty codes ("cohes", "bacolaw"); a faculty with a single department also implies it
+        members: Dict[str, list] = {}
+        for dept, faculty in DEPARTMENT_TO_FACULTY_MAP.items():
+            members.setdefault(faculty.lower(), []).append(dept)
+        self._faculties = {code: depts[0] if len(depts) == 1 else None for code, depts in members.items()}
+
+        # every alternative is anchored at a word start; hoisting that \b in front of
+        # the alternation lets the scanner skip mid-word positions without trying them all
+        anchored = [rf"(?P<greeting>(?:{_alternation(greeting_keywords)})\b)"]
+        unanchored = []
+        # each social pattern gets its own group so the match says which one fired
+        for i, pattern in enumerate(self.social_patterns):
+            if pattern.startswith(r"\b"):
+                anchored.append(f"(?P<social{i}>{pattern[2:]})")
+            else:
+                unanchored.append(f"(?P<social{i}>{pattern})")
+        anchored += [
+            r"(?P<level>(?:100|200|300|400)\s*(?:level|lvl)\b)",
+            r"(?P<semester>(?:first|second)\s*sem(?:ester)?\b)",
+            rf"(?P<faculty>(?:{_alternation(self._faculties)})\b)",
+        ]
+        self.pattern = re.compile("|".join([rf"\b(?:{'|'.join(anchored)})"] + unanchored))
+
+    def route(self, text: str, fuzzy: bool = True) -> Dict:
+        """Classify ``text`` and extract course slots in one scan.
+
+        ``fuzzy`` falls back to fuzzy department matching (as extract_course_query
+        does) when no department name appears literally.
+        """
+        found: Dict[str, Optional[str]] = {"greeting": None, "social": None, "level": None,
+                                           "semester": None, "faculty": None}
+        text = text.lower()
+        for m in self.pattern.finditer(text):
+            kind = m.lastgroup
+            if kind.startswith("social"):
+                kind, value = "social", self.social_patterns[int(kind[6:])]
+            else:
+                value = m.group(kind)
+            if found[kind] is None:
+                found[kind] = value
+
+        departments = self.department_finder.find(text)
+        if departments:
+            department = departments[0]
+        elif found["faculty"]:
+            department = self._faculties[found["faculty"]]
+        else:
+            department = None
+        if department is None and not found["faculty"] and fuzzy and not (found["greeting"] or found["social"]):
+            department = fuzzy_match_department(text)
+        faculty = DEPARTMENT_TO_FACULTY_MAP.get(department) if department else None
+        slots = {
+            "level": found["level"][:3] if found["level"] else None,
+            "semester": ("First" if found["semester"].startswith("first") else "Second") if found["semester"] else None,
+            "department": department.title() if department else None,
+            "faculty": faculty or (found["faculty"].upper() if found["faculty"] else None),
+        }
+        if found["greeting"]:
+            intent = "greeting"
+        elif found["social"]:
+            intent = "social"
+        elif any(slots.values()):
+            intent = "course"
+        else:
+            intent = "query"
+        return {"intent": intent, "social_pattern": found["social"], **slots}
+
+    def course_slots(self, text: str) -> Dict:
+        """Drop-in for extract_course_query: level, semester, department, faculty."""
+        route = self.route(text)
+        return {key: route[key] for key in ("level", "semester", "department", "faculty")}
+
+    def reply(self, route: Dict) -> Optional[str]:
+        """Canned reply for greeting and social intents, None for the rest."""
+        if route["intent"] == "greeting":
+            return random.choice(GREETING_RESPONSES)
+        if route["intent"] == "social":
+            return random.choice(SOCIAL_PATTERNS[route["social_pattern"]])
+        return None
+
+
+intent_router = IntentRouter()
@@ -1,8 +1,21 @@
 # memory.py
+import atexit
+import os
+import queue
 import streamlit as st
 import sqlite3
+import threading
+import uuid
+from collections import OrderedDict, deque
 from datetime import datetime
 
+DB_PATH = "RAG-MODEL/user_history.db"
+ANONYMOUS_USER = ""  # rows written before history was per user, and callers without a session
+SCHEMA_VERSION = 1
+
+HISTORY_COLUMNS = ("timestamp", "user_query", "response", "department", "level", "semester", "sentiment", "keywords")
+INSERT_SQL = f"INSERT INTO history ({', '.join(HISTORY_COLUMNS)}, user_id) VALUES ({', '.join('?' * (len(HISTORY_COLUMNS) + 1))})"
+
 def init_memory():
     """Initialize short-term memory in session_state."""
     if "last_query_info" not in st.session_state:
@@ -17,70 +30,247 @@ def init_memory():
         st.session_state["messages"] = []
     if "bot_greeted" not in st.session_state:
         st.session_state["bot_greeted"] = False
+    if "user_id" not in st.session_state:
+        st.session_state["user_id"] = uuid.uuid4().hex  # keys this session's long-term history
+
+# --------------------------- Long-term memory (SQLite)
+def _row_key(row):
+    # rows read back from SQLite have TEXT affinity; compare saved rows the same way
+    return tuple(None if v is None else str(v) for v in row)
+
+class HistoryStore:
+    """Long-lived SQLite access with write-behind inserts.
+
+    Two long-lived connections in WAL mode, so readers never wait for the
+    writer: one reader shared by all threads (queries are short and run one at
+    a time under a lock; Streamlit reruns on fresh threads, so per-thread
+    connections would never be closed) and one owned by the writer thread.
+    ``save`` only enqueues the row; a background thread writes everything
+    queued so far in a single transaction, so batches grow with load without
+    adding latency when idle. Limits come from the environment:
+
+        MEMORY_QUEUE_SIZE     rows waiting to be written before ``save`` blocks  (default: 1000)
+        MEMORY_BATCH_SIZE     max rows per transaction                          (default: 256)
+        MEMORY_CONTEXT_ROWS   recent rows kept in process per user              (default: 10)
+        MEMORY_CONTEXT_USERS  users whose recent rows are kept (LRU)            (default: 10000)
+
+    Each user's most recent rows are cached in process and updated by
+    ``save``, so ``recent`` answers from memory after the first (indexed)
+    lookup, however large the table grows. Other reads flush pending writes
+    first, and the queue is flushed at interpreter exit.
+    """
+
+    def __init__(self, db_path=DB_PATH, max_queue=None, batch_size=None):
+        self.db_path = db_path
+        self.batch_size = batch_size or int(os.getenv("MEMORY_BATCH_SIZE", 256))
+        self.context_rows = int(os.getenv("MEMORY_CONTEXT_ROWS", 10))
+        self.context_users = int(os.getenv("MEMORY_CONTEXT_USERS", 10000))
+        self._recent = OrderedDict()  # user_id -> deque of rows, newest first
+        self._recent_lock = threading.Lock()
+        self._loading = {}  # user_id -> rows saved while that user's history is being read
+        self.context_hits = 0
+        self.context_misses = 0
+        self._queue = queue.Queue(maxsize=max_queue or int(os.getenv("MEMORY_QUEUE_SIZE", 1000)))
+        self._reader = self._connect()
+        self._reader_lock = threading.Lock()
+        self._closed = False
+        self.batches = 0
+        self.rows = 0
+        self._create_schema()
+        self._thread = threading.Thread(target=self._writer, name="history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent; only the last commits can be lost on power failure
+        return conn
+
+    def _create_schema(self):
+        conn = self._reader
+        with self._reader_lock, conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT,
+                user_query TEXT,
+                response TEXT,
+                department TEXT,
+                level TEXT,
+                semester TEXT,
+                sentiment TEXT,
+                keywords TEXT,
+                user_id TEXT NOT NULL DEFAULT ''
+            )""")
+            self._migrate(conn)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_history_user_time ON history (user_id, timestamp)")
+
+    def _migrate(self, conn):
+        """Bring databases created by older versions up to SCHEMA_VERSION."""
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            # v1: per-user history; existing rows belong to no session
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(history)")}
+            if "user_id" not in columns:
+                conn.execute("ALTER TABLE history ADD COLUMN user_id TEXT NOT NULL DEFAULT ''")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def save(self, row, user_id=ANONYMOUS_USER):
+        """Queue one history row (HISTORY_COLUMNS order); blocks while the queue is full (backpressure)."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("HistoryStore is closed")
+        with self._recent_lock:
+            # users not cached yet are loaded from the database on their next read
+            recent = self._recent.get(user_id)
+            if recent is not None:
+                recent.appendleft(row)
+            loading = self._loading.get(user_id)
+            if loading is not None:
+                loading.append(row)
+        self._queue.put((*row, user_id))
+
+    def recent(self, user_id=ANONYMOUS_USER, limit=10):
+        """The user's ``limit`` most recent rows, newest first; from memory when cached."""
+        with self._recent_lock:
+            recent = self._recent.get(user_id)
+            if recent is not None and limit <= self.context_rows:
+                self._recent.move_to_end(user_id)
+                self.context_hits += 1
+                return list(recent)[:limit]
+            self.context_misses += 1
+            saved_meanwhile = self._loading.setdefault(user_id, [])
+        # flushing waits for the whole write queue: do it, and the query, without holding the lock
+        rows = self.fetch(f"SELECT {', '.join(HISTORY_COLUMNS)} FROM history WHERE user_id = ? "
+                          "ORDER BY timestamp DESC, id DESC LIMIT ?", (user_id, max(limit, self.context_rows)))
+        with self._recent_lock:
+            if self._loading.get(user_id) is saved_meanwhile:
+                del self._loading[user_id]
+            recent = self._recent.get(user_id)
+            if recent is not None and limit <= self.context_rows:
+                # another reader filled the cache first, with everything saved up to then
+                return list(recent)[:limit]
+            # turns saved during the read that it did not see yet, newest first
+            loaded = {_row_key(r) for r in rows}
+            rows = [r for r in reversed(saved_meanwhile) if _row_key(r) not in loaded] + rows
+            self._recent[user_id] = deque(rows[:self.context_rows], maxlen=self.context_rows)
+            self._recent.move_to_end(user_id)
+            while len(self._recent) > self.context_users:
+                self._recent.popitem(last=False)
+        return rows[:limit]
+
+    def flush(self):
+        """Wait until every queued row has been committed."""
+        self._queue.join()
 
-def init_database(db_path="RAG-MODEL/user_history.db"):
+    def fetch(self, sql, params=()):
+        self.flush()
+        with self._reader_lock:
+            return self._reader.execute(sql, params).fetchall()
+
+    def stats(self):
+        return {"queue_depth": self._queue.qsize(), "batches": self.batches, "rows": self.rows,
+                "avg_batch_size": self.rows / self.batches if self.batches else 0.0,
+                "context_users": len(self._recent), "context_hits": self.context_hits,
+                "context_misses": self.context_misses}
+
+    def _writer(self):
+        conn = self._connect()
+        try:
+            self._write_batches(conn)
+        finally:
+            conn.close()
+
+    def _write_batches(self, conn):
+        while True:
+            batch = [self._queue.get()]
+            # group commit: take whatever queued up while the last transaction ran
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [row for row in batch if row is not None]
+            try:
+                if rows:
+                    self._insert(conn, rows)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if batch[-1] is None:
+                return
+
+    def _insert(self, conn, rows):
+        """Commit ``rows`` in one transaction; if that fails, row by row so only the bad rows are lost.
+
+        Never raises: the writer thread must outlive any row, or flush() and every read would wait forever.
+        """
+        try:
+            with conn:  # one transaction for the whole batch
+                conn.executemany(INSERT_SQL, rows)
+            self.batches += 1
+            self.rows += len(rows)
+            return
+        except Exception as e:
+            if len(rows) == 1:
+                print(f"Failed to save interaction: {e}")
+                return
+        for row in rows:
+            self._insert(conn, [row])
+
+    def close(self):
+        """Flush pending rows, stop the writer and close all connections."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()  # the writer closes its own connection
+        with self._reader_lock:
+            self._reader.close()
+        atexit.unregister(self.close)
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(db_path=DB_PATH):
+    """Shared HistoryStore for ``db_path``, created on first use."""
+    store = _stores.get(db_path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(db_path)
+            if store is None:
+                store = _stores[db_path] = HistoryStore(db_path)
+    return store
+
+def init_database(db_path=DB_PATH):
     """Initialize SQLite database for long-term memory."""
-    conn = None
     try:
-        conn = sqlite3.connect(db_path, check_same_thread=False)
-        c = conn.cursor()
-        c.execute("""CREATE TABLE IF NOT EXISTS history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            user_query TEXT,
-            response TEXT,
-            department TEXT,
-            level TEXT,
-            semester TEXT,
-            sentiment TEXT,
-            keywords TEXT
-        )""")
-        conn.commit()
+        get_store(db_path)
     except sqlite3.Error as e:
         print(f"Failed to initialize database: {e}")
-    finally:
-        if conn is not None:
-            conn.close()
 
-def save_interaction(query, response, query_info, sentiment, db_path="RAG-MODEL/user_history.db"):
-    """Save a user interaction to the long-term memory database."""
-    conn = None
+def save_interaction(query, response, query_info, sentiment, db_path=DB_PATH, user_id=ANONYMOUS_USER):
+    """Save a user interaction to the long-term memory database (written in the background)."""
     try:
-        conn = sqlite3.connect(db_path, check_same_thread=False)
-        c = conn.cursor()
         keywords = " ".join(query_info.get("keywords", [])) if query_info.get("keywords") else ""
-        c.execute("""INSERT INTO history (timestamp, user_query, response, department, level, semester, sentiment, keywords)
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                  (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), query, response,
-                   query_info.get("department"), query_info.get("level"), query_info.get("semester"),
-                   sentiment, keywords))
-        conn.commit()
+        get_store(db_path).save((datetime.now().strftime("%Y-%m-%d %H:%M:%S"), query, response,
+                                 query_info.get("department"), query_info.get("level"), query_info.get("semester"),
+                                 sentiment, keywords), user_id=user_id)
     except sqlite3.Error as e:
         print(f"Failed to save interaction: {e}")
-    finally:
-        if conn is not None:
-            conn.close()
 
-def get_user_history(limit=10, db_path="RAG-MODEL/user_history.db"):
-    """Retrieve recent user interactions from long-term memory."""
-    conn = None
+def get_user_history(limit=10, db_path=DB_PATH, user_id=ANONYMOUS_USER):
+    """Retrieve a user's recent interactions from long-term memory."""
     try:
-        conn = sqlite3.connect(db_path, check_same_thread=False)
-        c = conn.cursor()
-        c.execute("SELECT timestamp, user_query, response, department, level, semester, sentiment, keywords FROM history ORDER BY timestamp DESC LIMIT ?", (limit,))
-        history = c.fetchall()
-        return [{"timestamp": h[0], "query": h[1], "response": h[2], "department": h[3], "level": h[4], 
+        history = get_store(db_path).recent(user_id, limit)
+        return [{"timestamp": h[0], "query": h[1], "response": h[2], "department": h[3], "level": h[4],
                  "semester": h[5], "sentiment": h[6], "keywords": h[7].split() if h[7] else []} for h in history]
     except sqlite3.Error as e:
         print(f"Failed to retrieve history: {e}")
         return []
-    finally:
-        if conn is not None:
-            conn.close()
 
-def get_relevant_context(limit=3, db_path="RAG-MODEL/user_history.db"):
-    """Get relevant context from long-term memory to enhance RAG queries."""
-    history = get_user_history(limit=limit, db_path=db_path)
+def get_relevant_context(limit=3, db_path=DB_PATH, user_id=ANONYMOUS_USER):
+    """Get relevant context from the user's long-term memory to enhance RAG queries."""
+    history = get_user_history(limit=limit, db_path=db_path, user_id=user_id)
     if not history:
         return None
     context = {
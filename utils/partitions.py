@@ -0,0 +1,211 @@
+"""
+Metadata partitions of the passage index: faculty, department and level.
+
+Each passage from a structured record (course_data.json, crescent_qa.json)
+carries the record's faculty, department and level(s). ``PartitionIndex``
+keeps, per field and value, the sorted ids of the passages filed there; a
+query with course slots (from utils.intent / extract_course_query) selects
+the intersection of its slots' id lists, and only that slice is searched.
+
+``SliceCache`` keeps the most recently used slices (PARTITION_CACHE, default
+64) with their vectors copied out of the index once, so a sliced query is one
+small matrix product instead of a pass over the whole index. Index types that
+cannot return their vectors search through a FAISS ``IDSelectorBatch``
+instead (``utils.index_factory.search_params``).
+
+Passages with no value for a field (general university information) belong
+to every slice of that field, so "Computer Science fees" still finds the
+general fees passage. A query without slots, or whose slice is empty or
+returns nothing, searches the whole index as before.
+
+Stored next to the FAISS index as ``keys.json`` (field/value -> offsets) plus
+one memory-mapped ``ids.npy``.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.course_query import _entry_levels, normalize_department
+from utils.passage_store import publish_dir, staging_dir
+
+PARTITION_FIELDS = ("faculty", "department", "level")
+PARTITION_CACHE = int(os.getenv("PARTITION_CACHE", 64))
+ANY = "*"  # bucket of passages with no value for the field
+
+
+@lru_cache(maxsize=1024)
+def _department(name: str) -> Optional[str]:
+    return normalize_department(name)
+
+
+def _record_departments(field: str) -> List[str]:
+    # "Anatomy, Nursing": the record belongs to each department listed
+    departments = []
+    for name in (part.strip() for part in field.split(",")):
+        if not name:
+            continue
+        # unknown department: its own slice, never a wildcard
+        department = _department(name) or name.lower()
+        if department not in departments:
+            departments.append(department)
+    return departments
+
+
+def record_slots(record: Dict) -> Dict:
+    """Partition values of a source record: list of canonical departments, faculty code, list of levels."""
+    faculty = (record.get("faculty") or "").strip()
+    slots = {
+        "department": _record_departments(record.get("department") or "") or None,
+        "faculty": faculty.upper() or None,
+        "level": [level for level in _entry_levels(record.get("level")) if level] or None,
+    }
+    return {k: v for k, v in slots.items() if v}
+
+
+def query_slots(query_info: Optional[Dict]) -> Dict:
+    """Partition values of a query's course slots (department / faculty / level as the routers return them).
+
+    The routers fill ``faculty`` from DEPARTMENT_TO_FACULTY_MAP whenever a department is found,
+    and the data does not always agree with the map (Computer Science passages filed under
+    CICOT or CST), so the faculty only narrows the slice when no department is given.
+    """
+    if not query_info:
+        return {}
+    department = query_info["department"].lower() if query_info.get("department") else None
+    slots = {
+        "department": department,
+        "faculty": query_info["faculty"].upper() if query_info.get("faculty") and not department else None,
+        "level": str(query_info["level"]) if query_info.get("level") else None,
+    }
+    return {k: v for k, v in slots.items() if v}
+
+
+class PartitionIndex:
+    def __init__(self):
+        self.offsets: Dict[str, List[int]] = {}  # "field=value" -> [start, end) into ids
+        self.ids = np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def build(self, rows: Sequence[Dict], ids: Optional[Iterable[int]] = None) -> "PartitionIndex":
+        """``rows`` hold partition values under PARTITION_FIELDS (``level`` may be a list)."""
+        ids = list(range(len(rows))) if ids is None else [int(i) for i in ids]
+        buckets: Dict[str, List[int]] = {}
+        for row, row_id in zip(rows, ids):
+            if not any(row.get(f) for f in PARTITION_FIELDS):
+                continue  # no slots at all: only reachable through ANY buckets
+            for field in PARTITION_FIELDS:
+                values = row.get(field)
+                values = values if isinstance(values, (list, tuple)) else [values] if values else []
+                for value in values or [ANY]:
+                    buckets.setdefault(f"{field}={value}", []).append(row_id)
+        unscoped = sorted(set(ids) - {i for b in buckets.values() for i in b})
+        for field in PARTITION_FIELDS:
+            buckets.setdefault(f"{field}={ANY}", []).extend(unscoped)
+
+        parts, pos = [], 0
+        for key in sorted(buckets):
+            bucket = np.unique(np.asarray(buckets[key], dtype=np.int64))
+            self.offsets[key] = [pos, pos + len(bucket)]
+            parts.append(bucket)
+            pos += len(bucket)
+        self.ids = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        return self
+
+    def _bucket(self, field: str, value: str) -> np.ndarray:
+        start, end = self.offsets.get(f"{field}={value}", (0, 0))
+        return self.ids[start:end]
+
+    def select(self, slots: Dict) -> Optional[np.ndarray]:
+        """Sorted ids of the slice matching every slot (possibly empty), or None when no slot is set."""
+        selected = None
+        for field in PARTITION_FIELDS:
+            value = slots.get(field)
+            if not value:
+                continue
+            ids = np.union1d(self._bucket(field, value), self._bucket(field, ANY))
+            selected = ids if selected is None else np.intersect1d(selected, ids, assume_unique=True)
+        return selected
+
+    # ---------- persistence
+    def save(self, path: str):
+        # written aside and swapped in: a loaded index may be memory-mapping ids.npy
+        path = Path(path)
+        tmp = staging_dir(path)
+        np.save(tmp / "ids.npy", self.ids)
+        (tmp / "keys.json").write_text(json.dumps(self.offsets), encoding="utf-8")
+        publish_dir(tmp, path)
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return (Path(path) / "keys.json").exists()
+
+    @classmethod
+    def load(cls, path: str) -> "PartitionIndex":
+        path = Path(path)
+        index = cls()
+        index.offsets = json.loads((path / "keys.json").read_text(encoding="utf-8"))
+        index.ids = np.load(path / "ids.npy", mmap_mode="r")
+        return index
+
+
+class SliceCache:
+    """LRU of resolved slices: slot values -> (ids, vectors or None)."""
+
+    def __init__(self, partitions: PartitionIndex, maxsize: int = PARTITION_CACHE):
+        self.partitions = partitions
+        self.maxsize = maxsize
+        self._slices: "OrderedDict[Tuple, Tuple[np.ndarray, Optional[np.ndarray]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"sliced": 0, "global": 0, "fallback": 0, "cache_hits": 0}
+
+    def get(self, slots: Dict, reconstruct) -> Optional[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        """``(ids, vectors)`` of the slice for ``slots``, or None to search the whole index.
+
+        ``reconstruct(ids)`` returns the stored vectors of ``ids``, or None when the index cannot.
+        """
+        if not slots:
+            self.stats["global"] += 1
+            return None
+        key = tuple(sorted(slots.items()))
+        with self._lock:
+            found = self._slices.get(key)
+            if found is not None:
+                self._slices.move_to_end(key)
+                self.stats["cache_hits"] += 1
+        if found is None:
+            ids = self.partitions.select(slots)
+            found = (ids, reconstruct(ids) if ids is not None and len(ids) else None)
+            with self._lock:
+                self._slices[key] = found
+                while len(self._slices) > self.maxsize:
+                    self._slices.popitem(last=False)
+        if found[0] is None or not len(found[0]):
+            self.stats["fallback"] += 1
+            return None
+        self.stats["sliced"] += 1
+        return found
+
+
+def search_slice(ids: np.ndarray, vectors: np.ndarray, q_emb: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact inner-product top-``k`` over a slice, shaped like ``faiss.Index.search`` output (-1 padded)."""
+    scores = q_emb @ vectors.T  # (queries, slice)
+    n = scores.shape[1]
+    D = np.full((len(q_emb), k), -np.inf, dtype=np.float32)
+    I = np.full((len(q_emb), k), -1, dtype=np.int64)
+    take = min(k, n)
+    if take:
+        top = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        D[:, :take] = np.take_along_axis(top_scores, order, axis=1)
+        I[:, :take] = ids[np.take_along_axis(top, order, axis=1)]
+    return D, I
@@ -0,0 +1,250 @@
+"""
+Compact, memory-mapped passage/metadata store.
+
+Replaces metadata.pkl and meta.json. A store is a directory of columns:
+
+    ids.npy                       int64 row ids (ascending; FAISS ids)
+    text.bin / text.off.npy       UTF-8 blob of passage texts + int64 offsets
+    snippet.bin / snippet.off.npy precomputed display snippets
+    extra.bin / extra.off.npy     JSON of any remaining per-row metadata
+    <col>.npy + strings.json      interned ids into shared string tables
+                                  for the repetitive columns (source, title, doc_id)
+
+Everything is opened with mmap, so load time and RSS barely grow with the
+corpus, and a lookup only decodes the rows it returns. A written store is never
+modified in place: PassageOverlay layers live additions and removals over it.
+"""
+
+import json
+import mmap
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+INTERNED = ("source", "title", "doc_id")
+BLOBS = ("text", "snippet", "extra")
+SNIPPET_CHARS = 200
+
+
+def make_snippet(text: str, limit: int = SNIPPET_CHARS) -> str:
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > 0 else limit] + "…"
+
+
+# --------------------------- Writing
+def staging_dir(path: Path) -> Path:
+    """Empty ``<path>.tmp`` next to ``path``, to be filled and then passed to ``publish_dir``."""
+    tmp = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    return tmp
+
+
+def publish_dir(tmp: Path, path: Path):
+    """Swap the finished directory ``tmp`` in at ``path`` by rename.
+
+    Files are never rewritten in place, so processes that memory-mapped the old
+    ones keep reading a complete (old) copy until they reload.
+    """
+    old = path.with_name(path.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if path.exists():
+        os.replace(path, old)
+    os.replace(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+class PassageStoreWriter:
+    """Append rows one at a time; ``close()`` publishes the store atomically."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.tmp = staging_dir(self.path)
+        self._blobs = {name: open(self.tmp / f"{name}.bin", "wb") for name in BLOBS}
+        self._offsets: Dict[str, List[int]] = {name: [0] for name in BLOBS}
+        self._tables: Dict[str, Dict[str, int]] = {col: {} for col in INTERNED}
+        self._interned: Dict[str, List[int]] = {col: [] for col in INTERNED}
+        self._ids: List[int] = []
+
+    def add(self, row: Dict, row_id: Optional[int] = None):
+        row_id = len(self._ids) if row_id is None else int(row_id)
+        if self._ids and row_id <= self._ids[-1]:
+            raise ValueError("Passage store ids must be added in ascending order")
+        self._ids.append(row_id)
+
+        text = row.get("text", "")
+        extra = {k: v for k, v in row.items() if k not in INTERNED and k not in ("text", "snippet")}
+        values = {
+            "text": text,
+            "snippet": row.get("snippet") or make_snippet(text),
+            "extra": json.dumps(extra, ensure_ascii=False) if extra else "",
+        }
+        for name, value in values.items():
+            data = value.encode("utf-8")
+            self._blobs[name].write(data)
+            self._offsets[name].append(self._offsets[name][-1] + len(data))
+
+        for col in INTERNED:
+            value = row.get(col)
+            if value is None:
+                self._interned[col].append(-1)
+                continue
+            table = self._tables[col]
+            self._interned[col].append(table.setdefault(str(value), len(table)))
+
+    def close(self):
+        for name, f in self._blobs.items():
+            f.close()
+            np.save(self.tmp / f"{name}.off.npy", np.asarray(self._offsets[name], dtype=np.int64))
+        np.save(self.tmp / "ids.npy", np.asarray(self._ids, dtype=np.int64))
+        for col in INTERNED:
+            np.save(self.tmp / f"{col}.npy", np.asarray(self._interned[col], dtype=np.int32))
+        (self.tmp / "strings.json").write_text(
+            json.dumps({col: list(t) for col, t in self._tables.items()}, ensure_ascii=False), encoding="utf-8")
+        publish_dir(self.tmp, self.path)
+
+
+def write_passage_store(path: str, rows: Iterable[Dict], ids: Optional[Iterable[int]] = None):
+    writer = PassageStoreWriter(path)
+    if ids is None:
+        for row in rows:
+            writer.add(row)
+    else:
+        for row, row_id in zip(rows, ids):
+            writer.add(row, row_id)
+    writer.close()
+
+
+# --------------------------- Reading
+class _Blob:
+    def __init__(self, path: Path):
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.offsets = np.load(str(path)[:-4] + ".off.npy", mmap_mode="r")
+
+    def __getitem__(self, row: int) -> str:
+        return self._buf[int(self.offsets[row]):int(self.offsets[row + 1])].decode("utf-8")
+
+    def close(self):
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+        self._file.close()
+
+
+class PassageStore:
+    """Read-only, list-like view of a passage store: ``store[row]`` decodes one row."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.ids = np.load(self.path / "ids.npy", mmap_mode="r")
+        self._blobs = {name: _Blob(self.path / f"{name}.bin") for name in BLOBS}
+        self._interned = {col: np.load(self.path / f"{col}.npy", mmap_mode="r") for col in INTERNED}
+        self._tables: Dict[str, List[str]] = json.loads((self.path / "strings.json").read_text(encoding="utf-8"))
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return (Path(path) / "ids.npy").exists()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, row: int) -> Dict:
+        if not -len(self) <= row < len(self):
+            raise IndexError(row)
+        row = int(row) % len(self)
+        out = {"id": int(self.ids[row])}
+        extra = self._blobs["extra"][row]
+        if extra:
+            out.update(json.loads(extra))
+        for col in INTERNED:
+            i = int(self._interned[col][row])
+            if i >= 0:
+                out[col] = self._tables[col][i]
+        out["text"] = self._blobs["text"][row]
+        out["snippet"] = self._blobs["snippet"][row]
+        return out
+
+    def __iter__(self) -> Iterator[Dict]:
+        for row in range(len(self)):
+            yield self[row]
+
+    def row_for_id(self, row_id: int) -> Optional[int]:
+        row = int(np.searchsorted(self.ids, row_id))
+        return row if row < len(self) and int(self.ids[row]) == row_id else None
+
+    def get(self, row_id: int, default=None) -> Optional[Dict]:
+        """Look a row up by its id rather than its position."""
+        row = self.row_for_id(row_id)
+        return default if row is None else self[row]
+
+    def ids_where(self, col: str, value: str) -> np.ndarray:
+        """Ids of all rows whose interned column ``col`` equals ``value``."""
+        try:
+            code = self._tables[col].index(value)
+        except ValueError:
+            return np.zeros(0, dtype=np.int64)
+        return np.asarray(self.ids[np.flatnonzero(self._interned[col] == code)], dtype=np.int64)
+
+    def close(self):
+        for blob in self._blobs.values():
+            blob.close()
+
+
+class PassageOverlay:
+    """A PassageStore plus the rows added and removed since it was written.
+
+    Looks rows up like the store (``get``, ``ids_where``, iteration in id order), so a
+    live upsert or delete costs the rows it changes instead of a rewrite; writing the
+    overlay out (``write_passage_store(path, list(overlay))``) folds the changes in.
+    """
+
+    def __init__(self, store: PassageStore):
+        self.store = store
+        # replaced, not mutated, on each change: readers may be iterating
+        self.added: Dict[int, Dict] = {}
+        self.removed: frozenset = frozenset()  # store ids
+
+    def __len__(self) -> int:
+        return len(self.store) - len(self.removed) + len(self.added)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for row in self.store:
+            if row["id"] not in self.removed:
+                yield row
+        for row_id in sorted(self.added):  # added ids come after every stored one (``next_id``)
+            yield dict(self.added[row_id])
+
+    def next_id(self) -> int:
+        last = int(self.store.ids[-1]) if len(self.store) else -1
+        return max(last, max(self.added, default=-1)) + 1
+
+    def add(self, rows: Iterable[Dict]):
+        added = dict(self.added)
+        for row in rows:
+            added[int(row["id"])] = {**row, "snippet": row.get("snippet") or make_snippet(row.get("text", ""))}
+        self.added = added
+
+    def remove(self, ids: Iterable[int]):
+        ids = {int(i) for i in ids}
+        self.added = {i: row for i, row in self.added.items() if i not in ids}
+        self.removed = self.removed.union(i for i in ids if self.store.row_for_id(i) is not None)
+
+    def get(self, row_id: int, default=None) -> Optional[Dict]:
+        row = self.added.get(row_id)
+        if row is not None:
+            return dict(row)
+        return default if row_id in self.removed else self.store.get(row_id, default)
+
+    def ids_where(self, col: str, value: str) -> np.ndarray:
+        ids = self.store.ids_where(col, value)
+        if self.removed:
+            ids = ids[~np.isin(ids, list(self.removed))]
+        added = [i for i, row in self.added.items() if row.get(col) == value]
+        return np.union1d(ids, np.asarray(added, dtype=np.int64))
@@ -1,8 +1,23 @@
+import gc
+import json
+import os
 import re
-from symspellpy import SymSpell, Verbosity
-import pkg_resources
+from functools import lru_cache
 import streamlit as st
 
+from utils.textnorm import COURSE_CODE_RE, PhraseRewriter
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Prebuilt SymSpell dictionary (deletes already generated); rebuild with
+# ``python -m utils.preprocess`` after upgrading symspellpy or changing settings
+SYMSPELL_SNAPSHOT = os.getenv("SYMSPELL_SNAPSHOT", os.path.join(ROOT_DIR, "frequency_dictionary_en_82_765.pickle.gz"))
+
+# Course codes, department and faculty names in here are never spell-corrected
+COURSE_DATA_PATH = os.getenv("COURSE_DATA_PATH", os.path.join(ROOT_DIR, "data", "course_data.json"))
+# Distinct misspelled tokens whose correction is remembered
+SPELL_CACHE_SIZE = int(os.getenv("SPELL_CACHE_SIZE", 50000))
+
 ABBREVIATIONS = {
     "u": "you", "r": "are", "ur": "your", "cn": "can", "cud": "could",
     "shud": "should", "wud": "would", "abt": "about", "bcz": "because",
@@ -32,23 +47,100 @@ SYNONYMS = {
     "requirement": "criteria", "conditions": "criteria", "needed": "required"
 }
 
-@st.cache_resource
-def get_sym_spell():
+def _dictionary_path():
+    from importlib.resources import files
+    return str(files("symspellpy") / "frequency_dictionary_en_82_765.txt")
+
+def load_sym_spell(snapshot=SYMSPELL_SNAPSHOT):
+    """Load SymSpell from the snapshot if it is usable, else parse the text dictionary (~5x slower)."""
+    from symspellpy import SymSpell
     sym_spell = SymSpell(max_dictionary_edit_distance=2, prefix_length=7)
-    dictionary_path = pkg_resources.resource_filename("symspellpy", "frequency_dictionary_en_82_765.txt")
-    sym_spell.load_dictionary(dictionary_path, term_index=0, count_index=1)
+    if snapshot and os.path.exists(snapshot):
+        gc.disable()  # unpickling ~700k small containers; collector passes would triple the time
+        try:
+            if sym_spell.load_pickle(snapshot, compressed=snapshot.endswith(".gz")):
+                return sym_spell
+        except Exception as e:
+            print(f"Could not load SymSpell snapshot {snapshot}: {e}")
+        finally:
+            gc.enable()
+        print(f"SymSpell snapshot {snapshot} is stale, falling back to the text dictionary")
+    sym_spell.load_dictionary(_dictionary_path(), term_index=0, count_index=1)
     return sym_spell
 
+def build_sym_spell_snapshot(path=SYMSPELL_SNAPSHOT):
+    sym_spell = load_sym_spell(snapshot=None)
+    sym_spell.save_pickle(path, compressed=path.endswith(".gz"))
+    return path
+
+@st.cache_resource
+def get_sym_spell():
+    return load_sym_spell()
+
 def normalize_text(text):
     text = re.sub(r'[^\w\s\-]', '', text)  # keep hyphen
     text = re.sub(r'(.)\1{2,}', r'\1', text)  # remove repeated characters
     return text.lower()
 
+# Whole tokens only, longest phrase first ("credit unit" before "unit"), in one pass each
+ABBREVIATION_REWRITER = PhraseRewriter(ABBREVIATIONS, whitespace_words=True)
+SYNONYM_REWRITER = PhraseRewriter(SYNONYMS, whitespace_words=True)
+
 def apply_abbreviations(words):
-    return [ABBREVIATIONS.get(w.lower(), w) for w in words]
+    return ABBREVIATION_REWRITER.rewrite(" ".join(words)).split()
 
 def apply_synonyms(words):
-    return [SYNONYMS.get(w.lower(), w) for w in words]
+    return SYNONYM_REWRITER.rewrite(" ".join(words)).split()
+
+@lru_cache(maxsize=1)
+def get_domain_vocabulary(path=COURSE_DATA_PATH):
+    """Tokens spell correction must leave alone: course codes and prefixes, department and faculty names."""
+    from utils.course_query import DEPARTMENTS, DEPARTMENT_TO_FACULTY_MAP
+
+    names = DEPARTMENTS + list(DEPARTMENT_TO_FACULTY_MAP.values())
+    codes = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for entry in json.load(f):
+                names += [entry.get("department") or "", entry.get("faculty") or ""]
+                codes += COURSE_CODE_RE.findall(f"{entry.get('question', '')} {entry.get('answer', '')}")
+    except (OSError, ValueError) as e:
+        print(f"Could not read domain vocabulary from {path}: {e}")
+    vocab = {w for name in names for w in normalize_text(name).split()}
+    vocab.update(prefix.lower() for prefix, _ in codes)
+    vocab.update(f"{prefix.lower()}{number}" for prefix, number in codes)
+    return frozenset(vocab)
+
+_spell_counts = {"tokens": 0, "dictionary": 0, "domain": 0}
+
+@lru_cache(maxsize=SPELL_CACHE_SIZE)
+def _lookup_correction(word):
+    from symspellpy import Verbosity
+    suggestions = get_sym_spell().lookup(word, Verbosity.CLOSEST, max_edit_distance=2)
+    return suggestions[0].term if suggestions else word
+
+def correct_word(word, sym_spell=None):
+    """Spell-correct one token; known and domain words skip the SymSpell lookup entirely."""
+    _spell_counts["tokens"] += 1
+    if word in get_domain_vocabulary() or any(ch.isdigit() for ch in word):
+        _spell_counts["domain"] += 1
+        return word
+    if word in (sym_spell or get_sym_spell()).words:
+        _spell_counts["dictionary"] += 1  # CLOSEST would return the word itself
+        return word
+    return _lookup_correction(word)
+
+def spell_stats():
+    cache = _lookup_correction.cache_info()
+    tokens = _spell_counts["tokens"]
+    return {
+        **_spell_counts,
+        "cache_hits": cache.hits,
+        "lookups": cache.misses,  # tokens that actually ran a SymSpell lookup
+        "cache_size": cache.currsize,
+        "cache_hit_rate": cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else 0.0,
+        "skip_rate": (tokens - cache.misses) / tokens if tokens else 0.0,
+    }
 
 def preprocess_text(text, debug=False):
     text = normalize_text(text)
@@ -57,10 +149,7 @@ def preprocess_text(text, debug=False):
     expanded = apply_abbreviations(words)
 
     sym_spell = get_sym_spell()
-    corrected = []
-    for word in expanded:
-        suggestions = sym_spell.lookup(word, Verbosity.CLOSEST, max_edit_distance=2)
-        corrected.append(suggestions[0].term if suggestions else word)
+    corrected = [correct_word(word, sym_spell) for word in expanded]
 
     final_words = apply_synonyms(corrected)
 
@@ -71,3 +160,7 @@ def preprocess_text(text, debug=False):
         print("With Synonyms:", final_words)
 
     return ' '.join(final_words)
+
+
+if __name__ == "__main__":
+    print(f"Wrote {build_sym_spell_snapshot()}")
@@ -0,0 +1,99 @@
+"""
+Bounded, thread-safe LRU/TTL cache for query embeddings.
+
+Keys are (model name, normalized query). Limits come from the environment
+unless passed explicitly:
+
+    QUERY_CACHE_SIZE   max cached queries          (default: 1024)
+    QUERY_CACHE_TTL    seconds an entry stays valid (default: 3600)
+
+Encoding with a different model name than the previous call clears the cache.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    # the MiniLM models we use are uncased, so case and spacing never change the vector
+    return " ".join(query.lower().split())
+
+
+class QueryEmbeddingCache:
+    def __init__(self, maxsize: Optional[int] = None, ttl: Optional[float] = None):
+        self.maxsize = maxsize if maxsize is not None else int(os.getenv("QUERY_CACHE_SIZE", 1024))
+        self.ttl = ttl if ttl is not None else float(os.getenv("QUERY_CACHE_TTL", 3600))
+        self.model_name: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "model": self.model_name,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def _get(self, key, now: float) -> Optional[np.ndarray]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, vec = entry
+        if now - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return vec
+
+    def encode(self, model, queries: List[str], model_name: str, batch_size: int = 32) -> np.ndarray:
+        """Return L2-normalized float32 embeddings for ``queries``, running ``model`` only on misses."""
+        if model_name != self.model_name:
+            self.clear()
+            self.model_name = model_name
+
+        keys = [(model_name, normalize_query(q)) for q in queries]
+        now = time.monotonic()
+        found: Dict[Tuple[str, str], np.ndarray] = {}
+        missing: List[Tuple[str, str]] = []
+        with self._lock:
+            for key in keys:
+                if key in found or key in missing:
+                    continue
+                vec = self._get(key, now)
+                if vec is None:
+                    missing.append(key)
+                else:
+                    found[key] = vec
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            embs = model.encode([k[1] for k in missing], batch_size=batch_size,
+                                convert_to_numpy=True, normalize_embeddings=True)
+            embs = embs.astype(np.float32)
+            with self._lock:
+                for key, vec in zip(missing, embs):
+                    found[key] = vec
+                    self._entries[key] = (now, vec)
+                    self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+        return np.stack([found[k] for k in keys])
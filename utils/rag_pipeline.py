@@ -1,11 +1,11 @@
 """
 RAG Pipeline for CrescentBot
 
-- Ingests JSON knowledge files (course_data.json, crescent_qa.json)
-- Splits into passages
-- Embeds with SentenceTransformer
-- Indexes with FAISS
-- Retrieves top passages
+- Ingests JSON / JSONL knowledge files (course_data, crescent_qa) record by record
+- Renders each record as text and splits it into passages
+- Embeds with SentenceTransformer, in batches of INGEST_BATCH passages
+- Indexes with FAISS, plus a BM25 inverted index over the same passages
+- Retrieves top passages (dense, hybrid RRF, or lexical-only; see utils.bm25)
 - Generates answers with Flan-T5
 - Returns answer + used passages
 
@@ -14,15 +14,28 @@ Requirements:
 """
 
 import os
-import json
 import pickle
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from threading import Thread
+from typing import TYPE_CHECKING, List, Dict, Tuple, Optional, Iterable, Iterator, Sequence
 
-import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+
+from utils.embed_cache import EmbeddingCache
+from utils.embedding import load_embedder, embedder_id
+from utils.index_factory import IndexWriter, set_search_params, read_faiss_index, write_faiss_index
+from utils.query_cache import QueryEmbeddingCache
+from utils.answer_cache import SemanticAnswerCache
+from utils.batching import MicroBatcher
+from utils.passage_store import PassageStore, write_passage_store
+from utils.bm25 import LEXICAL_COVERAGE, BM25Index, fuse, retrieval_mode
+from utils.index_factory import reconstruct_ids, search_params
+from utils.partitions import PARTITION_FIELDS, PartitionIndex, SliceCache, query_slots, record_slots, search_slice
+from utils.dedup import Deduplicator, format_report
+from utils.records import INGEST_BATCH, batched, iter_records, render_record
+
+if TYPE_CHECKING:
+    import faiss  # faiss, torch and transformers are imported on first use to keep startup fast
 
 
 # --------------------------- Text splitting
@@ -40,89 +53,250 @@ def split_text_into_passages(text: str, chunk_size: int = 400, overlap: int = 50
 
 
 # --------------------------- Ingestion
-def ingest_json_files(data_dir: str) -> List[Dict]:
-    """Load course_data.json and crescent_qa.json into passage chunks."""
-    docs = []
+INGEST_SOURCES = ("course_data", "crescent_qa")  # read as <name>.json and/or <name>.jsonl
+
+
+def iter_json_passages(data_dir: str) -> Iterator[Dict]:
+    """Passage chunks of the knowledge files, produced one record at a time."""
     data_dir_path = Path(data_dir)
     if not data_dir_path.exists():
         print(f"Data directory does not exist: {data_dir}")
-        return docs
-    for fname in ["course_data.json", "crescent_qa.json"]:
-        path = data_dir_path / fname
-        print(f"Checking file: {path}")  # Debug
-        if not path.exists():
-            print(f"File not found: {path}")
-            continue
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except json.JSONDecodeError as e:
-            print(f"Invalid JSON in {path}: {e}")
-            continue
-        if not data:
-            print(f"No data in {path}")
-            continue
-        if isinstance(data, dict):
-            items = data.items()
-        elif isinstance(data, list):
-            items = enumerate(data)
-        else:
-            print(f"Unsupported data type in {path}: {type(data)}")
+        return
+    for name in INGEST_SOURCES:
+        paths = [data_dir_path / f"{name}{suffix}" for suffix in (".json", ".jsonl")]
+        print(f"Checking file: {paths[0]}")  # Debug
+        if not any(path.exists() for path in paths):
+            print(f"File not found: {paths[0]}")
             continue
-        for key, val in items:
-            text = str(val)
-            passages = split_text_into_passages(text)
-            print(f"File {fname}: {len(passages)} passages from key {key}")  # Debug
-            for i, p in enumerate(passages):
-                docs.append({
-                    "id": f"{fname}_{key}_{i}",
-                    "source": fname,
-                    "text": p,
-                })
-    print(f"Total documents loaded: {len(docs)}")  # Debug
-    return docs
+        for path in (p for p in paths if p.exists()):
+            fname, count = path.name, 0
+            try:
+                for key, val in iter_records(path):
+                    # faculty / department / level of structured records, for partitioned retrieval
+                    slots = record_slots(val) if isinstance(val, dict) else {}
+                    for i, p in enumerate(split_text_into_passages(render_record(val))):
+                        count += 1
+                        yield {"id": f"{fname}_{key}_{i}", "source": fname, "text": p, **slots}
+            except ValueError as e:  # malformed JSON or an unsupported top-level type
+                print(f"Invalid JSON in {path}: {e}")
+            print(f"File {fname}: {count} passages" if count else f"No data in {path}")  # Debug
+
+
+def stream_json_files(data_dir: str, dedup: Optional[str] = None) -> Iterator[Dict]:
+    """``iter_json_passages`` without duplicates (``dedup``: off | exact | near, default DEDUP_MODE).
+
+    The kept passage lists the dropped ones under ``duplicates``; a report is printed at the end.
+    """
+    # course entries repeat across the two files; only merged within one faculty/department/level
+    dedup_filter = Deduplicator(dedup, same=PARTITION_FIELDS)
+    yield from dedup_filter.filter(iter_json_passages(data_dir))
+    print(f"Total documents loaded: {dedup_filter.report['kept']}")  # Debug
+    print(format_report(dedup_filter.report))
+
+
+def ingest_json_files(data_dir: str, dedup: Optional[str] = None) -> List[Dict]:
+    """Load course_data and crescent_qa (JSON or JSONL) into passage chunks, as a list."""
+    return list(stream_json_files(data_dir, dedup))
 
 
 # --------------------------- Embedding & Indexing
 class RAGIndex:
-    def __init__(self, embed_model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        self.embedder = SentenceTransformer(embed_model_name)
-        self.index: Optional[faiss.IndexFlatIP] = None
-        self.metadata: List[Dict] = []
+    def __init__(self, embed_model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 cache_dir: Optional[str] = None, index_config: Optional[Dict] = None,
+                 backend: Optional[str] = None, mode: Optional[str] = None):
+        # backend: torch | int8 | onnx, defaulting to EMBEDDING_BACKEND; it is part of the cache key
+        self.embed_model_name = embedder_id(embed_model_name, backend)
+        self.embedder = load_embedder(embed_model_name, backend)
+        self.query_cache = QueryEmbeddingCache()
+        self.embed_batcher = MicroBatcher(self._encode_queries, name="encode")
+        # optional on-disk cache so rebuilds only encode new or changed passages
+        self.cache = EmbeddingCache(cache_dir, self.embed_model_name) if cache_dir else None
+        # index type/params; falls back to INDEX_TYPE etc. from the environment
+        self.index_config = index_config
+        self.index: Optional["faiss.Index"] = None
+        self.metadata: Sequence[Dict] = []  # list after build, PassageStore after load
+        # bumped on every build/load so caches of answers know when to invalidate
+        self.version = 0
+        # lexical index over the same passages; mode: dense | hybrid | auto (RETRIEVAL_MODE)
+        self.bm25: Optional[BM25Index] = None
+        self.mode = retrieval_mode(mode)
+        self.route_counts = {"dense": 0, "hybrid": 0, "lexical": 0}
+        # faculty / department / level slices searched when a query has course slots
+        self.partitions: Optional[PartitionIndex] = None
+        self.slices: Optional[SliceCache] = None
+
+    def _set_partitions(self, partitions: PartitionIndex):
+        self.partitions = partitions
+        self.slices = SliceCache(partitions)  # cached vectors belong to the previous index
+
+    def build(self, docs: Iterable[Dict], batch_size: int = INGEST_BATCH) -> int:
+        """Index ``docs`` (a list, or a stream such as ``stream_json_files``); returns the passage count.
 
-    def build(self, docs: List[Dict]):
-        if not docs:
+        Passages are embedded and added to the index ``batch_size`` at a time, so only
+        one batch of texts and vectors is in flight whatever the corpus size.
+        """
+        import faiss
+        self.version += 1
+        self.metadata = []
+        writer = IndexWriter(self.index_config)
+
+        def text_batches():
+            for batch in batched(docs, batch_size):
+                self.metadata.extend(batch)
+                yield [d["text"] for d in batch]
+
+        if self.cache is not None:
+            embeddings = self.cache.encode_batches(self.embedder, text_batches())
+        else:
+            embeddings = (self.embedder.encode(texts, convert_to_numpy=True) for texts in text_batches())
+        for embs in embeddings:
+            embs = np.ascontiguousarray(embs, dtype=np.float32)
+            faiss.normalize_L2(embs)
+            writer.add(embs)
+            print(f"Indexed {writer.ntotal} passages")  # Debug
+
+        self.index = writer.finish()
+        if self.index is None:
             print("Warning: No documents found for indexing. Initializing empty index.")
-            self.metadata = []
             self.index = faiss.IndexFlatIP(384)  # Default dimension for all-MiniLM-L6-v2
-            return
-        texts = [d["text"] for d in docs]
-        self.metadata = docs
-        embs = self.embedder.encode(texts, convert_to_numpy=True, show_progress_bar=True)
-        faiss.normalize_L2(embs)
-        d = embs.shape[1]
-        self.index = faiss.IndexFlatIP(d)
-        self.index.add(embs)
+        self.bm25 = BM25Index().build(d["text"] for d in self.metadata)
+        self._set_partitions(PartitionIndex().build(self.metadata))
+        return len(self.metadata)
 
     def save(self, path: str):
         os.makedirs(path, exist_ok=True)
-        faiss.write_index(self.index, os.path.join(path, "index.faiss"))
-        with open(os.path.join(path, "metadata.pkl"), "wb") as f:
-            pickle.dump(self.metadata, f)
+        write_faiss_index(self.index, os.path.join(path, "index.faiss"))
+        write_passage_store(os.path.join(path, "passages"), self.metadata)
+        if self.bm25 is not None:
+            self.bm25.save(os.path.join(path, "bm25"))
+        if self.partitions is not None:
+            self.partitions.save(os.path.join(path, "partitions"))
 
     def load(self, path: str):
-        self.index = faiss.read_index(os.path.join(path, "index.faiss"))
-        with open(os.path.join(path, "metadata.pkl"), "rb") as f:
-            self.metadata = pickle.load(f)
+        self.version += 1
+        # memory-mapped (FAISS_MMAP) so API workers and the Streamlit app share one copy
+        index, _ = read_faiss_index(os.path.join(path, "index.faiss"))
+        self.index = set_search_params(index, self.index_config)
+        store_dir = os.path.join(path, "passages")
+        if PassageStore.exists(store_dir):
+            # list-like and memory-mapped: rows are decoded only when retrieved
+            self.metadata = PassageStore(store_dir)
+        else:
+            # index saved before the passage store existed
+            with open(os.path.join(path, "metadata.pkl"), "rb") as f:
+                self.metadata = pickle.load(f)
+        bm25_dir = os.path.join(path, "bm25")
+        if BM25Index.exists(bm25_dir):
+            self.bm25 = BM25Index.load(bm25_dir)
+        else:
+            # index saved before BM25 existed: a few ms per thousand passages
+            self.bm25 = BM25Index().build([m["text"] for m in self.metadata])
+        partitions_dir = os.path.join(path, "partitions")
+        if PartitionIndex.exists(partitions_dir):
+            self._set_partitions(PartitionIndex.load(partitions_dir))
+        else:
+            # passages saved before partitioning carry no slots: every query searches globally
+            self._set_partitions(PartitionIndex().build(list(self.metadata)))
+
+    def retrieve_batch(self, queries: List[str], top_k: int = 5, min_score: Optional[float] = None,
+                       filters: Optional[Dict] = None) -> List[List[Tuple[Dict, float]]]:
+        """Retrieve for several queries with one batched encode and one FAISS search.
+
+        Queries taking the lexical fast path are answered from BM25 and never encoded.
+        ``filters`` (course slots: department / faculty / level) restrict every query
+        to the matching partition, falling back to the whole index when it has no hits.
+        """
+        if not queries:
+            return []
+        out: List[Optional[List[Tuple[Dict, float]]]] = [
+            self.lexical_search(q, top_k, filters, min_score) for q in queries]
+        rest = [i for i, r in enumerate(out) if r is None]
+        if rest:
+            batch = [queries[i] for i in rest]
+            for i, results in zip(rest, self.search_embeddings(self.embed_queries(batch), top_k, min_score,
+                                                               batch, filters)):
+                out[i] = results
+        return out
+
+    def select_partition(self, filters: Optional[Dict]) -> Optional[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        """``(ids, vectors)`` of the slice matching ``filters``, or None for the whole index.
+
+        ``vectors`` is None when the index type cannot return its stored vectors.
+        """
+        if self.slices is None:
+            return None
+        return self.slices.get(query_slots(filters), lambda ids: reconstruct_ids(self.index, ids))
+
+    def is_lexical(self, query: str) -> bool:
+        """True when ``auto`` mode would answer ``query`` from BM25 alone."""
+        return self.mode == "auto" and self.bm25 is not None and self.bm25.is_lexical(query)
+
+    def lexical_search(self, query: str, top_k: int = 5, filters: Optional[Dict] = None,
+                       min_score: Optional[float] = None) -> Optional[List[Tuple[Dict, float]]]:
+        """Fast-path results scored by query coverage, or None when ``query`` should be encoded instead."""
+        if not self.is_lexical(query):
+            return None
+        min_coverage = max(LEXICAL_COVERAGE, min_score or 0.0)
+        selected = self.select_partition(filters)
+        allowed = selected[0] if selected is not None else None
+        hits = self.bm25.lexical_search(query, top_k, allowed, min_coverage)
+        if allowed is not None and not hits:
+            self.slices.stats["fallback"] += 1
+            hits = self.bm25.lexical_search(query, top_k, min_coverage=min_coverage)
+        if not hits:
+            return None
+        self.route_counts["lexical"] += 1
+        return [(self.metadata[i], score) for i, score in hits]
+
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        return self.query_cache.encode(self.embedder, list(queries), self.embed_model_name)
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        if len(queries) == 1:
+            # single queries from concurrent sessions share one encode call
+            return self.embed_batcher(queries[0])[None, :]
+        return self._encode_queries(queries)
+
+    def search_embeddings(self, q_emb: np.ndarray, top_k: int = 5, min_score: Optional[float] = None,
+                          queries: Optional[Sequence[str]] = None,
+                          filters: Optional[Dict] = None) -> List[List[Tuple[Dict, float]]]:
+        """FAISS search; given the query texts (and not in dense mode), fused with BM25 by RRF.
 
-    def retrieve(self, query: str, top_k: int = 5) -> List[Tuple[Dict, float]]:
-        q_emb = self.embedder.encode([query], convert_to_numpy=True)
-        faiss.normalize_L2(q_emb)
-        D, I = self.index.search(q_emb, top_k)
-        result = []
-        for score, idx in zip(D[0], I[0]):
-            result.append((self.metadata[int(idx)], float(score)))
-        return result
+        With ``filters`` only the matching partition is searched: over its cached
+        vectors, or through an ID selector for indexes that cannot return them.
+        Queries with no hits there are searched globally.
+        """
+        hybrid = queries is not None and self.mode != "dense" and self.bm25 is not None
+        k = top_k * 2 if hybrid else top_k
+        selected = self.select_partition(filters)
+        allowed = selected[0] if selected is not None else None
+        if selected is None:
+            D, I = self.index.search(q_emb, k)
+        elif selected[1] is not None:
+            D, I = search_slice(allowed, selected[1], q_emb, k)
+        else:
+            D, I = self.index.search(q_emb, k, params=search_params(self.index, allowed))
+        if allowed is not None and (I[:, 0] == -1).any():
+            self.slices.stats["fallback"] += int((I[:, 0] == -1).sum())
+            D_all, I_all = self.index.search(q_emb, k)
+            empty = I[:, 0] == -1
+            D[empty], I[empty] = D_all[empty], I_all[empty]
+        # approximate indexes may return -1 when they find fewer than top_k hits
+        keep = I != -1
+        if min_score is not None:
+            keep &= D >= min_score
+        dense = [[(int(idx), float(score)) for score, idx in zip(scores[mask], ids[mask])]
+                 for scores, ids, mask in zip(D, I, keep)]
+        if hybrid:
+            self.route_counts["hybrid"] += len(dense)
+            dense = [fuse(hits, self.bm25.search(q, k, allowed if hits and allowed is not None else None), top_k)
+                     for hits, q in zip(dense, queries)]
+        else:
+            self.route_counts["dense"] += len(dense)
+        return [[(self.metadata[idx], score) for idx, score in hits] for hits in dense]
+
+    def retrieve(self, query: str, top_k: int = 5, min_score: Optional[float] = None) -> List[Tuple[Dict, float]]:
+        return self.retrieve_batch([query], top_k, min_score)[0]
 
 
 # --------------------------- Generator
@@ -133,34 +307,124 @@ PROMPT_TMPL = (
 )
 
 class Generator:
-    def __init__(self, model_name: str = "google/flan-t5-base", device: int = -1):
+    """Flan-T5 answer generator.
+
+    Fast mode (``fast=True`` or GENERATOR_FAST=1) quantizes the Linear layers to
+    int8 on CPU and decodes greedily instead of with 2 beams. GENERATOR_THREADS
+    sets torch's intra-op thread count and GENERATOR_MAX_NEW_TOKENS the default
+    answer length.
+    """
+
+    def __init__(self, model_name: str = "google/flan-t5-base", device: int = -1,
+                 fast: Optional[bool] = None, num_threads: Optional[int] = None,
+                 max_new_tokens: Optional[int] = None):
+        from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
         self.model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+        self.fast = fast if fast is not None else os.getenv("GENERATOR_FAST", "0") == "1"
+        self.max_new_tokens = max_new_tokens or int(os.getenv("GENERATOR_MAX_NEW_TOKENS", 256))
+        num_threads = num_threads or int(os.getenv("GENERATOR_THREADS", 0))
         try:
             import torch
+            if num_threads > 0:
+                torch.set_num_threads(num_threads)
             if device >= 0:
                 self.model = self.model.to(device)
+            elif self.fast:
+                self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
         except Exception:
             pass
+        self.model.eval()
 
-    def generate(self, prompt: str, max_tokens: int = 256, temperature: float = 0.0) -> str:
-        inputs = self.tokenizer(prompt, return_tensors="pt", truncation=True, max_length=1024)
+    def generate(self, prompt: str, max_tokens: Optional[int] = None, temperature: float = 0.0) -> str:
+        return self.generate_batch([prompt], max_tokens, temperature)[0]
+
+    def generate_batch(self, prompts: List[str], max_tokens: Optional[int] = None,
+                       temperature: float = 0.0) -> List[str]:
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True, truncation=True, max_length=1024)
+        num_beams = 2 if temperature == 0.0 and not self.fast else 1
+        kwargs = {"early_stopping": True} if num_beams > 1 else {}
         outputs = self.model.generate(
             **inputs,
-            max_new_tokens=max_tokens,
+            max_new_tokens=max_tokens or self.max_new_tokens,
             do_sample=temperature > 0.0,
             temperature=temperature,
             top_p=0.95,
-            num_beams=2 if temperature == 0.0 else 1,
+            num_beams=num_beams,
+            **kwargs,
+        )
+        return self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+    def generate_stream(self, prompt: str, max_tokens: Optional[int] = None,
+                        temperature: float = 0.0) -> Iterator[str]:
+        """Yield the answer in text pieces as they are decoded.
+
+        Streaming cannot be combined with beam search, so temperature 0 decodes greedily here.
+        """
+        from transformers import TextIteratorStreamer
+        inputs = self.tokenizer(prompt, return_tensors="pt", truncation=True, max_length=1024)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        kwargs = dict(
+            **inputs,
+            streamer=streamer,
+            max_new_tokens=max_tokens or self.max_new_tokens,
+            do_sample=temperature > 0.0,
+            num_beams=1,
         )
-        return self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+        if temperature > 0.0:
+            kwargs.update(temperature=temperature, top_p=0.95)
+        thread = Thread(target=self.model.generate, kwargs=kwargs, daemon=True)
+        thread.start()
+        for piece in streamer:
+            if piece:
+                yield piece
+        thread.join()
 
 
 # --------------------------- Pipeline
 class RAGPipeline:
-    def __init__(self, index: RAGIndex, generator: Generator):
+    """Retrieval plus generation.
+
+    ``answer_stream`` returns the answer as an iterator. By default it yields the
+    whole answer once, decoded through ``generate_batcher`` like ``answer`` (batched
+    with other sessions, 2-beam). With ``stream=True`` (or GENERATOR_STREAM=1) it
+    yields text as it is decoded instead: the first words appear sooner, but each
+    stream decodes alone and greedily, since beam search cannot stream.
+    """
+
+    def __init__(self, index: RAGIndex, generator: Generator,
+                 answer_cache: Optional[SemanticAnswerCache] = None, stream: Optional[bool] = None):
         self.index = index
         self.generator = generator
+        self.stream = stream if stream is not None else os.getenv("GENERATOR_STREAM", "0") == "1"
+        self.answer_cache = answer_cache if answer_cache is not None else SemanticAnswerCache()
+        # prompts from concurrent sessions are decoded together in one generate call
+        self.generate_batcher = MicroBatcher(self._generate_items, name="generate")
+
+    def metrics(self) -> Dict:
+        return {
+            "encode_batcher": self.index.embed_batcher.stats(),
+            "generate_batcher": self.generate_batcher.stats(),
+            "query_cache": self.index.query_cache.stats(),
+            "answer_cache": self.answer_cache.stats(),
+            "retrieval": {"mode": self.index.mode, **self.index.route_counts},
+            "partitions": dict(self.index.slices.stats) if self.index.slices is not None else {},
+        }
+
+    def _generate_items(self, items: List[Tuple[str, Optional[int]]]) -> List[str]:
+        # requests in a batch may ask for different lengths; decode each length group together
+        out: Dict[int, str] = {}
+        for max_tokens in {m for _, m in items}:
+            idxs = [i for i, (_, m) in enumerate(items) if m == max_tokens]
+            for i, text in zip(idxs, self.generator.generate_batch([items[i][0] for i in idxs], max_tokens)):
+                out[i] = text
+        return [out[i] for i in range(len(items))]
+
+    def _answer_pieces(self, prompt: str, max_new_tokens: Optional[int]) -> Iterator[str]:
+        if self.stream:
+            yield from self.generator.generate_stream(prompt, max_new_tokens)
+        else:
+            yield self.generate_batcher((prompt, max_new_tokens))
 
     def construct_context(self, retrieved: List[Tuple[Dict, float]], max_passages: int = 5) -> str:
         ctx_parts = []
@@ -168,15 +432,63 @@ class RAGPipeline:
             ctx_parts.append(f"[{i+1}] {meta['source']}\n{meta['text']}")
         return "\n\n".join(ctx_parts)
 
-    def answer(self, query: str, top_k: int = 10, max_passages: int = 5) -> Dict:
-        retrieved = self.index.retrieve(query, top_k)
+    def answer(self, query: str, top_k: int = 10, max_passages: int = 5,
+               max_new_tokens: Optional[int] = None,
+               filters: Optional[Dict] = None) -> Dict:
+        retrieved = self.index.lexical_search(query, top_k, filters)
+        if retrieved is not None:
+            # course-code query: BM25 picks the passages, no encode (and so no semantic answer cache)
+            prompt = PROMPT_TMPL.format(context=self.construct_context(retrieved, max_passages), question=query)
+            return {"answer": self.generate_batcher((prompt, max_new_tokens)), "retrieved": retrieved[:max_passages]}
+
+        q_emb = self.index.embed_queries([query])
+        params = (top_k, max_passages, max_new_tokens, tuple(sorted(query_slots(filters).items())))
+        cached = self.answer_cache.get(q_emb[0], self.index.version, params)
+        if cached is not None:
+            return dict(cached)
+
+        retrieved = self.index.search_embeddings(q_emb, top_k, queries=[query], filters=filters)[0]
         context = self.construct_context(retrieved, max_passages)
         prompt = PROMPT_TMPL.format(context=context, question=query)
-        answer = self.generator.generate(prompt)
-        return {
+        answer = self.generate_batcher((prompt, max_new_tokens))
+        out = {
             "answer": answer,
             "retrieved": retrieved[:max_passages],
         }
+        self.answer_cache.put(q_emb[0], out, self.index.version, params)
+        return dict(out)
+
+    def answer_stream(self, query: str, top_k: int = 10, max_passages: int = 5,
+                      max_new_tokens: Optional[int] = None,
+                      filters: Optional[Dict] = None) -> Dict:
+        """Retrieve now and return ``{"retrieved", "stream"}``; generation starts when the stream is iterated.
+
+        ``filters`` are the query's course slots (department / faculty / level); see RAGIndex.retrieve_batch.
+        """
+        retrieved = self.index.lexical_search(query, top_k, filters)
+        if retrieved is not None:
+            prompt = PROMPT_TMPL.format(context=self.construct_context(retrieved, max_passages), question=query)
+            return {"retrieved": retrieved[:max_passages], "stream": self._answer_pieces(prompt, max_new_tokens)}
+
+        q_emb = self.index.embed_queries([query])
+        params = (top_k, max_passages, max_new_tokens, tuple(sorted(query_slots(filters).items())))
+        cached = self.answer_cache.get(q_emb[0], self.index.version, params)
+        if cached is not None:
+            return {"retrieved": cached["retrieved"], "stream": iter([cached["answer"]])}
+
+        retrieved = self.index.search_embeddings(q_emb, top_k, queries=[query], filters=filters)[0]
+        context = self.construct_context(retrieved, max_passages)
+        prompt = PROMPT_TMPL.format(context=context, question=query)
+
+        def stream() -> Iterator[str]:
+            pieces = []
+            for piece in self._answer_pieces(prompt, max_new_tokens):
+                pieces.append(piece)
+                yield piece
+            out = {"answer": "".join(pieces).strip(), "retrieved": retrieved[:max_passages]}
+            self.answer_cache.put(q_emb[0], out, self.index.version, params)
+
+        return {"retrieved": retrieved[:max_passages], "stream": stream()}
 
 
 # --------------------------- CLI build & test
@@ -185,13 +497,13 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--data_dir", type=str, default="RAG-MODEL/data")
     parser.add_argument("--index_dir", type=str, default="RAG-MODEL/index")
+    parser.add_argument("--cache_dir", type=str, default="RAG-MODEL/embed_cache")
     parser.add_argument("--rebuild", action="store_true")
     args = parser.parse_args()
 
-    idx = RAGIndex()
+    idx = RAGIndex(cache_dir=args.cache_dir)
     if not os.path.exists(args.index_dir) or args.rebuild:
-        docs = ingest_json_files(args.data_dir)
-        idx.build(docs)
+        idx.build(stream_json_files(args.data_dir))
         idx.save(args.index_dir)
     else:
         idx.load(args.index_dir)
@@ -207,3 +519,5 @@ if __name__ == "__main__":
         print("Answer:", out["answer"])
         for md, score in out["retrieved"]:
             print(f"- {md['id']} (score={score:.3f})")
+        stats = pipeline.answer_cache.stats()
+        print(f"(answer cache: {stats['hits']} hits / {stats['misses']} misses, hit rate {stats['hit_rate']:.0%})")
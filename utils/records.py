@@ -0,0 +1,178 @@
+"""
+Incremental reading and rendering of the JSON / JSONL knowledge files.
+
+``iter_records`` yields ``(key, record)`` pairs without loading a file whole:
+JSONL is read line by line; a JSON file whose top level is an array or an
+object is read in blocks and each element decoded as soon as it is complete
+(``json.JSONDecoder.raw_decode``), so memory holds one record and one read
+block, whatever the file size.
+
+``render_record`` turns a structured record into passage text: question and
+answer first, then the department / faculty / level / semester it belongs
+to, instead of a Python dict repr full of quotes and braces.
+
+``batched`` cuts the resulting passage stream into the groups that are
+embedded and added to the index together:
+
+    INGEST_BATCH   passages per embedding / index-writer batch   (default: 256)
+"""
+
+import json
+import os
+from itertools import islice
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Tuple
+
+JSONL_SUFFIXES = (".jsonl", ".ndjson")
+READ_BLOCK = 1 << 16
+INGEST_BATCH = int(os.getenv("INGEST_BATCH", 256))
+
+# record fields rendered as "Label: value" after the question / answer, in this order
+CONTEXT_FIELDS = (("department", "Department"), ("faculty", "Faculty"), ("level", "Level"),
+                  ("semester", "Semester"), ("topic", "Topic"))
+
+_RENDERED = {"question", "answer"} | {field for field, _ in CONTEXT_FIELDS}
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = "0123456789+-.eE"
+_decoder = json.JSONDecoder()
+
+
+def _iter_jsonl(path: Path) -> Iterator[Tuple[int, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for key, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield key, json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping invalid JSON on line {key + 1} of {path}: {e}")
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class _Reader:
+    """A text buffer over a file that decodes one JSON value at a time, reading more as needed."""
+
+    def __init__(self, f, block: int):
+        self.f = f
+        self.block = block
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        # drop what has been consumed; grow the read when one value spans many blocks
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        chunk = self.f.read(max(self.block, len(self.buf)))
+        self.eof = not chunk
+        self.buf += chunk
+        return bool(chunk)
+
+    def peek(self) -> str:
+        """Next non-whitespace character ("" at end of file), not consumed."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting {char!r}", self.buf, self.pos)
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue  # value cut off at the end of the block
+                raise
+            if _is_number(value) and not self.buf[end:].strip(_NUMBER_CHARS) and self._fill():
+                continue  # "12" / "-7." at the end of the block may be the start of a longer number
+            self.pos = end
+            return value
+
+
+def _iter_json(path: Path, block: int) -> Iterator[Tuple[Any, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        reader = _Reader(f, block)
+        opening = reader.peek()
+        if opening not in ("[", "{"):
+            raise ValueError(f"Unsupported data type in {path}: expected a JSON array or object")
+        closing = "]" if opening == "[" else "}"
+        reader.expect(opening)
+        index = 0
+        while reader.peek() != closing:
+            if index:
+                reader.expect(",")
+            if opening == "[":
+                key = index
+            else:
+                key = reader.value()
+                reader.expect(":")
+            yield key, reader.value()
+            index += 1
+        reader.expect(closing)
+        if reader.peek():
+            raise ValueError(f"Extra data after the top-level JSON value in {path}")
+
+
+def iter_records(path, block: int = READ_BLOCK) -> Iterator[Tuple[Any, Any]]:
+    """``(key, record)`` for each element of a JSON array / object, or each line of a JSONL file.
+
+    Keys are list positions (line numbers, for JSONL) or object keys.
+    Raises ``json.JSONDecodeError`` on malformed JSON and ``ValueError`` on anything but
+    whitespace after the closing bracket, after yielding the records before it.
+    """
+    path = Path(path)
+    if path.suffix.lower() in JSONL_SUFFIXES:
+        return _iter_jsonl(path)
+    return _iter_json(path, block)
+
+
+def _plain(value: Any) -> str:
+    if isinstance(value, (list, tuple)):
+        return ", ".join(_plain(v) for v in value if v not in ("", None))
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value).strip()
+
+
+def render_record(record: Any) -> str:
+    """Passage text of one record: question / answer lines, then its department, level and so on."""
+    if not isinstance(record, dict):
+        return _plain(record)
+    lines = []
+    if record.get("question"):
+        lines.append(f"Question: {_plain(record['question'])}")
+    if record.get("answer"):
+        lines.append(f"Answer: {_plain(record['answer'])}")
+    context = [(label, _plain(record.get(field) or "")) for field, label in CONTEXT_FIELDS]
+    context = [f"{label}: {value}" for label, value in context if value]
+    if context:
+        lines.append(" | ".join(context))
+    # anything else the record carries, one "Field name: value" line each
+    for key, value in record.items():
+        if key in _RENDERED or value in ("", None):
+            continue
+        lines.append(f"{str(key).replace('_', ' ').capitalize()}: {_plain(value)}")
+    return "\n".join(lines)
+
+
+def batched(items: Iterable, size: int = INGEST_BATCH) -> Iterator[List]:
+    """Consecutive lists of ``size`` items (the last may be shorter), drawn lazily from ``items``."""
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
@@ -1,41 +1,84 @@
-import torch
-from sentence_transformers.util import cos_sim
-from utils.embedding import load_model
+import numpy as np
 
-def find_response(user_query, dataset, embeddings, model=None, threshold=0.6):
+from utils.embedding import load_model, embedder_id
+from utils.query_cache import QueryEmbeddingCache, normalize_query
+
+query_cache = QueryEmbeddingCache()
+
+NOT_SURE = "😕 I’m not sure how to answer that."
+
+
+class FAQMatcher:
+    """Nearest-question lookup over the Q&A dataset, built once per dataset.
+
+    Holds the question embeddings as one L2-normalized float32 matrix (so a dot
+    product is the cosine similarity) and a hash map from normalized question
+    text to row, so exact repeats of a known question skip the model. Answers,
+    questions and departments are plain lists; nothing on the per-message path
+    touches pandas.
+    """
+
+    def __init__(self, records, embeddings, model=None, model_name="all-MiniLM-L6-v2", model_loader=None):
+        self.questions = [r.get("question", "") for r in records]
+        self.answers = [r.get("answer", "") for r in records]
+        self.departments = [r.get("department") for r in records]
+        if hasattr(embeddings, "detach"):  # torch tensor from encode(convert_to_tensor=True)
+            embeddings = embeddings.detach().cpu().numpy()
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        # already-normalized (e.g. memory-mapped) matrices are used in place, not copied
+        self.embeddings = matrix if np.allclose(norms, 1.0, atol=1e-3) else matrix / np.maximum(norms, 1e-12)
+        self.model = model
+        self.model_name = model_name
+        self.model_loader = model_loader  # called on first semantic match when no model was given
+        self._exact = {}
+        for i, q in enumerate(self.questions):
+            self._exact.setdefault(normalize_query(q), i)  # first occurrence wins, as the old row filter did
+
+    def __len__(self):
+        return len(self.questions)
+
+    def exact(self, text):
+        """Row of a known question equal to ``text`` up to case and spacing, else None."""
+        return self._exact.get(normalize_query(text))
+
+    def scores(self, query):
+        if self.model is None:
+            self.model = self.model_loader() if self.model_loader else load_model(self.model_name)
+        vec = query_cache.encode(self.model, [query], embedder_id(self.model_name))[0]
+        return self.embeddings @ vec
+
+    def match(self, query, threshold=0.6, top_k=4):
+        """
+        Best answer for ``query`` plus up to ``top_k - 1`` related questions.
+        Returns: response (str), department (str or None), score (float), related_questions (list of str)
+        """
+        scores = self.scores(query)
+        k = min(top_k, len(scores))
+        if k == 0:
+            return NOT_SURE, None, 0.0, []
+        # one partial sort yields both the best row and the related ones
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((top, -scores[top]))]  # ties go to the earlier row, as argmax did
+        best_idx = int(top[0])
+        best_score = float(scores[best_idx])
+        if best_score < threshold:
+            return NOT_SURE, None, best_score, []
+
+        related = []
+        for idx in top[1:]:
+            question = self.questions[idx]
+            if question not in related:
+                related.append(question)
+        return self.answers[best_idx], self.departments[best_idx], best_score, related
+
+
+def find_response(user_query, dataset, embeddings, model=None, threshold=0.6, model_name="all-MiniLM-L6-v2"):
     """
     Find the best matching answer to the user_query using cosine similarity.
     Returns: response (str), department (str or None), score (float), related_questions (list of str)
-    """
 
-    # Load model if not provided
-    if model is None:
-        model = load_model()
-
-    # Encode query
-    query_embedding = model.encode(user_query, convert_to_tensor=True)
-    cosine_scores = cos_sim(query_embedding, embeddings)[0]
-
-    # Get best match
-    best_score = torch.max(cosine_scores).item()
-    best_idx = torch.argmax(cosine_scores).item()
-
-    # If below threshold, return fallback
-    if best_score < threshold:
-        return "😕 I’m not sure how to answer that.", None, best_score, []
-
-    # Retrieve best matching row
-    best_row = dataset.iloc[best_idx]
-    response = best_row["answer"]
-    department = best_row.get("department", None)
-
-    # Get top 4 related (excluding top one)
-    top_k = torch.topk(cosine_scores, k=4)
-    top_related = []
-    for idx in top_k.indices.tolist():
-        if idx != best_idx:
-            question = dataset.iloc[idx]["question"]
-            if question not in top_related:
-                top_related.append(question)
-
-    return response, department, best_score, top_related
+    Builds a throwaway FAQMatcher; keep a matcher around instead when answering more than one query.
+    """
+    records = dataset.to_dict("records") if hasattr(dataset, "to_dict") else dataset
+    return FAQMatcher(records, embeddings, model, model_name).match(user_query, threshold)
@@ -0,0 +1,141 @@
+"""
+Multi-pattern phrase rewriting in one pass over the text.
+
+``PhraseRewriter`` compiles a {phrase: replacement} map into an Aho-Corasick
+automaton once. ``rewrite`` then walks the text a single time, whatever the
+number of phrases, and replaces whole-word matches only ("arch" leaves
+"research" alone); where matches overlap, the leftmost wins, then the longest
+("credit unit" before "unit"). Replacements are not rescanned, so maps that
+swap two words ("course" <-> "subject") are safe.
+
+Used by utils.course_query (slang/pidgin aliases, department names) and
+utils.preprocess (abbreviations, synonyms). Run ``python -m utils.bench normalize``
+to compare it with chained str.replace / per-word dict passes as the maps grow.
+
+The course-code pattern and the file-name slug shared by those modules, BM25
+and the embedding caches live here too, so they are defined once.
+"""
+
+import re
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+
+# "CSC 201", "csc201", "ACC-305": prefix and number groups
+COURSE_CODE_RE = re.compile(r"\b([a-z]{2,4})\s*-?\s*(\d{3})\b", re.IGNORECASE)
+
+
+def slug(name: str) -> str:
+    """``name`` made safe as a file or directory name ("sentence-transformers/x@int8" -> "sentence-transformers_x_int8")."""
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+def _is_token_char(ch: str) -> bool:
+    # whitespace-separated tokens, as str.split() sees them ("a-level" is one word)
+    return not ch.isspace()
+
+
+class PhraseRewriter:
+    """Aho-Corasick automaton over the (lowercase) keys of ``mapping``.
+
+    ``is_word_char`` decides where a word starts and ends: by default letters,
+    digits and underscore, like regex ``\\b``; pass ``whitespace_words=True`` to
+    treat anything between spaces as one word, like ``str.split``.
+    """
+
+    def __init__(self, mapping: Mapping[str, str], whitespace_words: bool = False,
+                 is_word_char: Optional[Callable[[str], bool]] = None):
+        self.mapping: Dict[str, str] = {k.lower(): v for k, v in mapping.items() if k}
+        self.is_word_char = is_word_char or (_is_token_char if whitespace_words else _is_word_char)
+        # node 0 is the root; each node has goto edges, a failure link and the
+        # lengths of the phrases ending there (own match first, then via output links)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        for phrase in self.mapping:
+            node = 0
+            for ch in phrase:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                node = nxt
+            self._out[node] = (len(phrase),)
+        self._link_failures()
+
+    def _link_failures(self):
+        todo = deque(self._goto[0].values())
+        while todo:
+            node = todo.popleft()
+            for ch, nxt in self._goto[node].items():
+                todo.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                # longest first, so the first boundary-valid length at an end position is the longest
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def __len__(self):
+        return len(self.mapping)
+
+    def finditer(self, text: str) -> Iterable[Tuple[int, int, str]]:
+        """Yield ``(start, end, phrase)`` for every whole-word match in lowercase ``text``, by end position."""
+        goto, fail, out, is_word = self._goto, self._fail, self._out, self.is_word_char
+        root = goto[0]
+        node = 0
+        n = len(text)
+        for i, ch in enumerate(text):
+            if not node:
+                # most characters start no phrase: one dict probe and move on
+                node = root.get(ch, 0)
+            else:
+                while node and ch not in goto[node]:
+                    node = fail[node]
+                node = goto[node].get(ch, 0)
+            if not out[node]:
+                continue
+            end = i + 1
+            if end < n and is_word(text[end]):
+                continue
+            for length in out[node]:
+                start = end - length
+                if start == 0 or not is_word(text[start - 1]):
+                    yield start, end, text[start:end]
+
+    def spans(self, text: str) -> List[Tuple[int, int, str]]:
+        """Non-overlapping matches, leftmost then longest, in text order."""
+        best: Dict[int, int] = {}  # start -> longest end
+        for start, end, _ in self.finditer(text):
+            if end > best.get(start, -1):
+                best[start] = end
+        chosen, last_end = [], 0
+        for start in sorted(best):
+            if start >= last_end:
+                chosen.append((start, best[start], text[start:best[start]]))
+                last_end = best[start]
+        return chosen
+
+    def find(self, text: str) -> List[str]:
+        """Replacements of the matched phrases, in text order."""
+        return [self.mapping[phrase] for _, _, phrase in self.spans(text.lower())]
+
+    def rewrite(self, text: str) -> str:
+        """Lowercase ``text`` and replace every matched phrase in one pass."""
+        text = text.lower()
+        parts, pos = [], 0
+        for start, end, phrase in self.spans(text):
+            parts.append(text[pos:start])
+            parts.append(self.mapping[phrase])
+            pos = end
+        if not parts:
+            return text
+        parts.append(text[pos:])
+        return "".join(parts)
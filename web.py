@@ -1,20 +1,18 @@
 import streamlit as st
 import os
 import uuid
-import openai
 from dotenv import load_dotenv
 
-from utils.embedding import load_model, load_dataset, compute_question_embeddings
-from utils.preprocess import preprocess_text
-from utils.search import find_response
+from utils.embedding import load_model, load_records, load_question_embeddings
+from utils.preprocess import preprocess_text, COURSE_DATA_PATH
+from utils.search import FAQMatcher
 from utils.memory import init_memory
 from utils.log_utils import log_query
-from utils.greetings import is_greeting, greeting_responses, is_social_trigger, social_response
-from utils.course_query import extract_course_query  # for extracting level/semester
+from utils.course_query import CourseCatalog, answer_from_catalog
+from utils.intent import intent_router  # greeting detection + level/semester/department in one pass
 
 # --- Load Environment Variables ---
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
 # --- Page Settings ---
 st.set_page_config(page_title="Crescent University Chatbot", page_icon="🎓")
@@ -29,15 +27,30 @@ if "last_department" not in st.session_state:
 
 init_memory()
 
-# --- Load Model & Dataset ---
+# --- OpenAI client, imported only when the GPT-4 fallback is first needed ---
+def get_openai():
+    import openai
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+    return openai
+
+# --- Load Model & Dataset (on first use, not at page load) ---
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "data/embed_cache")
+
+@st.cache_resource
+def load_embedding_model():
+    return load_model()
+
 @st.cache_resource
 def load_bot_resources():
-    model = load_model()
-    data = load_dataset()
-    embeddings = compute_question_embeddings(data["question"].tolist(), model)
-    return model, data, embeddings
+    # question vectors are memory-mapped from disk; the model loads only to re-encode changed data
+    records = load_records()
+    embeddings = load_question_embeddings([r["question"] for r in records], cache_dir=EMBED_CACHE_DIR,
+                                          get_model=load_embedding_model)
+    return FAQMatcher(records, embeddings, model_loader=load_embedding_model)
 
-model, dataset, question_embeddings = load_bot_resources()
+@st.cache_resource
+def load_catalog():
+    return CourseCatalog.load(COURSE_DATA_PATH) if os.path.exists(COURSE_DATA_PATH) else None
 
 # --- Sidebar ---
 with st.sidebar:
@@ -123,13 +136,13 @@ if user_input:
     st.session_state.chat_history.append({"role": "user", "content": user_input})
 
     # ✅ Greeting check
-    if is_greeting(user_input):
-        response = greeting_responses()
+    query_info = intent_router.route(user_input)
+    if query_info["intent"] == "greeting":
+        response = intent_router.reply(query_info)
         st.session_state.chat_history.append({"role": "assistant", "content": response})
         st.rerun()
 
     # --- Extract query info ---
-    query_info = extract_course_query(user_input)
     extracted_level = query_info.get("level")
     extracted_semester = query_info.get("semester")
     extracted_department = query_info.get("department")
@@ -146,35 +159,45 @@ if user_input:
     else:
         cleaned_input = preprocess_text(user_input)
 
-    # --- Try direct match first ---
-    matched_row = dataset[dataset['question'].str.lower() == cleaned_input.lower()]
-    if not matched_row.empty:
-        response = matched_row.iloc[0]['answer']
-        department = extracted_department
-        related = []
-        score = 1.0
+    # --- Course listings and unit questions come straight from the catalog index ---
+    catalog = load_catalog()
+    catalog_answer = answer_from_catalog(catalog, user_input, query_info) if catalog else None
+    if catalog_answer:
+        response, department, related, score = catalog_answer, extracted_department, [], 1.0
     else:
-        response, department, score, related = find_response(cleaned_input, dataset, question_embeddings)
-
-        # --- GPT-4 fallback ---
-        if score < 0.65 or not response.strip():
-            try:
-                gpt_reply = openai.ChatCompletion.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": "system", "content": "You are a helpful assistant for Crescent University. Answer only based on the university's academic programs, departments, and policies."},
-                        {"role": "user", "content": user_input}
-                    ],
-                    temperature=0.7,
-                    max_tokens=300
-                )
-                response = gpt_reply['choices'][0]['message']['content']
-                department = extracted_department
-                related = []
-                response += "\n\n🧠 _This response was generated by GPT-4 fallback._"
-            except Exception as e:
-                response = "⚠️ Sorry, I'm currently unable to fetch a response from GPT-4."
-                print(f"GPT-4 Fallback Error: {e}")
+        matcher = load_bot_resources()
+
+        # --- Try direct match first (hash lookup on the typed and the cleaned question) ---
+        exact_idx = matcher.exact(user_input)
+        if exact_idx is None:
+            exact_idx = matcher.exact(cleaned_input)
+        if exact_idx is not None:
+            response = matcher.answers[exact_idx]
+            department = extracted_department
+            related = []
+            score = 1.0
+        else:
+            response, department, score, related = matcher.match(cleaned_input)
+
+            # --- GPT-4 fallback ---
+            if score < 0.65 or not response.strip():
+                try:
+                    gpt_reply = get_openai().ChatCompletion.create(
+                        model="gpt-4",
+                        messages=[
+                            {"role": "system", "content": "You are a helpful assistant for Crescent University. Answer only based on the university's academic programs, departments, and policies."},
+                            {"role": "user", "content": user_input}
+                        ],
+                        temperature=0.7,
+                        max_tokens=300
+                    )
+                    response = gpt_reply['choices'][0]['message']['content']
+                    department = extracted_department
+                    related = []
+                    response += "\n\n🧠 _This response was generated by GPT-4 fallback._"
+                except Exception as e:
+                    response = "⚠️ Sorry, I'm currently unable to fetch a response from GPT-4."
+                    print(f"GPT-4 Fallback Error: {e}")
 
     # --- Store to memory ---
     st.session_state["last_query_info"] = {
@@ -199,11 +222,11 @@ if st.session_state.related_questions:
     for i, q in enumerate(st.session_state.related_questions):
         if st.button(q, key=f"related_{i}", use_container_width=True):
             st.session_state.chat_history.append({"role": "user", "content": q})
-            response, department, score, related = find_response(q, dataset, question_embeddings)
+            response, department, score, related = load_bot_resources().match(q)
 
             if score < 0.65 or not response.strip():
                 try:
-                    gpt_reply = openai.ChatCompletion.create(
+                    gpt_reply = get_openai().ChatCompletion.create(
                         model="gpt-4",
                         messages=[
                             {"role": "system", "content": "You are a helpful assistant for Crescent University. Answer only based on the university's academic programs, departments, and policies."},
@@ -225,3 +248,7 @@ if st.session_state.related_questions:
             st.session_state.last_department = department
             log_query(q, score)
             st.rerun()
+
+# --- Warm up the model and embeddings once the page is on screen ---
+load_bot_resources()
+load_embedding_model()